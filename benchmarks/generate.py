@@ -0,0 +1,224 @@
+#!/usr/bin/python
+
+"""Generate synthetic snapshots to benchmark the differ
+
+A snapshot is a tree of files with a configurable number of files, depth
+and size distribution. A second snapshot is made from the first one by
+changing, adding and removing a ratio of its files. Both are then packed
+into any of the formats the differ can extract.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import random
+import shutil
+import argparse
+import subprocess
+
+import logging
+logger = logging.getLogger("differ.benchmarks")
+
+# The commands that create an archive of a directory. The archive is
+# created from the parent of the directory so it has a single top level
+# directory like a real snapshot.
+FORMATS = {
+  'tar':     ['tar', 'cf'],
+  'tar.gz':  ['tar', 'czf'],
+  'tgz':     ['tar', 'czf'],
+  'tar.bz2': ['tar', 'cjf'],
+  'tar.xz':  ['tar', 'cJf'],
+  'zip':     ['zip', '-qry'],
+}
+
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf",
+         "hotel", "india", "juliet", "kilo", "lima", "mike", "november"]
+
+def file_size(rand, mean_size, max_size):
+  """Get the size of a file
+
+  The sizes follow a log normal distribution around the mean, which is
+  close to what a real root filesystem looks like: mostly small files and
+  a few big ones.
+
+  :param rand: The random.Random to use
+  :param mean_size: The median size in bytes
+  :param max_size: The largest size in bytes
+  :return: The size in bytes
+  """
+  size = int(rand.lognormvariate(0, 1.2) * mean_size)
+  return max(0, min(size, max_size))
+
+def file_content(rand, size):
+  """Get text content of about a size
+
+  :param rand: The random.Random to use
+  :param size: The size in bytes
+  :return: The content
+  """
+  lines = []
+  total = 0
+  while total < size:
+    line = " ".join(rand.choice(WORDS)
+                    for _ in range(rand.randint(1, 12))) + "\n"
+    lines.append(line)
+    total += len(line)
+  return "".join(lines)[:size]
+
+def generate_tree(dest, files=1000, depth=4, mean_size=4096,
+                  max_size=4 * 1024 * 1024, seed=0):
+  """Generate a tree of files
+
+  :param dest: The directory to create
+  :param files: The number of files
+  :param depth: The maximum depth of the directories
+  :param mean_size: The median size of a file in bytes
+  :param max_size: The largest size of a file in bytes
+  :param seed: The seed so the same tree is generated every time
+  :return: List of the relative paths of the files
+  """
+  rand = random.Random(seed)
+  dirs = [""]
+  paths = []
+  for index in range(files):
+    parent = rand.choice(dirs)
+    if parent.count(os.sep) + 1 < depth and rand.random() < 0.1:
+      parent = os.path.join(parent, "dir{}".format(len(dirs)))
+      dirs.append(parent)
+    path = os.path.join(parent, "file{}".format(index))
+    full = os.path.join(dest, path)
+    if not os.path.exists(os.path.dirname(full)):
+      os.makedirs(os.path.dirname(full))
+    with open(full, "w") as fp:
+      fp.write(file_content(rand, file_size(rand, mean_size, max_size)))
+    paths.append(path)
+  return paths
+
+def mutate_tree(src, dest, change_ratio=0.1, add_ratio=0.02,
+                remove_ratio=0.02, mean_size=4096, seed=1):
+  """Copy a tree and change some of its files
+
+  :param src: The tree to copy
+  :param dest: Where to copy it
+  :param change_ratio: The ratio of the files whose content changes
+  :param add_ratio: The ratio of files to add
+  :param remove_ratio: The ratio of files to remove
+  :param mean_size: The median size of the added files in bytes
+  :param seed: The seed so the same changes are made every time
+  :return: Dictionary of the number of files changed, added and removed
+  """
+  rand = random.Random(seed)
+  shutil.copytree(src, dest)
+  paths = []
+  for root, dirs, files in os.walk(dest):
+    paths.extend(os.path.join(root, name) for name in files)
+  paths.sort()
+  rand.shuffle(paths)
+  removed = int(len(paths) * remove_ratio)
+  changed = int(len(paths) * change_ratio)
+  added = int(len(paths) * add_ratio)
+  for path in paths[:removed]:
+    os.remove(path)
+  for path in paths[removed:removed + changed]:
+    with open(path, "a") as fp:
+      fp.write(file_content(rand, rand.randint(1, 200)))
+  for index in range(added):
+    path = os.path.join(dest, "added", "file{}".format(index))
+    if not os.path.exists(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, "w") as fp:
+      fp.write(file_content(rand, file_size(rand, mean_size, mean_size * 16)))
+  return {'changed': changed, 'added': added, 'removed': removed}
+
+def make_archive(tree, path, fmt):
+  """Pack a tree into an archive
+
+  :param tree: The directory to pack
+  :param path: The archive to create. The extension is added
+  :param fmt: One of FORMATS
+  :return: The path to the archive
+  """
+  path = os.path.abspath("{}.{}".format(path, fmt))
+  cmd = FORMATS[fmt] + [path, os.path.basename(tree)]
+  logger.debug("Running {}".format(" ".join(cmd)))
+  subprocess.check_call(cmd, cwd=os.path.dirname(os.path.abspath(tree)))
+  return path
+
+def generate(dest, formats=None, **kwargs):
+  """Generate a before and after snapshot in every format
+
+  :param dest: The directory to create them in
+  :param formats: The formats to create. Defaults to every format
+  :param kwargs: The options of generate_tree and mutate_tree
+  :return: Dictionary of format to the (before, after) paths. The
+           directories are under the 'dir' format
+  """
+  tree_args = dict((key, kwargs[key]) for key in
+                   ['files', 'depth', 'mean_size', 'max_size', 'seed']
+                   if key in kwargs)
+  mutate_args = dict((key, kwargs[key]) for key in
+                     ['change_ratio', 'add_ratio', 'remove_ratio',
+                      'mean_size']
+                     if key in kwargs)
+  if not os.path.exists(dest):
+    os.makedirs(dest)
+  before = os.path.join(dest, "before")
+  after = os.path.join(dest, "after")
+  generate_tree(before, **tree_args)
+  mutate_tree(before, after, **mutate_args)
+  snapshots = {'dir': (before, after)}
+  for fmt in formats or sorted(FORMATS):
+    snapshots[fmt] = (make_archive(before, before, fmt),
+                      make_archive(after, after, fmt))
+  return snapshots
+
+def add_arguments(parser):
+  """Add the options of the generator to a parser
+
+  :param parser: The argparse parser
+  """
+  parser.add_argument("--files", type=int, default=1000,
+    help="Number of files in a snapshot")
+  parser.add_argument("--depth", type=int, default=4,
+    help="Maximum depth of the directories")
+  parser.add_argument("--mean-size", type=int, default=4096,
+    help="Median size of a file in bytes")
+  parser.add_argument("--max-size", type=int, default=4 * 1024 * 1024,
+    help="Largest size of a file in bytes")
+  parser.add_argument("--change-ratio", type=float, default=0.1,
+    help="Ratio of the files that change between the snapshots")
+  parser.add_argument("--add-ratio", type=float, default=0.02,
+    help="Ratio of the files added to the second snapshot")
+  parser.add_argument("--remove-ratio", type=float, default=0.02,
+    help="Ratio of the files removed from the second snapshot")
+  parser.add_argument("--seed", type=int, default=0,
+    help="Seed of the random generator")
+  parser.add_argument("--formats", nargs="+", choices=sorted(FORMATS),
+    help="Formats to generate. Defaults to every format")
+
+def generator_kwargs(args):
+  """Get the generate() arguments from parsed options
+
+  :param args: The parsed options
+  :return: Dictionary of the arguments
+  """
+  return {
+    'formats': args.formats,
+    'files': args.files,
+    'depth': args.depth,
+    'mean_size': args.mean_size,
+    'max_size': args.max_size,
+    'seed': args.seed,
+    'change_ratio': args.change_ratio,
+    'add_ratio': args.add_ratio,
+    'remove_ratio': args.remove_ratio,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+  parser.add_argument("dest", help="Directory to create the snapshots in")
+  add_arguments(parser)
+  args = parser.parse_args()
+  for fmt, paths in sorted(generate(args.dest,
+                                    **generator_kwargs(args)).items()):
+    print("{}: {} {}".format(fmt, *paths))
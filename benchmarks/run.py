@@ -0,0 +1,193 @@
+#!/usr/bin/python
+
+"""Benchmark the differ on synthetic snapshots
+
+The snapshots are generated once in every format and the differ is run on
+each format a number of times. The wall time of Differ.start() and the
+time of each of its phases are saved as JSON so the results of different
+releases can be compared.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import differ
+import generate
+
+RESULTS_VERSION = 1
+
+def median(values):
+  values = sorted(values)
+  middle = len(values) // 2
+  if len(values) % 2:
+    return values[middle]
+  return (values[middle - 1] + values[middle]) / 2.0
+
+def run_once(before, after, work_dir, **kwargs):
+  """Run the differ once
+
+  :param before: The snapshot to compare from
+  :param after: The snapshot to compare against
+  :param work_dir: Where the output of the differ is written
+  :param kwargs: The options of the Differ
+  :return: Tuple of the wall time and the Metrics of the run
+  """
+  if os.path.exists(work_dir):
+    shutil.rmtree(work_dir)
+  with open(os.devnull, "w") as devnull:
+    obj = differ.utils.Differ(before, after, base=work_dir,
+                              report=differ.report.TextReport(devnull),
+                              **kwargs)
+    start = time.time()
+    obj.start()
+    wall = time.time() - start
+  shutil.rmtree(work_dir)
+  return wall, obj.metrics
+
+def run_format(before, after, work_dir, repeat=3, **kwargs):
+  """Benchmark one format
+
+  :param before: The snapshot to compare from
+  :param after: The snapshot to compare against
+  :param work_dir: Where the output of the differ is written
+  :param repeat: The number of runs
+  :param kwargs: The options of the Differ
+  :return: Dictionary of the results
+  """
+  walls = []
+  phases = {}
+  counters = {}
+  for _ in range(repeat):
+    wall, metrics = run_once(before, after, work_dir, **kwargs)
+    walls.append(wall)
+    counters = metrics.counters
+    for name, seconds in metrics.timings.items():
+      phases.setdefault(name, []).append(seconds)
+  return {
+    'wall': walls,
+    'min': min(walls),
+    'median': median(walls),
+    'phases': dict((name, median(values)) for name, values in phases.items()),
+    'counters': counters,
+  }
+
+def result_name(fmt, jobs, all_jobs):
+  """Get the name the results of a run are saved under
+
+  :param fmt: The format of the snapshots
+  :param jobs: The number of jobs of the run
+  :param all_jobs: Every number of jobs that is benchmarked
+  :return: The format alone when a single number of jobs is benchmarked
+  """
+  if len(all_jobs) == 1:
+    return fmt
+  return "{} -j{}".format(fmt, jobs)
+
+def compare(results, baseline):
+  """Print how the results compare with the results of a baseline
+
+  :param results: The results of this run
+  :param baseline: The results of an earlier run
+  """
+  for fmt, result in sorted(results['results'].items()):
+    old = baseline.get('results', {}).get(fmt)
+    if not old or not old['median']:
+      continue
+    ratio = result['median'] / old['median']
+    print("{:8} {:8.3f}s -> {:8.3f}s x{:.2f}{}".format(
+      fmt,
+      old['median'],
+      result['median'],
+      ratio,
+      " REGRESSION" if ratio > 1.1 else ""))
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+  generate.add_arguments(parser)
+  parser.add_argument("--repeat", type=int, default=3,
+    help="Number of runs of each format")
+  parser.add_argument("-j", "--jobs", type=int, nargs="+", default=[1],
+    help="Number of paths to compare at the same time. With more than one "
+         "number every format is run with each of them and the speedup "
+         "over the first one is shown")
+  parser.add_argument("--stream", action="store_true",
+    help="Read archives member by member")
+  parser.add_argument("--pipeline", action="store_true",
+    help="Compare archive members while they are being extracted")
+  parser.add_argument("--output",
+    help="JSON file to write the results to. Defaults to "
+         "benchmarks/results/<date>.json")
+  parser.add_argument("--baseline",
+    help="JSON results of an earlier run to compare against")
+  parser.add_argument("--work-dir",
+    help="Where to generate the snapshots. Defaults to a temporary "
+         "directory that is removed afterwards")
+  args = parser.parse_args()
+
+  work_dir = args.work_dir or tempfile.mkdtemp(prefix="differ_bench.")
+  try:
+    kwargs = generate.generator_kwargs(args)
+    start = time.time()
+    snapshots = generate.generate(os.path.join(work_dir, "snapshots"),
+                                  **kwargs)
+    print("Generated snapshots in {:.2f}s".format(time.time() - start))
+
+    results = {
+      'version': RESULTS_VERSION,
+      'created': datetime.datetime.now().isoformat(),
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'config': dict(kwargs, repeat=args.repeat, jobs=args.jobs,
+                     stream=args.stream, pipeline=args.pipeline),
+      'results': {},
+    }
+    for fmt, (before, after) in sorted(snapshots.items()):
+      first = None
+      for jobs in args.jobs:
+        result = run_format(before, after, os.path.join(work_dir, "output"),
+                            repeat=args.repeat,
+                            jobs=jobs,
+                            stream=args.stream,
+                            pipeline=args.pipeline)
+        name = result_name(fmt, jobs, args.jobs)
+        results['results'][name] = result
+        first = first or result
+        speedup = ""
+        if len(args.jobs) > 1 and result['median']:
+          speedup = " x{:.2f}".format(first['median'] / result['median'])
+        print("{:8} median {:8.3f}s min {:8.3f}s{} {}".format(
+          name,
+          result['median'],
+          result['min'],
+          speedup,
+          " ".join("{}={:.3f}".format(phase, seconds)
+                   for phase, seconds in sorted(result['phases'].items()))))
+  finally:
+    if not args.work_dir:
+      shutil.rmtree(work_dir, ignore_errors=True)
+
+  output = args.output
+  if not output:
+    results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "results")
+    if not os.path.exists(results_dir):
+      os.makedirs(results_dir)
+    output = os.path.join(results_dir, "{}.json".format(
+      datetime.datetime.now().strftime("%Y%m%d_%H%M%S")))
+  with open(output, "w") as fp:
+    json.dump(results, fp, indent=2, sort_keys=True)
+  print("Results written to {}".format(output))
+
+  if args.baseline:
+    with open(args.baseline) as fp:
+      compare(results, json.load(fp))
@@ -0,0 +1,819 @@
+import os
+import stat
+import posixpath
+import signal
+import shutil
+import tarfile
+import zipfile
+import subprocess
+import logging
+logger = logging.getLogger('differ.archive')
+
+from digest import digest_fileobj
+from metrics import Metrics
+
+# Archive extensions which can be read without extracting to disk
+ARCHIVE_TYPES = {
+  '.tar':     'tar',
+  '.tar.gz':  'tar',
+  '.tgz':     'tar',
+  '.tar.bz2': 'tar',
+  '.tar.xz':  'tar',
+  '.zip':     'zip',
+}
+
+# Map the tar member types to the os.stat file type bits
+TAR_TYPES = {
+  tarfile.REGTYPE:  stat.S_IFREG,
+  tarfile.AREGTYPE: stat.S_IFREG,
+  tarfile.LNKTYPE:  stat.S_IFREG,
+  tarfile.SYMTYPE:  stat.S_IFLNK,
+  tarfile.CHRTYPE:  stat.S_IFCHR,
+  tarfile.BLKTYPE:  stat.S_IFBLK,
+  tarfile.FIFOTYPE: stat.S_IFIFO,
+}
+
+# Compressions that tarfile can not read on its own are piped through the
+# decompressor found on the host instead
+try:
+  import lzma
+except ImportError:
+  lzma = None
+PIPE_DECOMPRESSORS = {}
+if lzma is None:
+  PIPE_DECOMPRESSORS['.tar.xz'] = ['xz', '-dc']
+
+# Multi threaded decompressors that are used instead of the single threaded
+# ones when they are on the host
+PARALLEL_DECOMPRESSORS = {
+  '.tar.gz':  ['pigz'],
+  '.tgz':     ['pigz'],
+  '.tar.bz2': ['pbzip2'],
+  '.tar.xz':  ['xz', '-T0'],
+}
+
+_programs = {}
+
+def find_program(name):
+  """Find a program in the PATH
+
+  :param name: The name of the program
+  :return: The full path to the program or None if it is not found
+  """
+  if name not in _programs:
+    found = None
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+      path = os.path.join(directory, name)
+      if os.path.isfile(path) and os.access(path, os.X_OK):
+        found = path
+        break
+    _programs[name] = found
+  return _programs[name]
+
+def parallel_decompressor(path):
+  """Get the multi threaded decompressor for a compressed tar file
+
+  :param path: The path of the tar file
+  :return: The command as a list or None if there is none on the host
+  """
+  for exten, cmd in PARALLEL_DECOMPRESSORS.items():
+    if path.endswith(exten) and find_program(cmd[0]):
+      return cmd
+  return None
+
+def pipe_decompressor(path):
+  """Get the command to pipe a tar file through before reading it
+
+  :param path: The path of the tar file
+  :return: The command as a list that writes the tar to stdout or None if
+           tarfile should read the file itself
+  """
+  cmd = parallel_decompressor(path)
+  if cmd is not None:
+    return cmd + ['-dc']
+  for exten, cmd in PIPE_DECOMPRESSORS.items():
+    if path.endswith(exten):
+      return cmd
+  return None
+
+def archive_type(path):
+  """Get the type of archive based on the path name
+
+  :param path: The path to check
+  :return: 'tar', 'zip' or None if the path is not a known archive
+  """
+  if not path:
+    return None
+  for exten, kind in ARCHIVE_TYPES.items():
+    if path.endswith(exten):
+      return kind
+  return None
+
+def link_target(name, linkname):
+  """Get the name of the member a symlink points to
+
+  :param name: The (stripped) name of the symlink
+  :param linkname: Where the symlink points to
+  :return: The name of the member or None when the symlink points outside
+           of the archive
+  """
+  if not linkname or linkname.startswith('/'):
+    return None
+  target = posixpath.normpath(posixpath.join(posixpath.dirname(name),
+                                             linkname))
+  if target == '.' or target.split('/')[0] == '..':
+    return None
+  return target
+
+def with_link_targets(names, members):
+  """Add the members that the symlinks among names point to
+
+  A followed symlink is compared by the stat and content of its target so
+  the target has to be extracted along with it. Symlinks to symlinks are
+  followed until a member that is not a symlink.
+
+  :param names: The (stripped) names of the members to extract
+  :param members: Dictionary of member name to Member
+  :return: Set of the names and the names of the targets
+  """
+  result = set(names)
+  pending = list(result)
+  while pending:
+    member = members.get(pending.pop())
+    if member is None or not stat.S_ISLNK(member.mode):
+      continue
+    target = link_target(member.name, member.linkname)
+    if target in members and target not in result:
+      result.add(target)
+      pending.append(target)
+  return result
+
+def dir_links(members):
+  """Find the symlinks that point to a directory of the archive
+
+  A followed symlink to a directory is not a path of its own, the same way
+  walk() skips it, and what is under it is reached through its own member.
+
+  :param members: Dictionary of member name to Member
+  :return: Set of the names of the symlinks
+  """
+  dirs = set()
+  for name in members:
+    parts = name.split('/')
+    for index in range(1, len(parts)):
+      dirs.add('/'.join(parts[:index]))
+  result = set()
+  for name, member in members.items():
+    seen = set()
+    target = name
+    while (target in members and stat.S_ISLNK(members[target].mode) and
+           target not in seen):
+      seen.add(target)
+      target = link_target(target, members[target].linkname)
+    if target != name and target in dirs:
+      result.add(name)
+  return result
+
+def check_destination(root, name, symlink=False, hardlink=None):
+  """Make sure a member is only written under the directory extracted into
+
+  The directories above the member may be symlinks that were extracted
+  before it. A symlink itself is created where it is named so only the
+  directory it is created in is checked.
+
+  :param root: The real path of the directory extracted into
+  :param name: The name the member is extracted as
+  :param symlink: Whether the member is a symlink
+  :param hardlink: The name of the member a hard link points to
+  :raises IOError: When the member or the target of its hard link is
+                   outside of the root
+  """
+  path = os.path.join(root, name)
+  paths = [os.path.dirname(path) if symlink else path]
+  if hardlink is not None:
+    paths.append(os.path.join(root, hardlink))
+  for path in paths:
+    real = os.path.realpath(path)
+    if real != root and not real.startswith(root + os.sep):
+      raise IOError("Refusing to extract {}: {} is outside of {}".format(
+        name,
+        real,
+        root))
+
+class Member(object):
+  """A single non directory entry of an archive"""
+  def __init__(self, name, size, mode, digest=None, linkname=None):
+    self.name = name
+    self.size = size
+    self.mode = mode
+    self.digest = digest
+    # Where a symlink points to or the name of the member a hard link is
+    # to once the names are stripped
+    self.linkname = linkname
+
+  def __repr__(self):
+    return "name={} size={} mode={} digest={}".format(
+      self.name,
+      self.size,
+      oct(self.mode),
+      self.digest)
+
+  def is_regular(self):
+    return stat.S_ISREG(self.mode)
+
+  def same(self, other):
+    """Check whether the member has the same content and stat as another
+
+    Only regular files can be proven to be the same. Anything else has
+    to be extracted and compared on disk.
+
+    :param other: The member to compare against
+    :return: True if the members are identical, False otherwise
+    """
+    if not other or not self.is_regular() or not other.is_regular():
+      return False
+    if self.digest is None or other.digest is None:
+      return False
+    return (self.size == other.size and
+            self.mode == other.mode and
+            self.digest == other.digest)
+
+class Archive(object):
+  """Read an archive member by member without extracting it
+
+  When every member lives under a single top level directory, that
+  directory is stripped from the member names. This matches what the
+  differ does when it extracts an archive and moves the top level
+  directory into place.
+  """
+  def __init__(self, path, metrics=None, fileobj=None, path_filter=None):
+    """Initialize the archive
+
+    :param path: The path to the archive
+    :param metrics: The Metrics the reads are counted in
+    :param fileobj: A seekable file object to read the archive from instead
+                    of the path, like an archive inside of another one. The
+                    path is then only used for its name
+    :param path_filter: The PathFilter of the members to keep. The other
+                        members are neither read nor extracted
+    """
+    self.path = path
+    self.metrics = metrics or Metrics()
+    self.fileobj = fileobj
+    self.path_filter = path_filter
+    self.kind = archive_type(path)
+    self.prefix = ''
+    self.links = {}
+    self.valid = bool(self.kind) and (fileobj is not None or
+                                      os.path.isfile(path))
+
+  def __repr__(self):
+    return "{} ({})".format(self.path, self.kind)
+
+  def _open_tar(self):
+    """Open the tar file as a stream
+
+    The tar file is opened as a stream so that compressed archives are
+    read sequentially and never seeked.
+
+    :return: Tuple of the tarfile and the decompressor process (or None)
+    """
+    if self.fileobj is not None:
+      self.fileobj.seek(0)
+      return tarfile.open(fileobj=self.fileobj, mode='r|*'), None
+    cmd = pipe_decompressor(self.path)
+    if cmd is not None:
+      self.metrics.count('subprocesses')
+      # Python ignores SIGPIPE and its children inherit that. The default
+      # lets the decompressor end quietly when the reading stops early
+      proc = subprocess.Popen(cmd + [self.path], stdout=subprocess.PIPE,
+        preexec_fn=lambda: signal.signal(signal.SIGPIPE, signal.SIG_DFL))
+      try:
+        return tarfile.open(fileobj=proc.stdout, mode='r|'), proc
+      except Exception:
+        self._wait(proc)
+        raise
+    return tarfile.open(self.path, 'r|*'), None
+
+  def _open_zip(self):
+    if self.fileobj is not None:
+      self.fileobj.seek(0)
+      return zipfile.ZipFile(self.fileobj)
+    return zipfile.ZipFile(self.path)
+
+  def _close_tar(self, tf, proc):
+    """Close a tar file opened by _open_tar()
+
+    :param tf: The tarfile
+    :param proc: The decompressor process or None
+    :raises IOError: When the decompressor failed. The end of its output
+                     may look like the end of the tar file so the members
+                     read may not be all of them
+    """
+    tf.close()
+    if proc is not None:
+      self._wait(proc)
+
+  def _wait(self, proc):
+    """Wait for the decompressor once its output is no longer read
+
+    :param proc: The decompressor process
+    :raises IOError: When it failed for another reason than its output
+                     being closed
+    """
+    proc.stdout.close()
+    ret = proc.wait()
+    if ret not in (0, -signal.SIGPIPE):
+      raise IOError("Failed to decompress {}: exit status {}".format(
+        self.path,
+        ret))
+
+  def _iter_tar(self):
+    """Iterate over the members of a tar file
+
+    :return: Generator of (name, mode, size, linkname, fileobj)
+    """
+    tf, proc = self._open_tar()
+    try:
+      for info in tf:
+        if info.isdir():
+          yield info.name, stat.S_IFDIR | info.mode, 0, None, None
+          continue
+        mode = TAR_TYPES.get(info.type, stat.S_IFREG) | info.mode
+        if info.islnk():
+          yield info.name, mode, 0, info.linkname, None
+        elif info.isfile():
+          yield info.name, mode, info.size, None, tf.extractfile(info)
+        else:
+          yield info.name, mode, 0, info.linkname, None
+    finally:
+      self._close_tar(tf, proc)
+
+  def _iter_zip(self):
+    """Iterate over the members of a zip file
+
+    :return: Generator of (name, mode, size, linkname, fileobj)
+    """
+    zf = self._open_zip()
+    try:
+      for info in zf.infolist():
+        name = info.filename
+        mode = info.external_attr >> 16
+        if name.endswith('/'):
+          yield name.rstrip('/'), stat.S_IFDIR | 0755, 0, None, None
+          continue
+        if not mode:
+          mode = stat.S_IFREG | 0644
+        elif not stat.S_IFMT(mode):
+          # Only the permissions are set by some zip writers
+          mode |= stat.S_IFREG
+        if stat.S_ISLNK(mode):
+          # The content of a symlink is where it points to
+          yield name, mode, 0, zf.read(info), None
+          continue
+        fp = zf.open(info)
+        try:
+          yield name, mode, info.file_size, None, fp
+        finally:
+          fp.close()
+    finally:
+      zf.close()
+
+  def _iter(self):
+    if self.kind == 'tar':
+      return self._iter_tar()
+    return self._iter_zip()
+
+  def _name(self, name):
+    """Convert a raw member name into the name used for comparison
+
+    :param name: The name of the member in the archive
+    :return: The stripped name or None if the member should be ignored
+    """
+    name = name.lstrip('/')
+    if self.prefix:
+      if not name.startswith(self.prefix):
+        return None
+      name = name[len(self.prefix):]
+    if not name or '..' in name.split('/'):
+      return None
+    return name
+
+  def keep(self, name):
+    """Check whether a member is kept by the filter
+
+    :param name: The (stripped) name of the member
+    :return: True if the member is kept, False if it is skipped
+    """
+    if not self.path_filter or self.path_filter.keep(name):
+      return True
+    self.metrics.count('members_skipped')
+    return False
+
+  def scan(self):
+    """Read every member of the archive and compute its digest
+
+    :return: Dictionary of member name to Member. None on error
+    """
+    if not self.valid:
+      logger.error("{} is not a readable archive".format(self.path))
+      return None
+    members = {}
+    tops = set()
+    top_file = False
+    try:
+      for name, mode, size, linkname, fp in self._iter():
+        name = name.strip('/')
+        tops.add(name.split('/')[0])
+        if stat.S_ISDIR(mode):
+          continue
+        top_file = top_file or '/' not in name
+        if not self._maybe_keep(name, len(tops) == 1):
+          continue
+        digest = None
+        if fp is not None:
+          digest = digest_fileobj(fp)
+          self.metrics.count('bytes_scanned', size)
+        elif linkname is not None and stat.S_ISREG(mode):
+          # Hard links have the content of the member they point to
+          target = members.get(linkname.lstrip('/'))
+          if target:
+            size = target.size
+            digest = target.digest
+          self.links[name] = linkname.lstrip('/')
+        members[name] = Member(name, size, mode, digest,
+                               linkname if stat.S_ISLNK(mode) else None)
+    except (tarfile.TarError, zipfile.BadZipfile, IOError, OSError,
+            EOFError) as exc:
+      logger.error("Failed to read {}: {}".format(self.path, exc))
+      return None
+
+    # A single top level directory is not part of the compared names
+    if len(tops) == 1 and not top_file:
+      self.prefix = list(tops)[0] + '/'
+
+    result = {}
+    for member in members.values():
+      name = self._name(member.name)
+      if name is None:
+        logger.debug("{}: skipping member {}".format(self.path, member.name))
+        continue
+      if self.path_filter and not self.keep(name):
+        continue
+      if member.name in self.links:
+        member.linkname = self._name(self.links[member.name])
+      member.name = name
+      result[name] = member
+    return result
+
+  def _maybe_keep(self, name, single_top):
+    """Check whether a member may be kept while the prefix is not known
+
+    The top level directory is only known to be stripped once the whole
+    archive is read. As long as every member is under the same top level
+    directory the member is read when the filter keeps it with or without
+    that directory, and scan() checks its final name at the end. Once there
+    is more than one top level directory nothing is stripped.
+
+    :param name: The full name of the member
+    :param single_top: Whether every member so far is under the same top
+                       level directory
+    :return: True if the member may be kept, False if it is skipped
+    """
+    if not self.path_filter:
+      return True
+    names = [name]
+    if single_top and '/' in name:
+      names.append(name.split('/', 1)[1])
+    if any(self.path_filter.keep(candidate) for candidate in names):
+      return True
+    self.metrics.count('members_skipped')
+    return False
+
+  def read(self, names):
+    """Read the content of members into memory
+
+    Only the members requested are kept. A hard link gets the content of
+    the member it points to.
+
+    :param names: The (stripped) member names to read
+    :return: Dictionary of member name to its content. None on error
+    """
+    names = set(names)
+    targets = {}
+    for name, target in self.links.items():
+      if self._name(name) in names and self._name(target):
+        targets.setdefault(self._name(target), []).append(self._name(name))
+    result = {}
+    try:
+      for name, mode, size, linkname, fp in self._iter():
+        name = self._name(name.strip('/'))
+        if fp is None or (name not in names and name not in targets):
+          continue
+        data = fp.read()
+        self.metrics.count('bytes_scanned', len(data))
+        for found in [name] + targets.get(name, []):
+          if found in names:
+            result[found] = data
+    except (tarfile.TarError, zipfile.BadZipfile, IOError, OSError,
+            EOFError) as exc:
+      logger.error("Failed to read {}: {}".format(self.path, exc))
+      return None
+    return result
+
+  def extract(self, names, dest):
+    """Extract only the members requested into the destination
+
+    :param names: The (stripped) member names to extract
+    :param dest: The directory to extract into
+    :return: True on success, False otherwise
+    """
+    if not os.path.exists(dest):
+      os.makedirs(dest)
+    names = set(names)
+    # Hard links can only be created if their target is extracted too
+    for name, target in self.links.items():
+      if self._name(name) in names and self._name(target):
+        names.add(self._name(target))
+    if not names:
+      return True
+    logger.debug("{}: extracting {} members into {}".format(
+      self.path,
+      len(names),
+      dest))
+    self.metrics.count('members_extracted', len(names))
+    try:
+      with self.metrics.timer('extract'):
+        if self.kind == 'tar':
+          self._extract_tar(names, dest)
+        else:
+          self._extract_zip(names, dest)
+    except (tarfile.TarError, zipfile.BadZipfile, IOError, OSError) as exc:
+      logger.error("Failed to extract {}: {}".format(self.path, exc))
+      return False
+    return True
+
+  def extract_kept(self, dest):
+    """Extract every member the filter may keep with its full name
+
+    The archive is laid out like a full extraction but the members that are
+    excluded are skipped without being written, see iter_extract(). The
+    prefix is set once the archive is read.
+
+    :param dest: The directory to extract into
+    :return: True on success, False otherwise
+    """
+    try:
+      for _ in self.iter_extract(dest):
+        pass
+    except (tarfile.TarError, zipfile.BadZipfile, IOError, OSError,
+            EOFError) as exc:
+      logger.error("Failed to extract {}: {}".format(self.path, exc))
+      return False
+    return True
+
+  def _extract_tar(self, names, dest):
+    root = os.path.realpath(dest)
+    tf, proc = self._open_tar()
+    try:
+      for info in tf:
+        name = self._name(info.name)
+        if name not in names:
+          continue
+        info.name = name
+        if info.islnk():
+          info.linkname = self._name(info.linkname)
+          if info.linkname is None:
+            raise IOError("Refusing to extract {}: it links outside of "
+                          "the archive".format(name))
+        self._extract_tar_member(tf, info, root)
+    finally:
+      self._close_tar(tf, proc)
+
+  def _extract_tar_member(self, tf, info, root):
+    """Extract a member of a tar file once its names are converted
+
+    :param tf: The tarfile
+    :param info: The TarInfo of the member
+    :param root: The real path of the directory to extract into
+    :raises IOError: When the member would be written outside of the root
+    """
+    check_destination(root, info.name, info.issym(),
+                      info.linkname if info.islnk() else None)
+    tf.extract(info, root)
+
+  def _extract_zip(self, names, dest):
+    root = os.path.realpath(dest)
+    zf = self._open_zip()
+    try:
+      for info in zf.infolist():
+        name = self._name(info.filename.rstrip('/'))
+        if name not in names:
+          continue
+        self._extract_zip_member(zf, info, name, root)
+    finally:
+      zf.close()
+
+  def _extract_zip_member(self, zf, info, name, root):
+    """Extract a member of a zip file
+
+    :param zf: The ZipFile
+    :param info: The ZipInfo of the member
+    :param name: The name to extract the member as
+    :param root: The real path of the directory to extract into
+    :raises IOError: When the member would be written outside of the root
+    """
+    mode = info.external_attr >> 16
+    check_destination(root, name, stat.S_ISLNK(mode))
+    target = os.path.join(root, name)
+    if not os.path.exists(os.path.dirname(target)):
+      os.makedirs(os.path.dirname(target))
+    if stat.S_ISLNK(mode):
+      os.symlink(zf.read(info), target)
+      return
+    src = zf.open(info)
+    try:
+      with open(target, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    finally:
+      src.close()
+    if mode:
+      os.chmod(target, stat.S_IMODE(mode))
+
+  def final_name(self, name):
+    """Convert the full name of an extracted member once the prefix is known
+
+    :param name: The name the member was extracted with
+    :return: The name used for comparison or None if the member is not
+             compared
+    """
+    name = self._name(name)
+    if name is None or not self.keep(name):
+      return None
+    return name
+
+  def iter_extract(self, dest):
+    """Extract the members one at a time as the archive is read
+
+    The top level directory is only known to be stripped once the whole
+    archive is read, so the members are extracted with their full names and
+    a member is extracted when the filter keeps it with or without that
+    directory. final_name() gives the name a member is compared by once the
+    prefix is known: at the start for a zip file, once the generator is
+    done or from the headers read by iter_links() for a tar file.
+
+    :param dest: The directory to extract into
+    :return: Generator of the full names of the members that are not
+             directories, each one once it is extracted
+    """
+    if not os.path.exists(dest):
+      os.makedirs(dest)
+    if self.kind == 'tar':
+      return self._iter_extract_tar(dest)
+    return self._iter_extract_zip(dest)
+
+  def _iter_extract_tar(self, dest):
+    root = os.path.realpath(dest)
+    tops = set()
+    top_file = False
+    extracted = set()
+    tf, proc = self._open_tar()
+    try:
+      for info in tf:
+        name = info.name.strip('/')
+        tops.add(name.split('/')[0])
+        if info.isdir():
+          continue
+        top_file = top_file or '/' not in name
+        if not name or '..' in name.split('/'):
+          logger.debug("{}: skipping member {}".format(self.path, name))
+          continue
+        if not self._maybe_keep(name, len(tops) == 1):
+          continue
+        info.name = name
+        if info.islnk():
+          info.linkname = info.linkname.strip('/')
+          if info.linkname not in extracted:
+            # The content of the link is only in the member it points to
+            logger.error("{}: skipping {} since {} is excluded".format(
+              self.path,
+              name,
+              info.linkname))
+            continue
+          self.links[name] = info.linkname
+        with self.metrics.timer('extract'):
+          self._extract_tar_member(tf, info, root)
+        extracted.add(name)
+        self.metrics.count('members_extracted')
+        yield name
+    finally:
+      self._close_tar(tf, proc)
+    if len(tops) == 1 and not top_file:
+      self.prefix = list(tops)[0] + '/'
+
+  def iter_links(self, symlinks=False):
+    """Read the headers of an archive to find its links
+
+    Every header is read before the first link is handed back so the prefix
+    is set the same way scan() sets it. The names are converted and
+    filtered the same way final_name() converts them.
+
+    :param symlinks: Also find the symlinks that point to a member
+    :return: Generator of the (stripped) name of each link, the name of the
+             member it points to and whether it is a symlink
+    """
+    if self.kind != 'tar':
+      if symlinks:
+        for link in self._iter_zip_symlinks():
+          yield link
+      else:
+        zf = self._open_zip()
+        try:
+          self._zip_prefix(zf)
+        finally:
+          zf.close()
+      return
+    links = []
+    tops = set()
+    top_file = False
+    tf, proc = self._open_tar()
+    try:
+      for info in tf:
+        name = info.name.strip('/')
+        tops.add(name.split('/')[0])
+        if info.isdir():
+          continue
+        top_file = top_file or '/' not in name
+        if info.islnk() or symlinks and info.issym():
+          links.append((name, info.linkname, info.issym()))
+    finally:
+      self._close_tar(tf, proc)
+    if len(tops) == 1 and not top_file:
+      self.prefix = list(tops)[0] + '/'
+
+    for name, linkname, symlink in links:
+      name = self._name(name)
+      if name is None:
+        continue
+      if self.path_filter and not self.path_filter.keep(name):
+        continue
+      if symlink:
+        target = link_target(name, linkname)
+      else:
+        target = self._name(linkname)
+      if target is not None:
+        yield name, target, symlink
+
+  def _zip_prefix(self, zf):
+    """Find the top level directory of a zip file
+
+    The whole list of members is known up front for a zip file.
+
+    :param zf: The ZipFile
+    """
+    names = [info.filename.strip('/') for info in zf.infolist()
+             if not info.filename.endswith('/')]
+    tops = set(name.split('/')[0] for name in names)
+    if len(tops) == 1 and list(tops)[0] not in names:
+      self.prefix = list(tops)[0] + '/'
+
+  def _iter_zip_symlinks(self):
+    """Read the symlinks of a zip file
+
+    :return: Generator of the (stripped) name of each symlink, the name of
+             the member it points to and True
+    """
+    zf = self._open_zip()
+    try:
+      self._zip_prefix(zf)
+      for info in zf.infolist():
+        if not stat.S_ISLNK(info.external_attr >> 16):
+          continue
+        name = self._name(info.filename)
+        if name is None or (self.path_filter and
+                            not self.path_filter.keep(name)):
+          continue
+        target = link_target(name, zf.read(info))
+        if target is not None:
+          yield name, target, True
+    finally:
+      zf.close()
+
+  def _iter_extract_zip(self, dest):
+    root = os.path.realpath(dest)
+    zf = self._open_zip()
+    try:
+      self._zip_prefix(zf)
+      for info in zf.infolist():
+        if info.filename.endswith('/'):
+          continue
+        name = self._name(info.filename)
+        if name is None or not self.keep(name):
+          continue
+        full_name = info.filename.strip('/')
+        with self.metrics.timer('extract'):
+          self._extract_zip_member(zf, info, full_name, root)
+        self.metrics.count('members_extracted')
+        yield full_name
+    finally:
+      zf.close()
@@ -0,0 +1,174 @@
+import os
+import mmap
+import contextlib
+import logging
+logger = logging.getLogger('differ.bindiff')
+
+# How much of a file is checked for a NUL byte to tell if it is binary
+BINARY_CHECK_SIZE = 8192
+
+# The size of the blocks that are compared and counted
+BLOCK_SIZE = 4096
+
+# The most ranges written into a .bindiff
+MAX_RANGES = 1024
+
+def is_binary(path):
+  """Check whether a file is binary the way diff does
+
+  :param path: The file to check
+  :return: True if the start of the file has a NUL byte
+  """
+  try:
+    with open(path, 'rb') as fp:
+      return is_binary_data(fp.read(BINARY_CHECK_SIZE))
+  except (IOError, OSError) as exc:
+    logger.debug("Unable to read {}: {}".format(path, exc))
+    return False
+
+def is_binary_data(data):
+  """Check whether content held in memory is binary
+
+  :param data: The content to check
+  :return: True if the start of the content has a NUL byte
+  """
+  return b"\0" in data[:BINARY_CHECK_SIZE]
+
+@contextlib.contextmanager
+def mapped(path):
+  """Map a file into memory
+
+  :param path: The file to map
+  :return: The mmap object or an empty string for an empty file
+  """
+  with open(path, 'rb') as fp:
+    if not os.fstat(fp.fileno()).st_size:
+      yield b""
+      return
+    data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      yield data
+    finally:
+      data.close()
+
+def first_byte(data1, data2, start, stop):
+  """Get the offset of the first byte that differs in a range"""
+  for offset in range(start, stop):
+    if data1[offset] != data2[offset]:
+      return offset
+  return None
+
+def last_byte(data1, data2, start, stop):
+  """Get the offset after the last byte that differs in a range"""
+  for offset in range(stop - 1, start - 1, -1):
+    if data1[offset] != data2[offset]:
+      return offset + 1
+  return None
+
+class BinaryDiff(object):
+  """The result of comparing 2 binary files"""
+  def __init__(self, size1, size2, block_size=BLOCK_SIZE):
+    self.size1 = size1
+    self.size2 = size2
+    self.block_size = block_size
+    self.first = None
+    self.blocks = 0
+    self.ranges = []
+
+  @property
+  def total_blocks(self):
+    size = max(self.size1, self.size2)
+    return (size + self.block_size - 1) // self.block_size
+
+  def write(self, out, path1, path2):
+    """Write the .bindiff of the result
+
+    :param out: The file object to write to
+    :param path1: The path compared from
+    :param path2: The path compared against
+    """
+    out.write("--- {}\t{} bytes\n".format(path1, self.size1))
+    out.write("+++ {}\t{} bytes\n".format(path2, self.size2))
+    if self.first is None:
+      return
+    out.write("first difference at 0x{:08x}\n".format(self.first))
+    if not self.ranges:
+      return
+    out.write("changed blocks {} of {} ({} bytes each)\n".format(
+      self.blocks,
+      self.total_blocks,
+      self.block_size))
+    for start, stop in self.ranges[:MAX_RANGES]:
+      out.write("@@ 0x{:08x} {}\n".format(start, stop - start))
+    if len(self.ranges) > MAX_RANGES:
+      out.write("... {} more ranges\n".format(len(self.ranges) - MAX_RANGES))
+
+def compare_binary(path1, path2, ranges=False, block_size=BLOCK_SIZE):
+  """Compare 2 files byte by byte through mmap
+
+  :param path1: The file to compare from
+  :param path2: The file to compare against
+  :param ranges: Whether to find every range that differs
+  :param block_size: The size of the blocks that are compared
+  :return: The BinaryDiff
+  """
+  with mapped(path1) as data1, mapped(path2) as data2:
+    return compare_data(data1, data2, ranges, block_size)
+
+def compare_data(data1, data2, ranges=False, block_size=BLOCK_SIZE):
+  """Compare 2 buffers byte by byte
+
+  Without ranges the comparison stops at the first block that differs.
+  With ranges every block is compared. Consecutive changed blocks are
+  merged into one range whose edges are exact to the byte. The bytes past
+  the end of the shorter buffer are one more range.
+
+  :param data1: The content to compare from
+  :param data2: The content to compare against
+  :param ranges: Whether to find every range that differs
+  :param block_size: The size of the blocks that are compared
+  :return: The BinaryDiff
+  """
+  result = BinaryDiff(len(data1), len(data2), block_size)
+  common = min(len(data1), len(data2))
+  run = None
+  changed = False
+  for start in range(0, common, block_size):
+    stop = min(start + block_size, common)
+    changed = data1[start:stop] != data2[start:stop]
+    if not changed:
+      if run is not None:
+        result.ranges.append(run)
+        run = None
+      continue
+    result.blocks += 1
+    if result.first is None:
+      result.first = first_byte(data1, data2, start, stop)
+      if not ranges:
+        break
+    edge = last_byte(data1, data2, start, stop)
+    if run is None:
+      run = (first_byte(data1, data2, start, stop), edge)
+    elif run[1] == start and data1[start] != data2[start]:
+      run = (run[0], edge)
+    else:
+      # The run ended inside the block
+      result.ranges.append((run[0], run[1]))
+      run = (first_byte(data1, data2, start, stop), edge)
+  if run is not None:
+    result.ranges.append(run)
+  if len(data1) != len(data2):
+    if result.first is None:
+      result.first = common
+    if ranges:
+      tail = max(len(data1), len(data2))
+      if result.ranges and result.ranges[-1][1] == common:
+        result.ranges[-1] = (result.ranges[-1][0], tail)
+      else:
+        result.ranges.append((common, tail))
+      result.blocks += ((tail + block_size - 1) // block_size -
+                        common // block_size)
+      if common % block_size and changed:
+        # The block the shorter file ends in was already counted
+        result.blocks -= 1
+  return result
@@ -1,3 +1,4 @@
+import threading
 import logging
 logger = logging.getLogger('differ.changes')
 
@@ -7,12 +8,40 @@ class CHANGE_STATE():
   REMOVED =      1 << 1
   CHANGED =      1 << 2
   CHANGED_STAT = 1 << 3
+  RENAMED =      1 << 4
+
+# The names of the states used when reporting them
+STATE_NAMES = [
+  (CHANGE_STATE.ADD,          'added'),
+  (CHANGE_STATE.REMOVED,      'removed'),
+  (CHANGE_STATE.CHANGED,      'changed'),
+  (CHANGE_STATE.CHANGED_STAT, 'changed_stat'),
+  (CHANGE_STATE.RENAMED,      'renamed'),
+]
+
+def state_names(state):
+  """Get the names of the bits set in a state
+
+  :param state: The state to convert
+  :return: List of the state names
+  """
+  return [name for bit, name in STATE_NAMES if state & bit]
 
 class Change(object):
+  """The changes found for a single path
+
+  A path usually has no related files or deltas so they are only created
+  when they are set.
+  """
+  __slots__ = ('path', 'state', 'related', 'size', 'mode', 'source')
+
   def __init__(self, path):
     self.path = path
     self.state = CHANGE_STATE.NONE
-    self.related = []
+    self.related = ()
+    self.size = None
+    self.mode = None
+    self.source = None
 
   def __repr__(self):
     return ("path={} state={} num_related={}".format(
@@ -21,8 +50,74 @@ class Change(object):
       len(self.related)))
 
 class Changes(object):
+  """The changes of every path
+
+  The paths are indexed by each state bit as they are marked so a state can
+  be counted or iterated without going over every change.
+  """
   def __init__(self):
     self.changes = {}
+    self.states = dict((bit, set()) for bit, name in STATE_NAMES)
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.changes)
+
+  def __iter__(self):
+    return iter(self.changes.values())
+
+  def get(self, path):
+    """Get the change of a path
+
+    :param path: The path to look up
+    :return: The Change or None if the path has no changes
+    """
+    return self.changes.get(path)
+
+  def _index(self, state):
+    """Get the index to go over for a state
+
+    :param state: The state to look up
+    :return: The set of paths of the smallest state bit in the state or None
+             if the state has no bits that are indexed
+    """
+    indexes = [paths for bit, paths in self.states.items() if state & bit]
+    if not indexes:
+      return None
+    return min(indexes, key=len)
+
+  def iter_by_state(self, state):
+    """Iterate over the paths that have every bit of a state
+
+    :param state: The state to look up
+    :return: Generator of the paths that match the state
+    """
+    index = self._index(state)
+    if index is None:
+      for path in list(self.changes):
+        yield path
+      return
+    for path in list(index):
+      if (self.changes[path].state & state) == state:
+        yield path
+
+  def count(self, state):
+    """Count the paths that have every bit of a state
+
+    :param state: The state to count
+    :return: The number of paths that match the state
+    """
+    index = self.states.get(state)
+    if index is not None:
+      return len(index)
+    return sum(1 for _ in self.iter_by_state(state))
+
+  def counts(self):
+    """Count the paths of each state
+
+    :return: Dictionary of the state name to the number of paths
+    """
+    return dict((name, len(self.states[bit])) for bit, name in STATE_NAMES)
 
   def get_list_by_state(self, state):
     """Get a list of changes by state
@@ -30,12 +125,7 @@ class Changes(object):
     :param state: The state to look up
     :return: List of changes that match the state
     """
-    items = []
-    for item in self.changes.values():
-      if (item.state & state) == state:
-        items.append(item.path)
-    print("Result {}".format(items))
-    return items
+    return list(self.iter_by_state(state))
 
   def get_added(self):
     return self.get_list_by_state(CHANGE_STATE.ADD)
@@ -55,11 +145,12 @@ class Changes(object):
     :param path: Path associated to the change
     :return: The change object which was either looked up or added
     """
-    obj = self.changes.get(path)
-    if obj:
-      return obj
-    self.changes[path] = Change(path)
-    return self.changes[path]
+    with self.lock:
+      obj = self.changes.get(path)
+      if obj:
+        return obj
+      self.changes[path] = Change(path)
+      return self.changes[path]
 
   def set_state(self, path, state):
     """Set a state to the change associated to a path
@@ -68,7 +159,11 @@ class Changes(object):
     :param state: The state of the change
     """
     obj = self.get_or_add(path)
-    obj.state |= state
+    with self.lock:
+      obj.state |= state
+      for bit, paths in self.states.items():
+        if state & bit:
+          paths.add(path)
     logger.debug("path={} state={} updated state={}".format(
       path,
       state,
@@ -83,8 +178,46 @@ class Changes(object):
   def mark_changed(self, path):
     self.set_state(path, CHANGE_STATE.CHANGED)
 
-  def mark_changed_stat(self, path):
+  def mark_renamed(self, path, source):
+    """Mark that the path was moved from another path
+
+    :param path: The path in path2
+    :param source: The path in path1 it was moved from
+    """
+    obj = self.get_or_add(path)
+    with self.lock:
+      obj.source = source
+    self.set_state(path, CHANGE_STATE.RENAMED)
+
+  def mark_changed_stat(self, path, size=None, mode=None):
+    """Mark that the stat of the path changed
+
+    :param path: The path associated to the change
+    :param size: Tuple of the (old, new) size when the size changed
+    :param mode: Tuple of the (old, new) mode when the mode changed
+    """
     self.set_state(path, CHANGE_STATE.CHANGED_STAT)
+    obj = self.get_or_add(path)
+    with self.lock:
+      if size is not None:
+        obj.size = size
+      if mode is not None:
+        obj.mode = mode
+
+  def merge(self, change):
+    """Add a change that was found elsewhere, such as in a worker process
+
+    :param change: The Change to add
+    """
+    self.set_state(change.path, change.state)
+    obj = self.get_or_add(change.path)
+    with self.lock:
+      for name in ['size', 'mode', 'source']:
+        value = getattr(change, name)
+        if value is not None:
+          setattr(obj, name, value)
+      if change.related:
+        obj.related = list(obj.related) + list(change.related)
 
   def add_related(self, path, related_path):
     """Add a related path to the change
@@ -93,4 +226,7 @@ class Changes(object):
     :param related_path: The related path to the change
     """
     obj = self.get_or_add(path)
-    obj.related.append(related_path)
+    with self.lock:
+      if not obj.related:
+        obj.related = []
+      obj.related.append(related_path)
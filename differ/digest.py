@@ -0,0 +1,84 @@
+import os
+import hashlib
+import logging
+logger = logging.getLogger('differ.digest')
+
+# How much data to read at a time when hashing or comparing contents
+CHUNK_SIZE = 64 * 1024
+
+def digest_fileobj(fp, chunk_size=CHUNK_SIZE):
+  """Get the digest of a file object
+
+  The file object is read in chunks so memory usage is bounded regardless
+  of the size of the content.
+
+  :param fp: The file object to read from
+  :param chunk_size: How much to read at a time
+  :return: The hex digest of the content
+  """
+  obj = hashlib.sha1()
+  while True:
+    data = fp.read(chunk_size)
+    if not data:
+      break
+    obj.update(data)
+  return obj.hexdigest()
+
+def digest_file(path, chunk_size=CHUNK_SIZE):
+  """Get the digest of a file on disk
+
+  :param path: The path to the file
+  :param chunk_size: How much to read at a time
+  :return: The hex digest of the content or None on error
+  """
+  try:
+    with open(path, 'rb') as fp:
+      return digest_fileobj(fp, chunk_size)
+  except (IOError, OSError) as exc:
+    logger.debug("Unable to digest {}: {}".format(path, exc))
+    return None
+
+def files_equal(path1, path2, chunk_size=CHUNK_SIZE):
+  """Check whether 2 files have the same content
+
+  The sizes are compared first and the content is only read when they
+  match.
+
+  :param path1: The first file
+  :param path2: The second file
+  :param chunk_size: How much to read at a time
+  :return: True if the content is the same. False if it differs or if
+           either file can not be read
+  """
+  try:
+    if os.stat(path1).st_size != os.stat(path2).st_size:
+      return False
+  except OSError as exc:
+    logger.debug("Unable to compare {} and {}: {}".format(path1, path2, exc))
+    return False
+  return contents_equal(path1, path2, chunk_size)
+
+def contents_equal(path1, path2, chunk_size=CHUNK_SIZE):
+  """Check whether 2 files have the same content without checking the size
+
+  The content is compared chunk by chunk and stops at the first chunk
+  that differs.
+
+  :param path1: The first file
+  :param path2: The second file
+  :param chunk_size: How much to read at a time
+  :return: True if the content is the same. False if it differs or if
+           either file can not be read
+  """
+  try:
+    with open(path1, 'rb') as fp1, open(path2, 'rb') as fp2:
+      while True:
+        data1 = fp1.read(chunk_size)
+        data2 = fp2.read(chunk_size)
+        if data1 != data2:
+          return False
+        if not data1:
+          return True
+  except (IOError, OSError) as exc:
+    logger.debug("Unable to compare {} and {}: {}".format(path1, path2, exc))
+    return False
@@ -0,0 +1,214 @@
+import re
+import logging
+logger = logging.getLogger('differ.filters')
+
+# Rules that start with this are regular expressions instead of globs
+REGEX_PREFIX = 're:'
+
+def glob_to_regex(pattern):
+  """Convert a glob into a regular expression
+
+  The glob works like a .gitignore pattern. '*' and '?' don't match a '/'
+  while '**' matches any number of directories. A glob without a '/' in it
+  matches the name at any depth, otherwise it is matched from the top of
+  the tree. A glob that ends with a '/' only matches directories.
+
+  :param pattern: The glob
+  :return: The regular expression as a string
+  """
+  dir_only = pattern.endswith('/')
+  pattern = pattern.rstrip('/')
+  anchored = '/' in pattern
+  pattern = pattern.lstrip('/')
+  parts = []
+  i = 0
+  while i < len(pattern):
+    char = pattern[i]
+    if pattern.startswith('**/', i):
+      parts.append('(?:.*/)?')
+      i += 3
+      continue
+    if pattern.startswith('**', i):
+      parts.append('.*')
+      i += 2
+      continue
+    if char == '*':
+      parts.append('[^/]*')
+    elif char == '?':
+      parts.append('[^/]')
+    elif char == '[' and ']' in pattern[i + 2:]:
+      end = pattern.index(']', i + 2)
+      chars = pattern[i + 1:end]
+      if chars.startswith('!'):
+        chars = '^' + chars[1:]
+      parts.append('[{}]'.format(chars.replace('\\', '\\\\')))
+      i = end
+    else:
+      parts.append(re.escape(char))
+    i += 1
+  return "{}{}{}".format('^' if anchored else '(?:^|/)',
+                         ''.join(parts),
+                         '/$' if dir_only else '/?$')
+
+def compile_rules(rules):
+  """Compile a list of rules into a single regular expression
+
+  :param rules: The globs and the regular expressions prefixed with 're:'
+  :return: The compiled regular expression or None when there are no rules
+  :raises ValueError: When a regular expression is not valid
+  """
+  if not rules:
+    return None
+  regexes = []
+  for rule in rules:
+    if rule.startswith(REGEX_PREFIX):
+      regexes.append(rule[len(REGEX_PREFIX):])
+    else:
+      regexes.append(glob_to_regex(rule))
+  try:
+    return re.compile('|'.join('(?:{})'.format(regex) for regex in regexes))
+  except re.error as exc:
+    raise ValueError("Invalid filter rule in {}: {}".format(rules, exc))
+
+def parent_dirs(path):
+  """Get the directories a path is under
+
+  :param path: The relative path
+  :return: List of the directories from the top, each ending with a '/'
+  """
+  parts = path.split('/')[:-1]
+  return ['/'.join(parts[:i + 1]) + '/' for i in range(len(parts))]
+
+class PathFilter(object):
+  """Rules that decide which paths are compared
+
+  A path is skipped when it, or a directory it is under, matches one of
+  the exclude rules. When there are include rules a path is only compared
+  when it, or a directory it is under, matches one of them. Directories
+  are tested with a '/' at the end so rules can tell them apart from files.
+  """
+  def __init__(self, include=None, exclude=None):
+    """Initialize the filter
+
+    :param include: List of rules of the paths to compare
+    :param exclude: List of rules of the paths to skip
+    :raises ValueError: When a regular expression is not valid
+    """
+    self.include_rules = list(include or [])
+    self.exclude_rules = list(exclude or [])
+    self.include = compile_rules(self.include_rules)
+    self.exclude = compile_rules(self.exclude_rules)
+
+  def __repr__(self):
+    return "include={} exclude={}".format(self.include_rules,
+                                          self.exclude_rules)
+
+  def __nonzero__(self):
+    return bool(self.include_rules or self.exclude_rules)
+  __bool__ = __nonzero__
+
+  @classmethod
+  def load(cls, path, include=None, exclude=None):
+    """Load the rules from a file
+
+    Every line of the file is 'include <rule>' or 'exclude <rule>'. Empty
+    lines and lines that start with a '#' are ignored.
+
+    :param path: The file to read
+    :param include: More include rules, such as the ones from the command
+                    line
+    :param exclude: More exclude rules
+    :return: The PathFilter
+    :raises ValueError: When the file can't be read or a line is not valid
+    """
+    rules = {'include': list(include or []), 'exclude': list(exclude or [])}
+    try:
+      with open(path) as fp:
+        lines = fp.readlines()
+    except (IOError, OSError) as exc:
+      raise ValueError("Unable to read {}: {}".format(path, exc))
+    for number, line in enumerate(lines, 1):
+      line = line.strip()
+      if not line or line.startswith('#'):
+        continue
+      kind, _, rule = line.partition(' ')
+      rule = rule.strip()
+      if kind not in rules or not rule:
+        raise ValueError("{}:{}: expected 'include <rule>' or "
+                         "'exclude <rule>'".format(path, number))
+      rules[kind].append(rule)
+    obj = cls(rules['include'], rules['exclude'])
+    logger.debug("Loaded {} from {}".format(obj, path))
+    return obj
+
+  def prune(self, directory):
+    """Check whether a directory and everything under it is skipped
+
+    :param directory: The relative path of the directory
+    :return: True if the directory matches an exclude rule
+    """
+    return (self.exclude is not None and
+            self.exclude.search(directory.rstrip('/') + '/') is not None)
+
+  def keep(self, path, walked=False):
+    """Check whether a path is compared
+
+    :param path: The relative path of a file
+    :param walked: Whether the directories the path is under were already
+                   checked with prune() while walking
+    :return: True if the path is compared, False if it is skipped
+    """
+    if self.excluded(path, walked):
+      return False
+    if self.include is None:
+      return True
+    return any(self.include.search(name)
+               for name in parent_dirs(path) + [path])
+
+  def excluded(self, path, walked=False):
+    """Check whether a path matches an exclude rule
+
+    :param path: The relative path of a file
+    :param walked: Whether the directories the path is under were already
+                   checked with prune() while walking
+    :return: True if the path or a directory it is under is excluded
+    """
+    if self.exclude is None:
+      return False
+    names = [path] if walked else parent_dirs(path) + [path]
+    return any(self.exclude.search(name) for name in names)
+
+class MemberFilter(object):
+  """The filter of the members of an archive found inside the paths
+
+  The members are matched by their virtual path, such as
+  outer.tgz!/etc/hosts, so a rule with a '/' in it only matches the top of
+  the compared paths while a rule without one matches a name at any depth,
+  in archives too. The archive itself was kept by the filter so its
+  members are all included, only the exclude rules skip them.
+  """
+  def __init__(self, path_filter, prefix):
+    """Initialize the filter
+
+    :param path_filter: The PathFilter of the compared paths
+    :param prefix: The virtual path of the archive and the separator that
+                   comes before the names of its members
+    """
+    self.path_filter = path_filter
+    self.prefix = prefix
+
+  def __repr__(self):
+    return "{} under {}".format(self.path_filter, self.prefix)
+
+  def __nonzero__(self):
+    return bool(self.path_filter and self.path_filter.exclude_rules)
+  __bool__ = __nonzero__
+
+  def keep(self, path, walked=False):
+    """Check whether a member is compared
+
+    :param path: The name of the member in the archive
+    :param walked: Unused, the members are never walked
+    :return: True if the member is compared, False if it is skipped
+    """
+    return not self.path_filter.excluded(self.prefix + path)
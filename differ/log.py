@@ -0,0 +1,53 @@
+import logging
+
+def setup_logging(level='INFO'):
+  """Setup logging
+
+  :param level: The level to set in the logging configuration
+  """
+  import logging.config
+  LOGGER_DEFAULT = {
+    'level': level
+  }
+  LOG_CONFIG = {
+    "version": 1,
+   "formatters": {
+     "default": {
+       "format": "%(levelname)-8s %(module)s %(funcName)s - %(message)s",
+       "datefmt": "%Y-%m-%d %H:%M:%S"
+     },
+    },
+    "handlers": {
+      "console": {
+        "class": "logging.StreamHandler",
+        "formatter": "default"
+      },
+    },
+    "loggers": {
+      "differ.archive": LOGGER_DEFAULT,
+      "differ.bindiff": LOGGER_DEFAULT,
+      "differ.changes": LOGGER_DEFAULT,
+      "differ.digest": LOGGER_DEFAULT,
+      "differ.filters": LOGGER_DEFAULT,
+      "differ.main": LOGGER_DEFAULT,
+      "differ.manifest": LOGGER_DEFAULT,
+      "differ.metrics": LOGGER_DEFAULT,
+      "differ.nested": LOGGER_DEFAULT,
+      "differ.normalize": LOGGER_DEFAULT,
+      "differ.output": LOGGER_DEFAULT,
+      "differ.path": LOGGER_DEFAULT,
+      "differ.paths": LOGGER_DEFAULT,
+      "differ.pipeline": LOGGER_DEFAULT,
+      "differ.plugins": LOGGER_DEFAULT,
+      "differ.progress": LOGGER_DEFAULT,
+      "differ.renames": LOGGER_DEFAULT,
+      "differ.report": LOGGER_DEFAULT,
+      "differ.series": LOGGER_DEFAULT,
+      "differ.udiff": LOGGER_DEFAULT,
+      "differ.utils": LOGGER_DEFAULT,
+    },
+    "root": {
+      "handlers": ["console"],
+    },
+  }
+  logging.config.dictConfig(LOG_CONFIG)
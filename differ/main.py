@@ -8,10 +8,6 @@ directories.
 
 from __future__ import print_function
 import os, sys, argparse, textwrap
-import uuid
-import re
-import utils
-utils.setup_logging()
 
 import logging
 logger = logging.getLogger("differ.main")
@@ -35,6 +31,39 @@ if __name__ == "__main__":
              help='Show verbose logging')
     return p
 
+  def get_filter(args):
+    """Get the filter of the paths to compare
+
+    :param args: The command line arguments
+    :return: The PathFilter or None when there are no rules
+    """
+    from filters import PathFilter
+    try:
+      if args.filter_file:
+        return PathFilter.load(args.filter_file, args.include, args.exclude)
+      if args.include or args.exclude:
+        return PathFilter(args.include, args.exclude)
+    except ValueError as exc:
+      print(exc)
+      sys.exit(1)
+    return None
+
+  def add_filter_args(p):
+    """Add the arguments of the filter of the paths to compare
+
+    :param p: The parser to add them to
+    """
+    p.add_argument("--include", action="append", metavar="RULE",
+      help="Only compare the paths that match this glob, or regular "
+           "expression when it starts with 're:'. Can be repeated")
+    p.add_argument("--exclude", action="append", metavar="RULE",
+      help="Skip the paths that match this glob, or regular expression when "
+           "it starts with 're:'. Directories that match are not walked. "
+           "Can be repeated")
+    p.add_argument("--filter-file",
+      help="File with one 'include <rule>' or 'exclude <rule>' per line. "
+           "Excluded members of archives are never extracted")
+
   def ap_diff(args):
     """Run the differ
 
@@ -44,8 +73,64 @@ if __name__ == "__main__":
       if not os.path.exists(path):
         print("Path {} does not exist".format(path))
         sys.exit(1)
-    differ = utils.Differ(args.path1, args.path2)
-    differ.start()
+    # Only import the differ once there is something to do so the command
+    # line starts quickly
+    path_filter = get_filter(args)
+    import utils
+    import report
+    differ = utils.Differ(args.path1, args.path2,
+      stream=args.stream,
+      jobs=args.jobs,
+      follow_symlinks=not args.no_follow_symlinks,
+      cache_dir=args.cache_dir,
+      cache_size=args.cache_size,
+      in_place=args.in_place,
+      report=report.REPORTS[args.format](),
+      renames=args.renames,
+      similarity=args.similarity,
+      profile=args.profile,
+      binary_ranges=args.binary_ranges,
+      pipeline=args.pipeline,
+      nested_depth=args.nested_depth,
+      path_filter=path_filter)
+    progress = None
+    if args.progress:
+      from progress import print_progress
+      progress = print_progress
+    try:
+      differ.start(progress=progress)
+    except IOError as exc:
+      print(exc)
+      sys.exit(1)
+
+  def ap_series(args):
+    """Run the differ over a series of snapshots
+
+    :param args: The command line arguments
+    """
+    if len(args.paths) < 2:
+      print("At least 2 snapshots are needed")
+      sys.exit(1)
+    for path in args.paths:
+      if not os.path.exists(path):
+        print("Path {} does not exist".format(path))
+        sys.exit(1)
+    path_filter = get_filter(args)
+    import series
+    import report
+    obj = series.Series(args.paths,
+      jobs=args.jobs,
+      follow_symlinks=not args.no_follow_symlinks,
+      in_place=args.in_place,
+      report=report.REPORTS[args.format](),
+      renames=args.renames,
+      similarity=args.similarity,
+      path_filter=path_filter)
+    try:
+      obj.start()
+    except IOError as exc:
+      print(exc)
+      sys.exit(1)
 
   parser = argparse.ArgumentParser(
     formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -54,6 +139,7 @@ if __name__ == "__main__":
       Examples:
       -----------------------
       {prg} diff before.tar.gz after.tar.gz
+      {prg} series n1.tgz n2.tgz n3.tgz
     '''.format(prg=sys.argv[0])))
   sub_p = parser.add_subparsers(title='Actions',
                                 help='%(prog)s <action> -h for more info')
@@ -61,9 +147,63 @@ if __name__ == "__main__":
     help="Get the difference between 2 snapshots")
   p.add_argument("path1")
   p.add_argument("path2")
+  p.add_argument("--stream", action="store_true",
+    help="Read archives member by member and only extract what changed")
+  p.add_argument("--pipeline", action="store_true",
+    help="Compare the members of archives while they are being extracted")
+  p.add_argument("-j", "--jobs", type=int, default=1,
+    help="Number of paths to compare at the same time")
+  p.add_argument("--no-follow-symlinks", action="store_true",
+    help="Compare symlinks themselves instead of what they point to")
+  p.add_argument("--cache-dir",
+    help="Cache the manifest of each archive in this directory (implies "
+         "--stream)")
+  p.add_argument("--cache-size", type=int, default=32,
+    help="Number of manifests to keep in the cache")
+  p.add_argument("--in-place", action="store_true",
+    help="Compare directories where they are without copying them")
+  p.add_argument("--format", choices=["text", "jsonl"], default="text",
+    help="Report the changes as text or as one JSON object per line")
+  p.add_argument("--renames", action="store_true",
+    help="Report files that moved without changing as renamed instead of "
+         "removed and added")
+  p.add_argument("--similarity", type=float, default=None,
+    help="Also report files that moved and changed as renamed when at least "
+         "this ratio of their lines (0 to 1) is the same (implies --renames)")
+  p.add_argument("--nested-depth", type=int, default=0,
+    help="Compare the members of archives found inside the paths up to this "
+         "many archives deep instead of comparing them as single files")
+  p.add_argument("--progress", action="store_true",
+    help="Show the files compared per second and the ETA on stderr")
+  p.add_argument("--binary-ranges", action="store_true",
+    help="List every range of bytes that differs in binary files instead "
+         "of stopping at the first one")
+  p.add_argument("--profile", action="store_true",
+    help="Add the time spent in each phase and what was read, written and "
+         "spawned to the summary")
+  add_filter_args(p)
+
+  p = add_sp(sub_p, "series", func=ap_series,
+    help="Get the difference between each snapshot and the one before it")
+  p.add_argument("paths", nargs="+", metavar="path")
+  p.add_argument("-j", "--jobs", type=int, default=1,
+    help="Number of paths to compare at the same time")
+  p.add_argument("--no-follow-symlinks", action="store_true",
+    help="Compare symlinks themselves instead of what they point to")
+  p.add_argument("--in-place", action="store_true",
+    help="Compare directories where they are without copying them")
+  p.add_argument("--format", choices=["text", "jsonl"], default="text",
+    help="Report the changes as text or as one JSON object per line")
+  p.add_argument("--renames", action="store_true",
+    help="Report files that moved without changing as renamed instead of "
+         "removed and added")
+  p.add_argument("--similarity", type=float, default=None,
+    help="Also report files that moved and changed as renamed when at least "
+         "this ratio of their lines (0 to 1) is the same (implies --renames)")
+  add_filter_args(p)
 
   args = parser.parse_args()
-  if args.verbose:
-    utils.setup_logging('DEBUG')
+  from log import setup_logging
+  setup_logging('DEBUG' if args.verbose else 'INFO')
 
   args.func(args)
@@ -0,0 +1,233 @@
+import os
+import json
+import threading
+import logging
+logger = logging.getLogger('differ.manifest')
+
+from archive import Member
+from digest import digest_file
+
+MANIFEST_VERSION = 3
+
+# Member names are bytes in any encoding. Every byte maps to one character
+# of latin-1 so the names are saved as JSON and loaded back unchanged
+NAME_ENCODING = 'latin-1'
+
+def decode_name(name):
+  """Get the str member name of a name loaded from a manifest
+
+  :param name: The name as loaded from JSON
+  :return: The name as the bytes it had in the archive
+  """
+  if isinstance(name, unicode):
+    return name.encode(NAME_ENCODING)
+  return name
+
+class Manifest(object):
+  """The path, size, mode, digest and link of every member of an archive"""
+  def __init__(self, members, prefix='', links=None):
+    """Initialize the manifest
+
+    :param members: Dictionary of member name to Member
+    :param prefix: The top level directory stripped from the member names
+    :param links: Dictionary of hard link names to their targets
+    """
+    self.members = members
+    self.prefix = prefix
+    self.links = links or {}
+
+  def __len__(self):
+    return len(self.members)
+
+  def save(self, path):
+    """Save the manifest to a file
+
+    The manifest is written to a temporary file first so a reader never
+    sees a partially written manifest.
+
+    :param path: The file to write to
+    """
+    data = {
+      'version': MANIFEST_VERSION,
+      'prefix': self.prefix,
+      'links': self.links,
+      'members': [[m.name, m.size, m.mode, m.digest, m.linkname]
+                  for m in self.members.values()],
+    }
+    tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(),
+                                     threading.current_thread().ident)
+    with open(tmp_path, 'w') as fp:
+      json.dump(data, fp, encoding=NAME_ENCODING)
+    os.rename(tmp_path, path)
+
+  @classmethod
+  def load(cls, path):
+    """Load a manifest from a file
+
+    :param path: The file to read
+    :return: The Manifest or None if it can't be read
+    """
+    try:
+      with open(path) as fp:
+        data = json.load(fp)
+    except (IOError, OSError, ValueError) as exc:
+      logger.debug("Unable to load manifest {}: {}".format(path, exc))
+      return None
+    if data.get('version') != MANIFEST_VERSION:
+      return None
+    members = {}
+    for name, size, mode, digest, linkname in data['members']:
+      name = decode_name(name)
+      members[name] = Member(name, size, mode, decode_name(digest),
+                             decode_name(linkname))
+    links = dict((decode_name(name), decode_name(target))
+                 for name, target in data['links'].items())
+    return cls(members, decode_name(data['prefix']), links)
+
+def key_path(key):
+  """Get the path of the archive of a key of the index
+
+  :param key: The key made of the real path, size and modification time
+  :return: The real path of the archive
+  """
+  return key.rsplit(':', 2)[0]
+
+class ManifestCache(object):
+  """A directory of manifests keyed by the digest of the archive
+
+  Computing the digest of an archive still reads it but it is a lot
+  cheaper than decompressing and walking it. The digest is also remembered
+  by the path, size and modification time of the archive so an unchanged
+  archive is not read again at all.
+  """
+  def __init__(self, directory, max_entries=32):
+    """Initialize the cache
+
+    :param directory: Where the manifests are stored
+    :param max_entries: The number of manifests to keep. The least recently
+                        used manifests are removed first
+    """
+    self.directory = directory
+    self.max_entries = max_entries
+    self.index_path = os.path.join(directory, 'index.json')
+    self.lock = threading.RLock()
+    if not os.path.exists(directory):
+      os.makedirs(directory)
+
+  def _load_index(self):
+    try:
+      with open(self.index_path) as fp:
+        return json.load(fp)
+    except (IOError, OSError, ValueError):
+      return {}
+
+  def _save_index(self, index):
+    tmp_path = "{}.{}.{}.tmp".format(self.index_path, os.getpid(),
+                                     threading.current_thread().ident)
+    with open(tmp_path, 'w') as fp:
+      json.dump(index, fp)
+    os.rename(tmp_path, self.index_path)
+
+  def key(self, path):
+    """Get the key of an archive
+
+    :param path: The path to the archive
+    :return: The digest of the archive or None on error
+    """
+    try:
+      obj = os.stat(path)
+    except OSError:
+      return None
+    real_path = os.path.realpath(path)
+    stat_key = "{}:{}:{}".format(real_path, obj.st_size, obj.st_mtime)
+    with self.lock:
+      digest = self._load_index().get(stat_key)
+    if digest:
+      return digest
+    digest = digest_file(path)
+    if digest:
+      # The index is loaded again in case another archive was added to it.
+      # The keys of the archive from before it changed are never used again
+      with self.lock:
+        index = self._load_index()
+        for key in [key for key in index if key_path(key) == real_path]:
+          del index[key]
+        index[stat_key] = digest
+        self._save_index(index)
+    return digest
+
+  def manifest_path(self, key):
+    return os.path.join(self.directory, "{}.manifest".format(key))
+
+  def get(self, path):
+    """Get the cached manifest of an archive
+
+    :param path: The path to the archive
+    :return: The Manifest or None if it is not cached
+    """
+    key = self.key(path)
+    if not key:
+      return None
+    manifest_path = self.manifest_path(key)
+    if not os.path.exists(manifest_path):
+      logger.debug("No cached manifest for {}".format(path))
+      return None
+    manifest = Manifest.load(manifest_path)
+    if manifest is not None:
+      logger.debug("Using cached manifest {} for {}".format(
+        manifest_path,
+        path))
+      # Mark the manifest as recently used
+      os.utime(manifest_path, None)
+    return manifest
+
+  def put(self, path, manifest):
+    """Store the manifest of an archive
+
+    :param path: The path to the archive
+    :param manifest: The Manifest to store
+    :return: True on success, False otherwise
+    """
+    key = self.key(path)
+    if not key:
+      return False
+    manifest.save(self.manifest_path(key))
+    self.evict()
+    return True
+
+  def evict(self):
+    """Remove the least recently used manifests over the limit
+
+    :return: The number of manifests removed
+    """
+    entries = []
+    for name in os.listdir(self.directory):
+      if not name.endswith('.manifest'):
+        continue
+      path = os.path.join(self.directory, name)
+      try:
+        entries.append((os.stat(path).st_mtime, path))
+      except OSError:
+        continue
+    entries.sort(reverse=True)
+    evicted = set()
+    for mtime, path in entries[self.max_entries:]:
+      logger.debug("Evicting manifest {}".format(path))
+      try:
+        os.remove(path)
+        evicted.add(path)
+      except OSError:
+        pass
+
+    # Forget the digests of the evicted manifests and of the archives that
+    # are gone. The digests of the archives whose manifest is being made
+    # are kept
+    with self.lock:
+      index = self._load_index()
+      kept = dict((key, digest) for key, digest in index.items()
+                  if self.manifest_path(digest) not in evicted and
+                  (os.path.exists(self.manifest_path(digest)) or
+                   os.path.exists(key_path(key))))
+      if len(kept) != len(index):
+        self._save_index(kept)
+    return len(evicted)
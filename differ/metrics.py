@@ -0,0 +1,143 @@
+import time
+import threading
+import contextlib
+import logging
+logger = logging.getLogger('differ.metrics')
+
+class Metrics(object):
+  """The time spent in each phase of a comparison and what was done
+
+  Phases run one after the other so their timings add up to the time of
+  the comparison. Timers measure work that is done by the workers, like
+  stripping or comparing a single file, and are summed across the workers
+  so they can be bigger than the phase they are part of. Counters count
+  things like bytes read and subprocesses spawned.
+  """
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.phases = []
+    self.timings = {}
+    self.timers = {}
+    self.counters = {}
+
+  def __repr__(self):
+    return " ".join("{}={:.3f}s".format(name, self.timings[name])
+                    for name in self.phases)
+
+  def add(self, name, seconds):
+    """Add time to a phase
+
+    :param name: The name of the phase
+    :param seconds: The number of seconds spent in it
+    """
+    if name not in self.timings:
+      self.phases.append(name)
+      self.timings[name] = 0.0
+    self.timings[name] += seconds
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    """Time the code run in the context as a phase
+
+    :param name: The name of the phase
+    """
+    start = time.time()
+    try:
+      yield
+    finally:
+      self.add(name, time.time() - start)
+
+  @contextlib.contextmanager
+  def timer(self, name):
+    """Time the code run in the context and add it to a timer
+
+    :param name: The name of the timer
+    """
+    start = time.time()
+    try:
+      yield
+    finally:
+      seconds = time.time() - start
+      with self.lock:
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+  def count(self, name, value=1):
+    """Add to a counter
+
+    :param name: The name of the counter
+    :param value: How much to add
+    """
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + value
+
+  def drain(self):
+    """Get the timers and counters and start them over from zero
+
+    :return: Tuple of the timers and the counters
+    """
+    with self.lock:
+      timers = self.timers
+      counters = self.counters
+      self.timers = {}
+      self.counters = {}
+    return timers, counters
+
+  def merge(self, timers, counters):
+    """Add timers and counters measured elsewhere, such as in a worker
+    process
+
+    :param timers: Dictionary of timer name to seconds
+    :param counters: Dictionary of counter name to value
+    """
+    with self.lock:
+      for name, seconds in timers.items():
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+      for name, value in counters.items():
+        self.counters[name] = self.counters.get(name, 0) + value
+
+  def files_per_sec(self):
+    """Get the number of paths compared per second
+
+    :return: The rate or None if nothing was compared
+    """
+    seconds = self.timings.get('compare')
+    if not seconds:
+      return None
+    return self.counters.get('paths', 0) / seconds
+
+  def as_dict(self):
+    """Get the metrics as a dictionary
+
+    :return: Dictionary with the phases in order, their timings, the timers,
+             the counters and the files compared per second
+    """
+    with self.lock:
+      return {
+        'phases': list(self.phases),
+        'timings': dict(self.timings),
+        'timers': dict(self.timers),
+        'counters': dict(self.counters),
+        'total': sum(self.timings.values()),
+        'files_per_sec': self.files_per_sec(),
+      }
+
+  def format(self):
+    """Format the metrics as text
+
+    :return: The text
+    """
+    data = self.as_dict()
+    lines = ["Profile"]
+    for name in data['phases']:
+      lines.append("  phase {:<16} {:10.3f}s".format(name,
+                                                    data['timings'][name]))
+    lines.append("  phase {:<16} {:10.3f}s".format("total", data['total']))
+    for name in sorted(data['timers']):
+      lines.append("  timer {:<16} {:10.3f}s".format(name,
+                                                    data['timers'][name]))
+    for name in sorted(data['counters']):
+      lines.append("  count {:<16} {:10}".format(name,
+                                                data['counters'][name]))
+    if data['files_per_sec'] is not None:
+      lines.append("  files/sec {:>23.1f}".format(data['files_per_sec']))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,187 @@
+import io
+import os
+import logging
+logger = logging.getLogger('differ.nested')
+
+from archive import Archive, archive_type
+from filters import MemberFilter
+
+# Joins the path of an archive and the name of a member inside of it
+SEPARATOR = '!/'
+
+def virtual_path(path, name):
+  """Get the path of a member of an archive found inside the paths
+
+  :param path: The (virtual) path of the archive
+  :param name: The name of the member in the archive
+  :return: The virtual path such as outer.tgz!/etc/foo
+  """
+  return "{}{}{}".format(path, SEPARATOR, name)
+
+class NestedDiffer(object):
+  """Compare the members of archives found inside of the compared paths
+
+  Both versions of an archive are read as streams to get the digest of
+  every member. Only the content of the members that differ is then read
+  into memory to write their diffs so nothing is extracted to disk. An
+  archive found inside of an archive is compared the same way until the
+  depth limit is reached. The changes of the members are recorded under
+  their virtual paths, which are also what the exclude rules are matched
+  against. A symlink or a hard link that points to another member is
+  changed and its diff has the 2 targets.
+  """
+  def __init__(self, differ, max_depth=0):
+    """Initialize the nested differ
+
+    :param differ: The Differ the changes are recorded in
+    :param max_depth: How many archives deep to compare members. 0 to
+                      compare archives as single files
+    """
+    self.differ = differ
+    self.max_depth = max_depth
+
+  def matches(self, path, depth=1):
+    """Check whether the members of a path are compared
+
+    :param path: The (virtual) path to check
+    :param depth: How deep the archive is inside of the compared paths
+    :return: True if the path is an archive within the depth limit
+    """
+    return depth <= self.max_depth and archive_type(path) is not None
+
+  def compare(self, path, p1, p2):
+    """Compare the members of an archive that changed
+
+    :param path: The relative path of the archive
+    :param p1: The full path of the archive to compare from
+    :param p2: The full path of the archive to compare against
+    :return: List of the virtual paths that changed or None if either
+             archive can't be read
+    """
+    try:
+      with open(p1, 'rb') as fp1, open(p2, 'rb') as fp2:
+        return self.compare_archives(path, (p1, fp1), (p2, fp2), 1)
+    except (IOError, OSError) as exc:
+      logger.error("Unable to read {}: {}".format(path, exc))
+      return None
+
+  def compare_archives(self, path, side1, side2, depth):
+    """Compare the members of 2 versions of an archive
+
+    :param path: The virtual path of the archive
+    :param side1: Tuple of the name written in diffs and the file object
+                  of the archive to compare from
+    :param side2: Same as side1 for the archive to compare against
+    :param depth: How deep the archive is inside of the compared paths
+    :return: List of the virtual paths that changed or None if either
+             archive can't be read
+    """
+    differ = self.differ
+    label1, fp1 = side1
+    label2, fp2 = side2
+    path_filter = None
+    if differ.path_filter:
+      path_filter = MemberFilter(differ.path_filter, virtual_path(path, ''))
+    archive1 = Archive(path, differ.metrics, fp1, path_filter)
+    archive2 = Archive(path, differ.metrics, fp2, path_filter)
+    members1 = archive1.scan()
+    members2 = archive2.scan() if members1 is not None else None
+    if members2 is None:
+      return None
+    removed = sorted(name for name in members1 if name not in members2)
+    added = sorted(name for name in members2 if name not in members1)
+    common = sorted(name for name in members1 if name in members2)
+    differs = set(name for name in common
+                  if members1[name].is_regular() and
+                  members2[name].is_regular() and
+                  members1[name].digest != members2[name].digest)
+    relinked = set(name for name in common
+                   if name not in differs and
+                   members1[name].linkname != members2[name].linkname)
+    logger.debug("{}: {} removed {} added {} differ {} relinked".format(
+      path,
+      len(removed),
+      len(added),
+      len(differs),
+      len(relinked)))
+
+    # Only the content that is written or compared further is read
+    wanted1 = set(differs)
+    wanted2 = set(differs)
+    if differ.write_output:
+      wanted1.update(removed)
+      wanted2.update(added)
+    data1 = archive1.read(wanted1)
+    data2 = archive2.read(wanted2)
+    if data1 is None or data2 is None:
+      return None
+
+    paths = []
+    for name in removed:
+      vpath = virtual_path(path, name)
+      differ.changes.mark_deleted(vpath)
+      self.write(data1.get(name), members1[name].mode,
+                 differ.removed_dir, vpath)
+      paths.append(vpath)
+    for name in common:
+      vpath = virtual_path(path, name)
+      differ.record_mode(vpath, members1[name].mode, members2[name].mode)
+      differ.record_size(vpath, members1[name].size, members2[name].size)
+      found = []
+      if name in differs:
+        found = self.compare_members(
+          vpath,
+          (virtual_path(label1, name), data1[name]),
+          (virtual_path(label2, name), data2[name]),
+          depth)
+      elif name in relinked:
+        differ.write_diff(vpath,
+                          virtual_path(label1, name),
+                          virtual_path(label2, name),
+                          (members1[name].linkname or '',
+                           members2[name].linkname or ''))
+      if differ.changes.get(vpath) is not None:
+        paths.append(vpath)
+      paths.extend(found)
+    for name in added:
+      vpath = virtual_path(path, name)
+      differ.changes.mark_added(vpath)
+      self.write(data2.get(name), members2[name].mode,
+                 differ.added_dir, vpath)
+      paths.append(vpath)
+    return paths
+
+  def compare_members(self, vpath, side1, side2, depth):
+    """Compare the content of a member that differs
+
+    :param vpath: The virtual path of the member
+    :param side1: Tuple of the name written in diffs and the content of the
+                  member to compare from
+    :param side2: Same as side1 for the member to compare against
+    :param depth: How deep the archive of the member is
+    :return: List of the virtual paths inside the member that changed when
+             it is an archive that was compared too
+    """
+    label1, data1 = side1
+    label2, data2 = side2
+    if self.matches(vpath, depth + 1):
+      found = self.compare_archives(vpath,
+                                    (label1, io.BytesIO(data1)),
+                                    (label2, io.BytesIO(data2)),
+                                    depth + 1)
+      if found is not None:
+        return found
+    self.differ.write_diff(vpath, label1, label2, (data1, data2))
+    return []
+
+  def write(self, data, mode, directory, vpath):
+    """Write the content of a member that was added or removed
+
+    :param data: The content or None when it was not read
+    :param mode: The st_mode of the member
+    :param directory: The output directory it is written under
+    :param vpath: The virtual path of the member
+    """
+    if data is None or not self.differ.write_output:
+      return
+    self.differ.output.write(data, os.path.join(directory, vpath), mode)
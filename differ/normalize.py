@@ -0,0 +1,106 @@
+import os
+import shutil
+import threading
+import logging
+logger = logging.getLogger('differ.normalize')
+
+from plugins import PLUGINS
+from digest import digest_file
+from metrics import Metrics
+
+class Normalizer(object):
+  """Run the plugins over the files that match them before comparing
+
+  Every file is normalized once into its own directory so the file that
+  was compared is never rewritten. The output is cached by the digest of
+  the original content so identical files are only normalized once.
+  """
+  def __init__(self, directory, plugins=PLUGINS, metrics=None):
+    """Initialize the normalizer
+
+    :param directory: Where the normalized files are written
+    :param plugins: The Plugins object to use
+    :param metrics: The Metrics the stripping is counted in
+    """
+    self.directory = directory
+    self.plugins = plugins
+    self.metrics = metrics or Metrics()
+    self.cache_dir = os.path.join(directory, ".cache")
+    self.lock = threading.Lock()
+    self.normalized = 0
+    self.reused = 0
+    if not os.path.exists(self.cache_dir):
+      os.makedirs(self.cache_dir)
+
+  def matches(self, path):
+    """Check whether a path has to be normalized
+
+    :param path: The relative path to check
+    :return: True if any plugin with a strip_hook matches the path
+    """
+    return any(getattr(plugin, "strip_hook", None)
+               for plugin in self.plugins.match(path))
+
+  def _cached(self, full_path, plugins):
+    """Get the normalized content of a file from the cache
+
+    :param full_path: The file to normalize
+    :param plugins: The plugins to run on the file
+    :return: The path of the normalized content in the cache
+    """
+    digest = digest_file(full_path)
+    if not digest:
+      return None
+    names = "-".join(sorted(plugin.__class__.__name__ for plugin in plugins))
+    cached = os.path.join(self.cache_dir, "{}.{}".format(digest, names))
+    if os.path.exists(cached):
+      with self.lock:
+        self.reused += 1
+      return cached
+
+    tmp_path = "{}.{}.tmp".format(cached, threading.current_thread().ident)
+    shutil.copyfile(full_path, tmp_path)
+    self.metrics.count('bytes_normalized', os.path.getsize(tmp_path))
+    with self.metrics.timer('strip'):
+      for plugin in plugins:
+        plugin.strip_hook(tmp_path)
+    os.rename(tmp_path, cached)
+    self.metrics.count('files_stripped')
+    with self.lock:
+      self.normalized += 1
+    return cached
+
+  def normalize(self, paths, path, dest_dir):
+    """Normalize a path of a Paths object
+
+    :param paths: The Paths object the path belongs to
+    :param path: The relative path to normalize
+    :param dest_dir: Where to place the normalized file
+    :return: The full path of the normalized file or None if the path
+             doesn't have to be normalized
+    """
+    plugins = [plugin for plugin in self.plugins.match(path)
+               if getattr(plugin, "strip_hook", None)]
+    if not plugins:
+      return None
+    full_path = os.path.join(paths.base, path)
+    cached = self._cached(full_path, plugins)
+    if not cached:
+      logger.error("Unable to normalize {}".format(full_path))
+      return None
+
+    result = os.path.join(dest_dir, path)
+    result_dir = os.path.dirname(result)
+    if not os.path.exists(result_dir):
+      try:
+        os.makedirs(result_dir)
+      except OSError:
+        # Another worker created it
+        pass
+    try:
+      os.link(cached, result)
+    except OSError:
+      shutil.copyfile(cached, result)
+    logger.debug("{} normalized into {}".format(full_path, result))
+    paths.set_normalized(path, result)
+    return result
@@ -0,0 +1,212 @@
+import os
+import stat
+import errno
+import threading
+import logging
+logger = logging.getLogger('differ.output')
+
+from digest import CHUNK_SIZE
+from metrics import Metrics
+
+def copy_data(src_fd, dest_fd, size):
+  """Copy the data between 2 file descriptors
+
+  The copy is done in the kernel with copy_file_range or sendfile when the
+  os module has them and with reads and writes otherwise.
+
+  :param src_fd: The file descriptor to read from
+  :param dest_fd: The file descriptor to write to
+  :param size: The number of bytes to copy
+  """
+  for name in ['copy_file_range', 'sendfile']:
+    func = getattr(os, name, None)
+    if func is None:
+      continue
+    try:
+      offset = 0
+      while offset < size:
+        if name == 'sendfile':
+          sent = func(dest_fd, src_fd, offset, size - offset)
+        else:
+          sent = func(src_fd, dest_fd, size - offset)
+        if not sent:
+          break
+        offset += sent
+      if offset >= size:
+        return
+    except OSError as exc:
+      if exc.errno not in (errno.EINVAL, errno.ENOSYS, errno.EXDEV,
+                           errno.ENOTSUP, errno.EBADF):
+        raise
+    # Start over with the next way of copying
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    os.lseek(dest_fd, 0, os.SEEK_SET)
+    os.ftruncate(dest_fd, 0)
+  while True:
+    data = os.read(src_fd, CHUNK_SIZE)
+    if not data:
+      break
+    while data:
+      written = os.write(dest_fd, data)
+      data = data[written:]
+
+class OutputWriter(object):
+  """Write the artifacts of the differ into the output directory
+
+  The directories that were created are remembered so each one is only
+  created once. Files are copied in process and the small per path
+  records are appended to a single file per category as soon as they are
+  added. close() writes them again sorted by path so the files don't
+  depend on the order the paths were compared in.
+  """
+  def __init__(self, directory, metrics=None, write_records=True):
+    """Initialize the writer
+
+    :param directory: The directory the records are written to
+    :param metrics: The Metrics the writes are counted in
+    :param write_records: Whether to write the records. When False they
+                          are only kept until take_records() hands them
+                          to the writer that writes them
+    """
+    self.directory = directory
+    self.metrics = metrics or Metrics()
+    self.write_records = write_records
+    self.lock = threading.Lock()
+    self.dirs = set()
+    self.records = {}
+    # The open file of each category and its size before any record
+    self.files = {}
+
+  def makedirs(self, path):
+    """Create the parent directory of a path
+
+    :param path: The path whose parent directory is created
+    """
+    dir_path = os.path.dirname(path)
+    if not dir_path or dir_path in self.dirs:
+      return
+    try:
+      os.makedirs(dir_path)
+    except OSError as exc:
+      if exc.errno != errno.EEXIST:
+        raise
+    with self.lock:
+      self.dirs.add(dir_path)
+
+  def copy(self, src, dest):
+    """Copy a file into the output
+
+    Like cp, symlinks are followed and the permissions of the source are
+    used with the umask applied. Anything that is not a regular file has
+    no content to copy and is skipped.
+
+    :param src: The file to copy
+    :param dest: Where to copy it
+    :return: True if the file was copied, False otherwise
+    """
+    try:
+      src_stat = os.stat(src)
+    except OSError as exc:
+      logger.error("Unable to copy {}: {}".format(src, exc))
+      return False
+    if not stat.S_ISREG(src_stat.st_mode):
+      logger.debug("Not copying {} since it is not a regular file".format(
+        src))
+      return False
+    self.makedirs(dest)
+    with self.metrics.timer('output'):
+      src_fd = os.open(src, os.O_RDONLY)
+      try:
+        dest_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                          stat.S_IMODE(src_stat.st_mode))
+        try:
+          copy_data(src_fd, dest_fd, src_stat.st_size)
+        finally:
+          os.close(dest_fd)
+      finally:
+        os.close(src_fd)
+    self.metrics.count('files_copied')
+    self.metrics.count('bytes_copied', src_stat.st_size)
+    return True
+
+  def write(self, data, dest, mode=0644):
+    """Write content held in memory into the output
+
+    :param data: The content to write
+    :param dest: Where to write it
+    :param mode: The permissions of the file with the umask applied
+    :return: True once the file is written
+    """
+    size = len(data)
+    self.makedirs(dest)
+    with self.metrics.timer('output'):
+      dest_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                        stat.S_IMODE(mode))
+      try:
+        while data:
+          written = os.write(dest_fd, data)
+          data = data[written:]
+      finally:
+        os.close(dest_fd)
+    self.metrics.count('files_copied')
+    self.metrics.count('bytes_copied', size)
+    return True
+
+  def record(self, category, path, text):
+    """Add a record about a path to the file of a category
+
+    The record is in the file once this returns, unless the records are
+    not written.
+
+    :param category: The name of the file of the category
+    :param path: The path the record is about
+    :param text: The record
+    :return: The file the record was written to
+    """
+    output = os.path.join(self.directory, category)
+    with self.lock:
+      self.records.setdefault(category, []).append((path, text))
+      if not self.write_records:
+        return output
+      item = self.files.get(category)
+      if item is None:
+        if not os.path.exists(self.directory):
+          os.makedirs(self.directory)
+        fp = open(output, 'a')
+        item = (fp, os.fstat(fp.fileno()).st_size)
+        self.files[category] = item
+      item[0].write("{}: {}\n".format(path, text))
+      item[0].flush()
+    self.metrics.count('records_written')
+    return output
+
+  def take_records(self):
+    """Get the records that were kept and forget them
+
+    :return: List of (category, path, text) in the order they were added
+             for each category
+    """
+    with self.lock:
+      records = self.records
+      self.records = {}
+    return [(category, path, text)
+            for category, items in records.items()
+            for path, text in items]
+
+  def close(self):
+    """Write the records of every category again sorted by path
+
+    The records of a path keep the order they were added in.
+    """
+    with self.lock:
+      records = self.records
+      files = self.files
+      self.records = {}
+      self.files = {}
+    for category, (fp, start) in files.items():
+      items = records[category]
+      items.sort(key=lambda item: item[0])
+      fp.truncate(start)
+      for path, text in items:
+        fp.write("{}: {}\n".format(path, text))
+      fp.close()
@@ -1,10 +1,24 @@
 import os
+import stat
+import errno
+import pipes
+import shutil
 import logging
 logger = logging.getLogger('differ.path')
 
+from archive import parallel_decompressor
+from metrics import Metrics
+from paths import walk
+
 class Path(object):
-  def __init__(self, path):
+  def __init__(self, path, metrics=None):
+    """Initialize the path
+
+    :param path: The archive or directory
+    :param metrics: The Metrics the extraction is counted in
+    """
     self.path = path
+    self.metrics = metrics or Metrics()
     self.name = None
     self.valid = False
     if not path:
@@ -16,10 +30,12 @@ class Path(object):
     self.name = os.path.basename(self.path)
     self.valid = True
 
-  def extract_cmd(self, path):
+  def extract_cmd(self, path, parallel=False):
     """Given a path extract the contents
 
-    :param path: The path to extract
+    :param path: The path to extract. It is quoted in the command
+    :param parallel: Use a multi threaded decompressor for compressed tar
+                     files when there is one on the host
     :return: The command string to run
     """
     cmd = None
@@ -33,9 +49,15 @@ class Path(object):
     }
     if not path:
       return None
+    decompressor = parallel and parallel_decompressor(path)
+    if decompressor:
+      cmd = "tar -I {} -xf {}".format(pipes.quote(" ".join(decompressor)),
+                                      pipes.quote(path))
+      logger.debug("path: {} cmd: {}".format(path, cmd))
+      return cmd
     for exten, prg in exten_dict.items():
       if path.endswith(exten):
-        cmd = "{} {}".format(prg, path)
+        cmd = "{} {}".format(prg, pipes.quote(path))
         logger.debug("path: {} cmd: {}".format(path, cmd))
         return cmd
     return None
@@ -73,7 +95,7 @@ class Path(object):
     if change_dir is not None:
       cmd = "cd {}; {}".format(change_dir, cmd)
     logger.debug("{} cmd {}".format(self.name, cmd))
-    ret = os.system(cmd)
+    ret = self.run(cmd)
     if ret != 0:
       logger.error("Failed to run {}".format(cmd))
       return False
@@ -108,3 +130,121 @@ class Path(object):
         dest_dir))
       return False
     return True
+
+  def link_kept(self, dest_dir, path_filter):
+    """Link the paths of a directory that a filter keeps
+
+    :param dest_dir: The directory to create
+    :param path_filter: The PathFilter of the paths to keep
+    :return: True on success, False otherwise
+    """
+    os.makedirs(dest_dir)
+    try:
+      for rel, record in walk(self.path, False, path_filter):
+        if record is None:
+          logger.error("Unable to stat {}".format(rel))
+          continue
+        src = os.path.join(self.path, rel)
+        dest = os.path.join(dest_dir, rel)
+        if not os.path.isdir(os.path.dirname(dest)):
+          os.makedirs(os.path.dirname(dest))
+        if stat.S_ISLNK(record.mode):
+          os.symlink(os.readlink(src), dest)
+          continue
+        try:
+          os.link(src, dest)
+        except OSError as exc:
+          if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+          if not stat.S_ISREG(record.mode):
+            logger.error("Unable to link {}: {}".format(src, exc))
+            continue
+          shutil.copy2(src, dest)
+    except (IOError, OSError) as exc:
+      logger.error("Failed to copy {} to {}: {}".format(self.path, dest_dir,
+                                                         exc))
+      shutil.rmtree(dest_dir, ignore_errors=True)
+      return False
+    return True
+
+  def run(self, cmd):
+    """Run a shell command and count it
+
+    :param cmd: The command to run
+    :return: The exit status of the command
+    """
+    self.metrics.count('subprocesses')
+    with self.metrics.timer('extract'):
+      return os.system(cmd)
+
+  def extract(self, dest_dir, path_filter=None):
+    """Extract the path straight into the destination directory
+
+    Archives are extracted from where they are without copying them first.
+    Compressed tar files go through pigz, pbzip2 or xz -T0 when the host
+    has them. Directories are copied with link_tree.
+
+    :param dest_dir: The directory to extract into
+    :param path_filter: The PathFilter of the paths of a directory to copy
+    :return: True on success, False otherwise
+    """
+    if not self.valid:
+      logger.error("Path {} is not valid".format(self.path))
+      return False
+    if not dest_dir:
+      logger.error("No directory passed in")
+      return False
+    if os.path.isdir(self.path):
+      return self.link_tree(dest_dir, path_filter)
+
+    cmd = self.extract_cmd(os.path.abspath(self.path), parallel=True)
+    if not cmd:
+      logger.error("{}: No extraction command available".format(self.name))
+      return False
+    if not os.path.exists(dest_dir):
+      os.makedirs(dest_dir)
+    if cmd.startswith('unzip'):
+      cmd = "unzip -q{} -d {}".format(cmd[len('unzip'):], pipes.quote(dest_dir))
+    else:
+      cmd = "{} -C {}".format(cmd, pipes.quote(dest_dir))
+    logger.debug("{} cmd {}".format(self.name, cmd))
+    ret = self.run(cmd)
+    if ret != 0:
+      logger.error("Failed to run {}".format(cmd))
+      return False
+    return True
+
+  def link_tree(self, dest_dir, path_filter=None):
+    """Copy a directory to the destination without copying its data
+
+    The files are hard linked when the destination is on the same file
+    system. Otherwise they are reflinked where the file system supports it
+    and copied where it doesn't. With a filter only the paths it keeps are
+    linked and the directories it excludes are not walked.
+
+    :param dest_dir: The directory to create. It must not exist yet
+    :param path_filter: The PathFilter of the paths to keep
+    :return: True on success, False otherwise
+    """
+    if not self.valid or not os.path.isdir(self.path):
+      logger.error("Path {} is not a directory".format(self.path))
+      return False
+    if not dest_dir or os.path.exists(dest_dir):
+      logger.error("Destination {} is not usable".format(dest_dir))
+      return False
+    if path_filter:
+      with self.metrics.timer('extract'):
+        return self.link_kept(dest_dir, path_filter)
+    src = pipes.quote(self.path.rstrip('/') or '/')
+    dest = pipes.quote(dest_dir)
+    for cmd in ["cp -al {} {}",
+                "cp -a --reflink=auto {} {}",
+                "cp -a {} {}"]:
+      cmd = cmd.format(src, dest)
+      logger.debug("path {} cmd {}".format(self.path, cmd))
+      if self.run("{} 2>/dev/null".format(cmd)) == 0:
+        return True
+      # Start over from scratch with the next way of copying
+      shutil.rmtree(dest_dir, ignore_errors=True)
+    logger.error("Failed to copy {} to {}".format(self.path, dest_dir))
+    return False
@@ -1,21 +1,182 @@
 import os
+import stat
 import logging
+
+from digest import digest_file
 logger = logging.getLogger('differ.paths')
 
-from plugins import PLUGINS
+try:
+  from os import scandir
+except ImportError:
+  try:
+    from scandir import scandir
+  except ImportError:
+    scandir = None
+
+# The file types that can be reported for a path
+FILE_TYPES = {
+  stat.S_IFSOCK: 'socket',
+  stat.S_IFREG:  'regular',
+  stat.S_IFBLK:  'block',
+  stat.S_IFDIR:  'directory',
+  stat.S_IFCHR:  'character_device',
+  stat.S_IFIFO:  'fifo',
+  stat.S_IFLNK:  'symlink',
+}
+
+def get_mode_type(mode):
+  """Get the file type from an os.stat st_mode
+
+  :param mode: The st_mode to check
+  :return: The file type as a string or None if it is not known
+  """
+  return FILE_TYPES.get(stat.S_IFMT(mode))
+
+class StatRecord(object):
+  """The parts of os.stat that are compared for a path"""
+  __slots__ = ('mode', 'size')
+
+  def __init__(self, mode, size):
+    self.mode = mode
+    self.size = size
+
+  def __repr__(self):
+    return "mode={} size={}".format(oct(self.mode), self.size)
+
+  @property
+  def type(self):
+    return get_mode_type(self.mode)
+
+def stat_path(path, follow_symlinks=True):
+  """Get the stat record of a path
+
+  :param path: The full path
+  :param follow_symlinks: Whether to stat the target of a symlink or the
+                          symlink itself
+  :return: The StatRecord or None on error
+  """
+  try:
+    if follow_symlinks:
+      obj = os.stat(path)
+    else:
+      obj = os.lstat(path)
+  except OSError as exc:
+    logger.debug("Unable to stat {}: {}".format(path, exc))
+    return None
+  return StatRecord(obj.st_mode, obj.st_size)
+
+def list_dir(path, follow_symlinks=True):
+  """List a directory with the stat record of every entry
+
+  scandir gets the type of an entry from the directory itself. Without it
+  each entry takes a single lstat and only followed symlinks are looked at
+  again. Symlinks to directories are never entered. They are listed as
+  symlinks when symlinks are not followed and skipped otherwise.
+
+  :param path: The full path of the directory
+  :param follow_symlinks: Whether to stat the target of a symlink or the
+                          symlink itself
+  :return: Generator of (name, StatRecord) where the record of a
+           directory is None
+  """
+  if scandir is None:
+    for name in os.listdir(path):
+      full = os.path.join(path, name)
+      try:
+        obj = os.lstat(full)
+      except OSError as exc:
+        logger.debug("Unable to stat {}: {}".format(full, exc))
+        continue
+      if stat.S_ISDIR(obj.st_mode):
+        yield name, None
+        continue
+      record = StatRecord(obj.st_mode, obj.st_size)
+      if stat.S_ISLNK(obj.st_mode) and follow_symlinks:
+        target = stat_path(full)
+        if target is not None:
+          if stat.S_ISDIR(target.mode):
+            continue
+          record = target
+      yield name, record
+    return
+
+  for entry in scandir(path):
+    try:
+      is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+    except OSError:
+      is_dir = False
+    if is_dir:
+      if not entry.is_symlink():
+        yield entry.name, None
+      continue
+    try:
+      obj = entry.stat(follow_symlinks=follow_symlinks)
+      record = StatRecord(obj.st_mode, obj.st_size)
+    except OSError:
+      # A broken symlink when following symlinks
+      record = stat_path(entry.path, False)
+    yield entry.name, record
+
+def walk(base, follow_symlinks=True, path_filter=None):
+  """Walk a directory and find every path that is not a directory
+
+  The stat of every path is captured while walking so it doesn't have to
+  be looked up again. The directories that the filter excludes are not
+  entered at all.
+
+  :param base: The directory to walk
+  :param follow_symlinks: Whether to stat the target of a symlink or the
+                          symlink itself
+  :param path_filter: The PathFilter of the paths to keep
+  :return: Generator of (path relative to the base, StatRecord)
+  """
+  stack = ['']
+  while stack:
+    rel_dir = stack.pop()
+    try:
+      entries = list_dir(os.path.join(base, rel_dir), follow_symlinks)
+      for name, record in entries:
+        rel = os.path.join(rel_dir, name) if rel_dir else name
+        if record is None:
+          if path_filter and path_filter.prune(rel):
+            logger.debug("Skipping {} and everything under it".format(rel))
+            continue
+          stack.append(rel)
+        else:
+          if path_filter and not path_filter.keep(rel, walked=True):
+            continue
+          yield rel, record
+    except OSError as exc:
+      logger.debug("Unable to read {}: {}".format(rel_dir, exc))
 
 class Paths(object):
-  def __init__(self, path):
+  def __init__(self, path, paths=None, follow_symlinks=True,
+               path_filter=None):
+    """Initialize the paths under a base directory
+
+    :param path: The base directory
+    :param paths: The relative paths under the base. When not passed in the
+                  base directory is walked to find them.
+    :param follow_symlinks: Whether to stat the target of a symlink or the
+                            symlink itself
+    :param path_filter: The PathFilter of the paths to keep
+    """
     self.paths = []
+    self.stats = {}
+    self.digests = {}
+    self.normalized = {}
     self.base = path
-    if path:
-      start = len(path) + 1
-      for root, dirs, files in os.walk(path):
-        for name in files:
-          fname = os.path.join(root, name)
-          logger.debug("base {} fname {}".format(self.base, fname))
-          fpath = fname[start:]
-          self.paths.append(fpath)
+    self.follow_symlinks = follow_symlinks
+    if paths is not None:
+      self.paths = [rel for rel in paths
+                    if not path_filter or path_filter.keep(rel)]
+    elif path and os.path.isdir(path):
+      for rel, record in walk(path, follow_symlinks, path_filter):
+        self.paths.append(rel)
+        self.stats[rel] = record
+      self.paths.sort()
+      logger.debug("base {} has {} paths".format(self.base, len(self.paths)))
+    self.index = set(self.paths)
 
   def __repr__(self):
     return self.base
@@ -26,14 +187,94 @@ class Paths(object):
     :param path: The path to check
     :return: True if path exists in the paths. False otherwise
     """
-    return path in self.paths
+    return path in self.index
+
+  def add(self, path, record=None):
+    """Add a path that was found after the object was created
+
+    :param path: The relative path
+    :param record: The StatRecord of the path when it is known
+    """
+    if path in self.index:
+      return
+    self.paths.append(path)
+    self.index.add(path)
+    if record is not None:
+      self.stats[path] = record
+
+  def reconcile(self, other):
+    """Split the paths between this object and another
+
+    :param other: The Paths object to compare against
+    :return: Tuple of lists (removed, common, added). Removed and common are
+             in the order of this object, added in the order of the other
+    """
+    removed = []
+    common = []
+    for path in self.paths:
+      if path in other.index:
+        common.append(path)
+      else:
+        removed.append(path)
+    added = [path for path in other.paths if path not in self.index]
+    return removed, common, added
+
+  def stat(self, path):
+    """Get the stat record of a path
+
+    The record captured while walking is used. Otherwise the path is looked
+    up once and the record is kept.
+
+    :param path: The path to look for
+    :return: The StatRecord or None if the path can't be found
+    """
+    record = self.stats.get(path)
+    if record is None:
+      record = stat_path(os.path.join(self.base, path), self.follow_symlinks)
+      if record is not None:
+        self.stats[path] = record
+    return record
+
+  def digest(self, path):
+    """Get the digest of the content of a path
+
+    A digest that is already known, like the one of an archive member, is
+    used. Otherwise the path is read once and the digest is kept.
+
+    :param path: The path to look for
+    :return: The hex digest or None if the path can't be read
+    """
+    digest = self.digests.get(path)
+    if digest is None:
+      digest = digest_file(self.get(path))
+      if digest is not None:
+        self.digests[path] = digest
+    return digest
+
+  def set_normalized(self, path, full_path):
+    """Use a normalized copy of a path instead of the path itself
+
+    The mode of the original path is kept but the size is the size of the
+    normalized content.
+
+    :param path: The relative path
+    :param full_path: The full path of the normalized copy
+    """
+    record = self.stat(path)
+    normalized = stat_path(full_path)
+    if record is not None and normalized is not None:
+      self.stats[path] = StatRecord(record.mode, normalized.size)
+    self.digests.pop(path, None)
+    self.normalized[path] = full_path
 
   def get(self, path):
     """Get the full path of the path that is matched
 
     :param path: The path to look for
-    :return: The full path that is matched against.
+    :return: The full path that is matched against. This is the normalized
+             copy of the path when there is one.
     """
-    full = os.path.join(self.base, path)
-    PLUGINS.strip_hook(path, full)
-    return full
+    full = self.normalized.get(path)
+    if full is not None:
+      return full
+    return os.path.join(self.base, path)
@@ -0,0 +1,419 @@
+import os
+import sys
+import Queue
+import tarfile
+import zipfile
+import threading
+import logging
+logger = logging.getLogger('differ.pipeline')
+
+from archive import Archive
+from paths import stat_path
+
+# The number of items each queue holds before its producer waits
+QUEUE_SIZE = 256
+
+# How long to wait for the stages to end when the pipeline is stopped
+POLL_INTERVAL = 0.05
+
+STOP = object()
+
+# Handed back instead of a path when the pipeline failed
+ERROR = object()
+
+class Pipeline(object):
+  """Compare 2 archives while they are being extracted
+
+  The stages run in their own threads and are connected by bounded queues:
+
+  - extract: each archive is read once and every member is handed on as
+    soon as it is extracted
+  - pair: a path is compared as soon as it was extracted from both
+    archives. Once both archives are read the paths left on one side are
+    added, removed or renamed
+  - normalize and compare: the workers normalize the path when a plugin
+    matches it, compare it and remove the extracted files they are done
+    with so the disk usage stays low
+
+  The target of a hard link has to stay on disk until the link is
+  extracted from it. The headers of each tar file are read by one more
+  thread to count the links to every member, and a file is only removed
+  once it is known that no link to it is left to extract. The same thread
+  finds the top level directory stripped from the member names, and the
+  members extracted before it is known are only handed on once it is.
+
+  Followed symlinks are compared by their targets, which may come later in
+  the archive. They are compared once both archives are extracted and
+  their targets stay on disk until the end.
+
+  The changes are handed back in the order the paths are done. When an
+  archive can't be read or a path can't be compared the run fails instead
+  of reporting part of it.
+  """
+  def __init__(self, differ, tracker, queue_size=QUEUE_SIZE):
+    """Initialize the pipeline
+
+    :param differ: The Differ whose paths are compared. Its Paths objects
+                   start empty and are filled as the members are extracted
+    :param tracker: The Progress whose total is set once every path is
+                    known
+    :param queue_size: The number of items each queue holds
+    """
+    self.differ = differ
+    self.tracker = tracker
+    self.members = Queue.Queue(queue_size)
+    self.tasks = Queue.Queue(queue_size)
+    self.results = Queue.Queue()
+    self.stopped = threading.Event()
+    self.threads = []
+    self.lock = threading.Lock()
+    self.error = None
+    self.submitted = 0
+    # For each side the number of hard links to each member, once the
+    # headers were read, the links extracted so far and the files that
+    # were compared but are kept for their links
+    self.links = [None, None]
+    self.linked = [{}, {}]
+    self.held = [set(), set()]
+    # The paths that are a symlink on either side
+    self.symlinks = set()
+    # For each side the top level directory stripped from the member names
+    # once the headers were read
+    self.prefixes = [None, None]
+
+  def put(self, queue, item):
+    """Put an item in a queue unless the pipeline is stopped
+
+    :return: True if the item was put, False if the pipeline was stopped
+    """
+    if self.stopped.is_set():
+      return False
+    queue.put(item)
+    return True
+
+  def get(self, queue):
+    """Get an item from a queue
+
+    :return: The item or STOP if the pipeline was stopped
+    """
+    item = queue.get()
+    if self.stopped.is_set():
+      return STOP
+    return item
+
+  def fail(self, path, exc):
+    """Fail the run because an archive can't be read
+
+    :param path: The path to the archive
+    :param exc: The exception raised while reading it
+    """
+    logger.error("Failed to extract {}: {}".format(path, exc))
+    self.abort()
+
+  def abort(self):
+    """Fail the run with the exception that is being handled
+
+    Only the first exception is raised to the caller.
+    """
+    with self.lock:
+      if self.error is not None:
+        return
+      self.error = sys.exc_info()
+    self.results.put(ERROR)
+
+  def extract(self, side, path, paths):
+    """Extract an archive and hand on every member
+
+    :param side: 0 for path1 and 1 for path2
+    :param path: The path to the archive
+    :param paths: The Paths object the members are extracted into
+    """
+    archive = Archive(path, self.differ.metrics,
+                      path_filter=self.differ.path_filter)
+    dest = paths.base
+    names = []
+    try:
+      for name in archive.iter_extract(dest):
+        names.append(name)
+        prefix = self.prefixes[side]
+        if prefix is None:
+          continue
+        if not self.hand_on(side, archive, paths, dest, prefix, names):
+          break
+      else:
+        # The headers may still be read when the archive is done
+        self.hand_on(side, archive, paths, dest, archive.prefix, names)
+    except (tarfile.TarError, zipfile.BadZipfile, IOError, OSError,
+            EOFError) as exc:
+      self.fail(path, exc)
+    finally:
+      self.put(self.members, (side, STOP))
+
+  def hand_on(self, side, archive, paths, dest, prefix, names):
+    """Hand on the extracted members once the prefix of the archive is known
+
+    The members are extracted with their full names. Once the top level
+    directory that is stripped is known the base of the paths is moved
+    into it and the members are handed on by the names they are compared
+    by.
+
+    :param side: 0 for path1 and 1 for path2
+    :param archive: The Archive being extracted
+    :param paths: The Paths object the members are extracted into
+    :param dest: The directory the archive is extracted into
+    :param prefix: The top level directory that is stripped
+    :param names: List of the full names extracted since the last call. It
+                  is emptied
+    :return: False if the pipeline was stopped, True otherwise
+    """
+    archive.prefix = prefix
+    paths.base = os.path.join(dest, prefix).rstrip('/')
+    items = list(names)
+    del names[:]
+    for item in items:
+      name = archive.final_name(item)
+      if name is None:
+        # Only extracted while it wasn't known whether the filter keeps it
+        with self.lock:
+          self.held[side].add(item[len(prefix):])
+        continue
+      target = archive.links.get(item)
+      if target is not None:
+        target = archive.final_name(target)
+        if target is not None:
+          self.link_extracted(side, target)
+      if not self.put(self.members, (side, name)):
+        return False
+    return True
+
+  def count_links(self, side, path):
+    """Count the links to each member of an archive
+
+    The targets of followed symlinks are counted as having a link that is
+    never extracted so they are only removed by release().
+
+    :param side: 0 for path1 and 1 for path2
+    :param path: The path to the archive
+    """
+    counts = {}
+    follow = self.differ.follow_symlinks
+    archive = Archive(path, self.differ.metrics,
+                      path_filter=self.differ.path_filter)
+    try:
+      for name, target, symlink in archive.iter_links(symlinks=follow):
+        if symlink:
+          counts[target] = float('inf')
+        else:
+          counts[target] = counts.get(target, 0) + 1
+    except (tarfile.TarError, zipfile.BadZipfile, IOError, OSError,
+            EOFError) as exc:
+      self.fail(path, exc)
+      return
+    with self.lock:
+      self.links[side] = counts
+      self.prefixes[side] = archive.prefix
+      released = [name for name in self.held[side]
+                  if not self.has_links(side, name)]
+      self.held[side].difference_update(released)
+    for name in released:
+      self.remove(side, name)
+
+  def has_links(self, side, name):
+    """Check whether links to a member may still have to be extracted
+
+    Must be called with the lock held.
+
+    :param side: 0 for path1 and 1 for path2
+    :param name: The name of the member
+    :return: True if the member has to stay on disk
+    """
+    links = self.links[side]
+    if links is None:
+      return True
+    return links.get(name, 0) > self.linked[side].get(name, 0)
+
+  def link_extracted(self, side, target):
+    """Remove the target of a hard link once its last link is extracted
+
+    :param side: 0 for path1 and 1 for path2
+    :param target: The name of the member the link points to
+    """
+    with self.lock:
+      linked = self.linked[side]
+      linked[target] = linked.get(target, 0) + 1
+      if target not in self.held[side] or self.has_links(side, target):
+        return
+      self.held[side].discard(target)
+    self.remove(side, target)
+
+  def pair(self):
+    """Hand on a path to compare once both sides of it are extracted"""
+    differ = self.differ
+    objs = [differ.path1_obj, differ.path2_obj]
+    running = len(objs)
+    # The followed symlinks of each side, added once every target is there
+    links = []
+    while running:
+      item = self.get(self.members)
+      if item is STOP:
+        return
+      side, path = item
+      if path is STOP:
+        running -= 1
+        continue
+      obj = objs[side]
+      full = os.path.join(obj.base, path)
+      if differ.follow_symlinks and os.path.islink(full):
+        # The target may not be extracted yet so it is looked up later
+        self.symlinks.add(path)
+        links.append((side, path))
+        continue
+      obj.add(path, stat_path(full, differ.follow_symlinks))
+      if objs[1 - side].has(path) and path not in self.symlinks:
+        self.submit(differ.compare, path)
+
+    # Every target of the symlinks is extracted now. A symlink to a
+    # directory is skipped like walk() skips it
+    for side, path in links:
+      record = stat_path(os.path.join(objs[side].base, path))
+      if record is not None and record.type == 'directory':
+        logger.debug("Skipping {} since it points to a directory".format(
+          path))
+        continue
+      objs[side].add(path, record)
+    for path in sorted(self.symlinks):
+      if differ.path1_obj.has(path) and differ.path2_obj.has(path):
+        self.submit(differ.compare, path)
+    # What is left was only in one of the archives
+    removed, common, added = differ.path1_obj.reconcile(differ.path2_obj)
+    removed = differ.match_renames(removed, added)
+    # Every path is known now
+    self.tracker.total = self.submitted + len(removed) + len(added)
+    for path in removed:
+      self.submit(differ.deleted, path)
+    for path in added:
+      self.submit(differ.renamed if path in differ.renames else differ.added,
+                  path)
+    for _ in range(differ.jobs):
+      self.put(self.tasks, STOP)
+
+  def submit(self, func, path):
+    self.submitted += 1
+    self.put(self.tasks, (func, path))
+
+  def work(self):
+    """Normalize and compare the paths until there are none left"""
+    differ = self.differ
+    while True:
+      task = self.get(self.tasks)
+      if task is STOP:
+        self.results.put(STOP)
+        return
+      func, path = task
+      try:
+        differ.normalize_path(path)
+        func(path)
+      except Exception as exc:
+        # The path was not compared so the run fails instead of reporting it
+        logger.error("Failed to compare {}: {}".format(path, exc))
+        self.abort()
+        return
+      self.cleanup(func, path)
+      self.results.put(path)
+
+  def cleanup(self, func, path):
+    """Remove the extracted files of a path once they are not needed
+
+    :param func: The task that was run for the path
+    :param path: The path
+    """
+    differ = self.differ
+    names = [(0, path), (1, path)]
+    if func == differ.renamed:
+      names.append((0, differ.renames[path].source))
+    for side, name in names:
+      with self.lock:
+        if self.has_links(side, name):
+          self.held[side].add(name)
+          continue
+      self.remove(side, name)
+
+  def release(self):
+    """Remove the files that were kept for links that never came"""
+    with self.lock:
+      held = [(side, name) for side in range(2) for name in self.held[side]]
+      self.held = [set(), set()]
+    for side, name in held:
+      self.remove(side, name)
+
+  def remove(self, side, name):
+    """Remove an extracted file
+
+    :param side: 0 for path1 and 1 for path2
+    :param name: The relative path of the file
+    """
+    obj = [self.differ.path1_obj, self.differ.path2_obj][side]
+    try:
+      os.remove(os.path.join(obj.base, name))
+    except OSError:
+      pass
+
+  def start(self):
+    """Start every stage"""
+    differ = self.differ
+    targets = [
+      (self.count_links, (0, differ.path1.path)),
+      (self.count_links, (1, differ.path2.path)),
+      (self.extract, (0, differ.path1.path, differ.path1_obj)),
+      (self.extract, (1, differ.path2.path, differ.path2_obj)),
+      (self.pair, ()),
+    ]
+    targets.extend((self.work, ()) for _ in range(differ.jobs))
+    for target, args in targets:
+      thread = threading.Thread(target=target, args=args)
+      thread.daemon = True
+      thread.start()
+      self.threads.append(thread)
+
+  def stop(self):
+    """Stop every stage and wait for them
+
+    The queues are emptied so no stage stays blocked on a full queue and
+    every stage that waits on a queue is woken up.
+    """
+    self.stopped.set()
+    while any(thread.is_alive() for thread in self.threads):
+      for queue in [self.members, self.tasks]:
+        try:
+          while True:
+            queue.get_nowait()
+        except Queue.Empty:
+          pass
+        try:
+          for _ in range(self.differ.jobs):
+            queue.put_nowait(STOP)
+        except Queue.Full:
+          pass
+      for thread in self.threads:
+        thread.join(POLL_INTERVAL)
+
+  def run(self):
+    """Run the pipeline
+
+    :return: Generator of the paths as they are done
+    """
+    self.start()
+    try:
+      running = self.differ.jobs
+      while running:
+        path = self.results.get()
+        if path is ERROR:
+          exc_type, exc_value, exc_tb = self.error
+          raise exc_type, exc_value, exc_tb
+        if path is STOP:
+          running -= 1
+          continue
+        yield path
+      self.release()
+    finally:
+      self.stop()
@@ -4,14 +4,72 @@ import inspect
 import imp
 import pkgutil
 import re
+import threading
+import importlib
 
 import logging
 logger = logging.getLogger("differ.plugins")
 
+# Setuptools entry point group for plugins from other packages. The name of
+# the entry point is the path regex and it points to the plugin class:
+#
+#   entry_points={'differ.plugins': ['.*sshd.* = mypkg.sshd:SshdStrip']}
+ENTRY_POINT_GROUP = 'differ.plugins'
+
+def declares_entry_points(group, paths=None):
+  """Check whether an installed distribution declares entry points
+
+  The entry_points.txt metadata of the distributions on the path is read
+  the way pkg_resources finds it, without importing pkg_resources. A zipped
+  egg can't be read this way so it is assumed to declare them.
+
+  :param group: The entry point group
+  :param paths: The directories to look in. Defaults to sys.path
+  :return: True if an entry_points.txt has the group
+  """
+  header = "[{}]".format(group)
+  for directory in sys.path if paths is None else paths:
+    directory = directory or '.'
+    if os.path.isfile(directory):
+      # A zipped egg on the path
+      if directory.endswith('.egg'):
+        return True
+      continue
+    candidates = [os.path.join(directory, 'EGG-INFO')]
+    try:
+      candidates.extend(os.path.join(directory, name)
+                        for name in os.listdir(directory)
+                        if name.endswith(('.egg-info', '.dist-info', '.egg')))
+    except OSError:
+      continue
+    for candidate in candidates:
+      if candidate.endswith('.egg') and os.path.isfile(candidate):
+        return True
+      for path in [os.path.join(candidate, 'entry_points.txt'),
+                   os.path.join(candidate, 'EGG-INFO', 'entry_points.txt')]:
+        try:
+          with open(path) as fp:
+            if any(line.strip() == header for line in fp):
+              return True
+        except IOError:
+          continue
+  return False
+
 class Plugins(object):
-  def __init__(self):
+  def __init__(self, entry_points=False):
+    """Initialize the plugins
+
+    :param entry_points: Whether to also register the plugins of the
+                         ENTRY_POINT_GROUP entry points
+    """
     self.plugins = {}
     self.paths = {}
+    self.entry_points = entry_points
+    self.lock = threading.RLock()
+    self._combined = None
+    self._compiled = []
+    self._matches = {}
+    self._loaded = {}
 
   def get_plugins(self):
     """Retrieve all the available plugins in the plugins directory"""
@@ -40,7 +98,88 @@ class Plugins(object):
     :param parsers: A passed in dictionary of parsers
     :ptype parsers: dict
     """
-    self.paths.update(parsers)
+    with self.lock:
+      self.paths.update(parsers)
+      self._combined = None
+      self._matches = {}
+
+  def register(self, path_regex, spec):
+    """Register a plugin which is only loaded once a path matches it
+
+    :param path_regex: The regex of the paths the plugin handles
+    :param spec: 'module:Class' where the module is either a module of this
+                 package or an absolute module name
+    """
+    self.add_parsers({path_regex: spec})
+
+  def _load_entry_points(self):
+    """Register the plugins of the entry points
+
+    The entry points are only listed here and are loaded once a path
+    matches them. pkg_resources takes longer to import than the rest of
+    the differ so it is only imported when an installed distribution
+    declares entry points of the group.
+    """
+    if not declares_entry_points(ENTRY_POINT_GROUP):
+      logger.debug("No distribution has {} entry points".format(
+        ENTRY_POINT_GROUP))
+      return
+    try:
+      import pkg_resources
+    except ImportError:
+      logger.debug("pkg_resources is not available for entry points")
+      return
+    for entry_point in pkg_resources.iter_entry_points(ENTRY_POINT_GROUP):
+      logger.debug("Registering entry point {}".format(entry_point))
+      self.paths.setdefault(entry_point.name, entry_point)
+
+  def load(self, spec):
+    """Load a plugin that was registered lazily
+
+    :param spec: The plugin object, 'module:Class' or an entry point
+    :return: The plugin object or None if it can't be loaded
+    """
+    if not isinstance(spec, basestring) and not hasattr(spec, 'load'):
+      return spec
+    with self.lock:
+      if spec in self._loaded:
+        return self._loaded[spec]
+      plugin = None
+      try:
+        if hasattr(spec, 'load'):
+          cls = spec.load()
+        else:
+          module_name, class_name = spec.split(':')
+          try:
+            module = importlib.import_module('.' + module_name, __name__)
+          except ImportError:
+            module = importlib.import_module(module_name)
+          cls = getattr(module, class_name)
+        plugin = cls()
+        self.add(plugin)
+        logger.debug("Loaded plugin {}".format(spec))
+      except (ImportError, AttributeError, ValueError) as exc:
+        logger.error("Unable to load plugin {}: {}".format(spec, exc))
+      self._loaded[spec] = plugin
+      return plugin
+
+  def _compile(self):
+    """Compile the path regexes of the plugins
+
+    All of the regexes are combined into a single regex so a path that
+    doesn't match any plugin is rejected with one match.
+    """
+    with self.lock:
+      if self._combined is not None:
+        return
+      if self.entry_points:
+        self._load_entry_points()
+        self.entry_points = False
+      regexes = sorted(self.paths)
+      self._compiled = [(re.compile(regex), self.paths[regex])
+                        for regex in regexes]
+      self._combined = re.compile("|".join("(?:{})".format(regex)
+                                           for regex in regexes) or "(?!)")
 
   def get(self, name):
     """Retrieve a plugin by its name
@@ -48,11 +187,42 @@ class Plugins(object):
     :return: A plugin object or None if not found
     """
     item = self.plugins.get(name)
+    if not item:
+      for spec in self.paths.values():
+        if (isinstance(spec, basestring) and
+            spec.split(':')[-1] == name):
+          item = self.load(spec)
+          break
     if not item:
       print("No such plugin by name {}".format(name))
       return None
     return item
 
+  def match(self, path):
+    """Get the plugins whose path regex matches the path
+
+    The result is remembered for every path so a path is only matched
+    once.
+
+    :param path: The path to check
+    :return: List of plugins that match the path
+    """
+    result = self._matches.get(path)
+    if result is not None:
+      return result
+    if self._combined is None:
+      self._compile()
+    result = []
+    if self._combined.match(path):
+      result = [self.load(spec) for regex, spec in self._compiled
+                if regex.match(path)]
+      result = [plugin for plugin in result if plugin is not None]
+      logger.debug("{} matched plugins {}".format(
+        path,
+        [plugin.__class__.__name__ for plugin in result]))
+    self._matches[path] = result
+    return result
+
   def strip_hook(self, path, full_path):
     """Hook to strip the path passed in
 
@@ -62,17 +232,17 @@ class Plugins(object):
 
     :param path: The path to check
     :param full_path: The full path of the file to strip
+    :return: List of the plugins that stripped the file
     """
-    for path_regex, plugin in self.paths.items():
-      if re.match(path_regex, path):
-        # Run the strip_hook if it exists
-        if getattr(plugin, "strip_hook"):
-          plugin.strip_hook(full_path)
-
-PLUGINS = Plugins()
-PLUGINS.get_plugins()
-
-# Define default paths
-PLUGINS.add_parsers({
-  '.*iptables.*': PLUGINS.get("IptablesStrip"),
-})
+    stripped = []
+    for plugin in self.match(path):
+      # Run the strip_hook if it exists
+      if getattr(plugin, "strip_hook"):
+        plugin.strip_hook(full_path)
+        stripped.append(plugin)
+    return stripped
+
+PLUGINS = Plugins(entry_points=True)
+
+# Define default paths. The plugins are only imported once a path matches.
+PLUGINS.register('.*iptables.*', 'strip_iptables_counters:IptablesStrip')
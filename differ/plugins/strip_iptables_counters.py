@@ -1,5 +1,9 @@
-import os
 import re
+import logging
+logger = logging.getLogger("differ.plugins")
+
+# The counters at the start of the lines of iptables -L -v -n
+COUNTERS = re.compile(" *pkts *bytes| *[0-9]*  *[0-9]*")
 
 class IptablesStrip(object):
   def strip_hook(self, path):
@@ -8,28 +12,15 @@ class IptablesStrip(object):
     :param path: The path to strip
     """
 
-    print("Stripping for iptables {}".format(path))
-
-    matches = [
-      " *pkts *bytes",
-      " *[0-9]*  *[0-9]*",
-    ]
+    logger.debug("Stripping for iptables {}".format(path))
 
-    # Save the original
-    os.system("cp {} {}.orig".format(path, path))
     with open(path, "r") as fp:
       lines = fp.readlines()
     with open(path, "w") as fp:
       for line in lines:
         line = line.rstrip()
-        found = False
-        for match in matches:
-          obj = re.match(match, line)
-          if obj:
-            if match:
-              fp.write(line[len(obj.group(0)) + 1:] + '\n')
-              found = True
-              break
-        if found:
+        obj = COUNTERS.match(line)
+        if obj:
+          fp.write(line[len(obj.group(0)) + 1:] + '\n')
           continue
         fp.write(line + '\n')
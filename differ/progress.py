@@ -0,0 +1,90 @@
+from __future__ import print_function
+import sys
+import time
+import logging
+logger = logging.getLogger('differ.progress')
+
+class Progress(object):
+  """Track how many paths have been processed
+
+  The callback is called with this object at most once per interval and
+  once more when the last path is done. The total can be None while it is
+  not known yet, there is no ETA until it is set.
+  """
+  def __init__(self, total, callback=None, interval=0.5):
+    """Initialize the progress
+
+    :param total: The number of paths that will be processed or None when
+                  it is not known yet
+    :param callback: Function called with the Progress object
+    :param interval: The minimum number of seconds between 2 calls
+    """
+    self.total = total
+    self.done = 0
+    self.callback = callback
+    self.interval = interval
+    self.start = time.time()
+    self.last = None
+
+  def __repr__(self):
+    eta = self.eta
+    return "{}/{} paths {:.1f} files/s ETA {}".format(
+      self.done,
+      self.total if self.total is not None else "?",
+      self.rate,
+      "{:.1f}s".format(eta) if eta is not None else "unknown")
+
+  @property
+  def elapsed(self):
+    return time.time() - self.start
+
+  @property
+  def rate(self):
+    """The number of paths processed per second"""
+    elapsed = self.elapsed
+    if not elapsed:
+      return 0.0
+    return self.done / elapsed
+
+  @property
+  def eta(self):
+    """The number of seconds until every path is processed
+
+    :return: The estimate or None if nothing was processed yet or the
+             total is not known
+    """
+    rate = self.rate
+    if not rate or self.total is None:
+      return None
+    return (self.total - self.done) / rate
+
+  @property
+  def finished(self):
+    """Whether every path is processed"""
+    return self.total is not None and self.done >= self.total
+
+  def update(self, count=1):
+    """Mark paths as processed
+
+    :param count: The number of paths processed
+    """
+    self.done += count
+    if self.callback is None:
+      return
+    now = time.time()
+    if (not self.finished and self.last is not None and
+        now - self.last < self.interval):
+      return
+    self.last = now
+    self.callback(self)
+
+def print_progress(progress, stream=None):
+  """Print the progress on a single line of stderr
+
+  :param progress: The Progress object
+  :param stream: The file object to write to. Defaults to stderr
+  """
+  stream = stream or sys.stderr
+  end = "\n" if progress.finished else ""
+  stream.write("\r{}{}".format(progress, end))
+  stream.flush()
@@ -0,0 +1,187 @@
+import logging
+logger = logging.getLogger('differ.renames')
+
+from digest import CHUNK_SIZE
+from udiff import LineMatcher
+
+# Files bigger than this are only matched when their content is identical
+MAX_SIMILARITY_SIZE = 1024 * 1024
+
+# The number of added files each removed file is scored against
+MAX_CANDIDATES = 64
+
+class Rename(object):
+  """A removed path that was found again at an added path"""
+  __slots__ = ('source', 'path', 'score')
+
+  def __init__(self, source, path, score=1.0):
+    """Initialize the rename
+
+    :param source: The path that was removed
+    :param path: The path that was added
+    :param score: How similar the content is from 0 to 1. 1 when the
+                  content is identical
+    """
+    self.source = source
+    self.path = path
+    self.score = score
+
+  def __repr__(self):
+    return "{} => {} score={:.2f}".format(self.source, self.path, self.score)
+
+def read_lines(path):
+  try:
+    with open(path, 'rb') as fp:
+      return fp.readlines()
+  except (IOError, OSError) as exc:
+    logger.debug("Unable to read {}: {}".format(path, exc))
+    return None
+
+def count_lines(path):
+  """Count the lines of a file the way read_lines() splits them
+
+  :param path: The file
+  :return: The number of lines or None if the file can't be read
+  """
+  count = 0
+  last = '\n'
+  try:
+    with open(path, 'rb') as fp:
+      while True:
+        data = fp.read(CHUNK_SIZE)
+        if not data:
+          break
+        count += data.count('\n')
+        last = data[-1]
+  except (IOError, OSError) as exc:
+    logger.debug("Unable to read {}: {}".format(path, exc))
+    return None
+  if last != '\n':
+    count += 1
+  return count
+
+def similarity(path1, path2, threshold=None, lines1=None):
+  """Get how similar the lines of 2 files are
+
+  The lines both files have, whatever their order, are counted first. That
+  is the most the ratio can be so the lines are only matched in order when
+  it reaches the threshold.
+
+  :param path1: The first file
+  :param path2: The second file
+  :param threshold: The ratio under which the files are not matched in
+                    order
+  :param lines1: The lines of the first file when they were already read
+  :return: The ratio of matching lines from 0 to 1. Only an upper bound
+           when it is under the threshold
+  """
+  if lines1 is None:
+    lines1 = read_lines(path1)
+  lines2 = read_lines(path2)
+  if not lines1 or not lines2:
+    return 0.0
+  matcher = LineMatcher(lines1, lines2)
+  ratio = matcher.quick_ratio()
+  if threshold is not None and ratio < threshold:
+    return ratio
+  return matcher.ratio()
+
+def regular_sizes(obj, paths):
+  """Get the size of the regular files among paths
+
+  Empty files are left out since every one of them would match.
+
+  :param obj: The Paths object the paths are from
+  :param paths: The relative paths
+  :return: Dictionary of path to size
+  """
+  sizes = {}
+  for path in paths:
+    record = obj.stat(path)
+    if record is not None and record.type == 'regular' and record.size:
+      sizes[path] = record.size
+  return sizes
+
+def find_renames(path1_obj, removed, path2_obj, added, threshold=None):
+  """Match the removed paths with the added paths
+
+  The paths are bucketed by size first so only the files that have the
+  same size as a file on the other side are hashed. When a threshold is
+  given the files that are left are also matched by the similarity of
+  their lines.
+
+  :param path1_obj: The Paths object of the removed paths
+  :param removed: The removed paths
+  :param path2_obj: The Paths object of the added paths
+  :param added: The added paths
+  :param threshold: The minimum similarity from 0 to 1 of a rename whose
+                    content changed. None to only find identical content
+  :return: List of Rename in the order of the added paths
+  """
+  sizes1 = regular_sizes(path1_obj, removed)
+  sizes2 = regular_sizes(path2_obj, added)
+  buckets = {}
+  for path in removed:
+    if path in sizes1:
+      buckets.setdefault(sizes1[path], []).append(path)
+
+  renames = {}
+  sources = set()
+  digests = {}
+  for path in added:
+    if path not in sizes2:
+      continue
+    candidates = [source for source in buckets.get(sizes2[path], [])
+                  if source not in sources]
+    if not candidates:
+      continue
+    digest = path2_obj.digest(path)
+    if digest is None:
+      continue
+    for source in candidates:
+      if source not in digests:
+        digests[source] = path1_obj.digest(source)
+      if digests[source] == digest:
+        renames[path] = Rename(source, path)
+        sources.add(source)
+        break
+  logger.debug("Found {} identical renames".format(len(renames)))
+
+  if threshold is not None:
+    scored = []
+    left = [path for path in added
+            if path in sizes2 and path not in renames and
+            sizes2[path] <= MAX_SIMILARITY_SIZE]
+    counts = {}
+    for source in removed:
+      size = sizes1.get(source)
+      if source in sources or size is None or size > MAX_SIMILARITY_SIZE:
+        continue
+      lines = read_lines(path1_obj.get(source))
+      if not lines:
+        continue
+      # At most every line of the shorter file matches, so twice its number
+      # of lines over the lines of both files is the most the ratio can be
+      candidates = []
+      for path in left:
+        if path not in counts:
+          counts[path] = count_lines(path2_obj.get(path))
+        count = counts[path]
+        if (count and 2.0 * min(len(lines), count) >=
+            threshold * (len(lines) + count)):
+          candidates.append(path)
+      candidates.sort(key=lambda path: abs(sizes2[path] - size))
+      for path in candidates[:MAX_CANDIDATES]:
+        score = similarity(path1_obj.get(source), path2_obj.get(path),
+                           threshold, lines)
+        if score >= threshold:
+          scored.append((score, source, path))
+    # The best matches are used first and each path is used once
+    scored.sort(key=lambda item: -item[0])
+    for score, source, path in scored:
+      if source in sources or path in renames:
+        continue
+      renames[path] = Rename(source, path, score)
+      sources.add(source)
+    logger.debug("Found {} renames in total".format(len(renames)))
+  return [renames[path] for path in added if path in renames]
@@ -0,0 +1,104 @@
+from __future__ import print_function
+import sys
+import json
+import logging
+logger = logging.getLogger('differ.report')
+
+from changes import CHANGE_STATE, state_names
+
+def to_text(value):
+  """Decode the byte strings of a JSON record
+
+  Paths are byte strings that may not be UTF-8, the bytes that can't be
+  decoded are replaced so the record can always be written.
+
+  :param value: The value to decode, dictionaries and lists are decoded
+                recursively
+  :return: The value with text instead of byte strings
+  """
+  if isinstance(value, bytes):
+    return value.decode('utf-8', 'replace')
+  if isinstance(value, dict):
+    return dict((to_text(key), to_text(item)) for key, item in value.items())
+  if isinstance(value, (list, tuple)):
+    return [to_text(item) for item in value]
+  return value
+
+class TextReport(object):
+  """Report the changes as text lines"""
+  def __init__(self, stream=None):
+    """Initialize the report
+
+    :param stream: The file object to write to. Defaults to stdout
+    """
+    self.stream = stream or sys.stdout
+
+  def section(self, title):
+    """Start a section of the report, like one pair of a series
+
+    :param title: The title of the section
+    """
+    print("=== {}".format(title), file=self.stream)
+
+  def change(self, change):
+    """Report a change once the path it is about has been compared
+
+    :param change: The Change to report
+    """
+    if change.state & CHANGE_STATE.REMOVED:
+      print("{} was removed".format(change.path), file=self.stream)
+    elif change.state & CHANGE_STATE.ADD:
+      print("{} was added".format(change.path), file=self.stream)
+    elif change.state & CHANGE_STATE.RENAMED:
+      print("{} was renamed from {}".format(change.path, change.source),
+            file=self.stream)
+
+  def summary(self, results, text):
+    """Report the summary once everything has been compared
+
+    :param results: Dictionary of the summary values
+    :param text: The summary as text
+    """
+    print(text, file=self.stream)
+
+class JsonLinesReport(TextReport):
+  """Report every change as a JSON object on its own line
+
+  Each line is flushed as soon as it is written so a consumer can start
+  working on the changes before the differ is done. Bytes of a path that
+  are not UTF-8 are written as U+FFFD.
+  """
+  def record(self, change):
+    """Get the JSON record of a change
+
+    :param change: The Change to convert
+    :return: Dictionary of the record
+    """
+    return {
+      'path': change.path,
+      'state': change.state,
+      'states': state_names(change.state),
+      'size': list(change.size) if change.size else None,
+      'mode': list(change.mode) if change.mode else None,
+      'related': list(change.related),
+      'source': change.source,
+    }
+
+  def write(self, data):
+    self.stream.write(json.dumps(to_text(data), sort_keys=True) + "\n")
+    self.stream.flush()
+
+  def section(self, title):
+    self.write({'section': title})
+
+  def change(self, change):
+    self.write(self.record(change))
+
+  def summary(self, results, text):
+    self.write({'summary': results})
+
+# The report formats that can be selected
+REPORTS = {
+  'text': TextReport,
+  'jsonl': JsonLinesReport,
+}
@@ -0,0 +1,125 @@
+from __future__ import print_function
+import os
+import datetime
+import logging
+logger = logging.getLogger('differ.series')
+
+from changes import state_names
+from path import Path
+from paths import Paths
+from report import TextReport
+from utils import Differ, prepare_path
+
+class Series(object):
+  """Compare a chain of snapshots, each one against the one before it
+
+  Every snapshot is extracted and walked once. The Paths object of a
+  snapshot, with the stat and digest of its files, is shared by the 2
+  comparisons it is part of so no file is read more than once for its
+  digest.
+  """
+  def __init__(self, paths, base="diff_output", jobs=1, follow_symlinks=True,
+               in_place=False, report=None, renames=False, similarity=None,
+               path_filter=None):
+    """Initialize the series
+
+    :param paths: The snapshots in order
+    :param base: Where to store the output
+    :param jobs: The number of paths to compare at the same time
+    :param follow_symlinks: Compare the targets of symlinks. When False the
+                            symlinks themselves are compared
+    :param in_place: Compare directories where they are instead of copying
+                     them
+    :param report: The report the changes are written to. Defaults to a
+                   TextReport on stdout
+    :param renames: Report the files that moved as renamed
+    :param similarity: The minimum similarity of a renamed file whose
+                       content also changed. Setting it also enables renames
+    :param path_filter: The PathFilter of the paths to compare
+    """
+    self.paths = [Path(path) for path in paths]
+    self._valid = (len(self.paths) > 1 and
+                   all(path.valid for path in self.paths))
+    self.jobs = jobs
+    self.follow_symlinks = follow_symlinks
+    self.in_place = in_place
+    self.report = report or TextReport()
+    self.renames = renames
+    self.similarity = similarity
+    self.path_filter = path_filter
+    self.snapshots = []
+    self.differs = []
+    self.timeline = {}
+
+    base_dir = os.getcwd()
+    if base is not None:
+      base_dir = base
+    if not os.path.exists(base_dir):
+      os.mkdir(base_dir)
+    self.series_dir = os.path.join(base_dir, "series.{}_{}.{}".format(
+      self.paths[0].name if self.paths else None,
+      self.paths[-1].name if self.paths else None,
+      datetime.datetime.now().strftime("%Y%m%d_%H%M%S")))
+    self.timeline_path = os.path.join(self.series_dir, "timeline")
+
+  def __repr__(self):
+    if not self._valid:
+      return "NOT VALID: {}".format(" ".join(path.path for path in self.paths))
+    return "Series {}".format(" -> ".join(path.name for path in self.paths))
+
+  def setup(self):
+    """Extract and walk every snapshot once"""
+    os.mkdir(self.series_dir)
+    for index, path in enumerate(self.paths):
+      path_dir = os.path.join(self.series_dir, "snapshots", str(index))
+      base = prepare_path(path, path_dir, self.in_place, self.path_filter)
+      self.snapshots.append(Paths(base,
+        follow_symlinks=self.follow_symlinks,
+        path_filter=self.path_filter))
+      logger.debug("Snapshot {} {} has {} paths".format(
+        index,
+        path.path,
+        len(self.snapshots[-1].paths)))
+
+  def start(self):
+    """Compare every snapshot with the one before it"""
+    self.setup()
+    for index in range(len(self.paths) - 1):
+      path1 = self.paths[index]
+      path2 = self.paths[index + 1]
+      self.report.section("{} -> {}".format(path1.path, path2.path))
+      # Each pair gets its own base so pairs with the same names don't
+      # collide
+      differ = Differ(path1.path, path2.path,
+        base=os.path.join(self.series_dir, str(index)),
+        jobs=self.jobs,
+        follow_symlinks=self.follow_symlinks,
+        report=self.report,
+        renames=self.renames,
+        similarity=self.similarity,
+        digests=True,
+        path_filter=self.path_filter,
+        prepared=(self.snapshots[index], self.snapshots[index + 1]))
+      differ.start()
+      self.differs.append(differ)
+      for change in differ.changes:
+        self.timeline.setdefault(change.path, []).append((index, change))
+    self.write_timeline()
+
+  def write_timeline(self):
+    """Write the changes of every path across the series
+
+    :return: The path to the timeline
+    """
+    with open(self.timeline_path, 'w') as fp:
+      for path in sorted(self.timeline):
+        fp.write("{}\n".format(path))
+        for index, change in self.timeline[path]:
+          fp.write("  {} -> {}: {}\n".format(
+            self.paths[index].name,
+            self.paths[index + 1].name,
+            ", ".join(state_names(change.state))))
+    logger.info("{} paths changed across the series, see {}".format(
+      len(self.timeline),
+      self.timeline_path))
+    return self.timeline_path
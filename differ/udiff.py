@@ -0,0 +1,344 @@
+import os
+import time
+import difflib
+import hashlib
+import logging
+logger = logging.getLogger('differ.udiff')
+
+# Files bigger than this are diffed without keeping their lines in memory
+LOW_MEMORY_SIZE = 64 * 1024 * 1024
+
+NO_NEWLINE = b"\\ No newline at end of file\n"
+
+# The number of edits a part of the diff may take before the lines left in
+# it are written as a single change, which bounds the time spent on files
+# that have little in common
+MAX_EDIT_COST = 2048
+
+class MemoryLines(object):
+  """The lines of a file held in memory"""
+  def __init__(self, path):
+    self.lines = []
+    if path and os.path.exists(path):
+      with open(path, 'rb') as fp:
+        self.lines = fp.readlines()
+    self.keys = self.lines
+
+  def get(self, start, stop):
+    return self.lines[start:stop]
+
+  def close(self):
+    pass
+
+class DataLines(MemoryLines):
+  """The lines of content that is already in memory"""
+  def __init__(self, data):
+    self.lines = data.splitlines(True)
+    self.keys = self.lines
+
+class IndexedLines(object):
+  """The lines of a file held as digests and offsets
+
+  Only a digest and the offset of every line is kept in memory. The lines
+  are read back from the file when a hunk that contains them is written.
+  """
+  def __init__(self, path):
+    self.keys = []
+    self.offsets = []
+    self.fp = open(path, 'rb')
+    offset = 0
+    for line in self.fp:
+      self.keys.append(hashlib.md5(line).digest())
+      self.offsets.append(offset)
+      offset += len(line)
+
+  def get(self, start, stop):
+    if start >= stop:
+      return []
+    self.fp.seek(self.offsets[start])
+    return [self.fp.readline() for _ in range(stop - start)]
+
+  def close(self):
+    self.fp.close()
+
+def bisect(keys1, keys2, a0, a1, b0, b1, max_cost):
+  """Find where to split 2 ranges of lines with Myers' O(ND) algorithm
+
+  The shortest edit script is searched from both ends at the same time
+  until the paths meet.
+
+  :param keys1: The keys of the lines to compare from
+  :param keys2: The keys of the lines to compare against
+  :param a0: The first line of the range of keys1
+  :param a1: The line after the range of keys1
+  :param b0: The first line of the range of keys2
+  :param b1: The line after the range of keys2
+  :param max_cost: The number of edits to search before giving up
+  :return: The (x, y) point the ranges are split at or None when the
+           ranges take more than max_cost edits
+  """
+  n = a1 - a0
+  m = b1 - b0
+  max_d = min((n + m + 1) // 2, max_cost)
+  offset = max_d + 1
+  forward = [-1] * (2 * offset + 2)
+  forward[offset + 1] = 0
+  backward = list(forward)
+  delta = n - m
+  front = delta % 2 != 0
+  k1start = k1end = k2start = k2end = 0
+  for d in range(max_d + 1):
+    for k1 in range(-d + k1start, d + 1 - k1end, 2):
+      k1_offset = offset + k1
+      if k1 == -d or (k1 != d and
+                      forward[k1_offset - 1] < forward[k1_offset + 1]):
+        x1 = forward[k1_offset + 1]
+      else:
+        x1 = forward[k1_offset - 1] + 1
+      y1 = x1 - k1
+      while x1 < n and y1 < m and keys1[a0 + x1] == keys2[b0 + y1]:
+        x1 += 1
+        y1 += 1
+      forward[k1_offset] = x1
+      if x1 > n:
+        k1end += 2
+      elif y1 > m:
+        k1start += 2
+      elif front:
+        k2_offset = offset + delta - k1
+        if (0 <= k2_offset < len(backward) and
+            backward[k2_offset] != -1 and x1 >= n - backward[k2_offset]):
+          return a0 + x1, b0 + y1
+    for k2 in range(-d + k2start, d + 1 - k2end, 2):
+      k2_offset = offset + k2
+      if k2 == -d or (k2 != d and
+                      backward[k2_offset - 1] < backward[k2_offset + 1]):
+        x2 = backward[k2_offset + 1]
+      else:
+        x2 = backward[k2_offset - 1] + 1
+      y2 = x2 - k2
+      while (x2 < n and y2 < m and
+             keys1[a1 - x2 - 1] == keys2[b1 - y2 - 1]):
+        x2 += 1
+        y2 += 1
+      backward[k2_offset] = x2
+      if x2 > n:
+        k2end += 2
+      elif y2 > m:
+        k2start += 2
+      elif not front:
+        k1_offset = offset + delta - k2
+        if 0 <= k1_offset < len(forward) and forward[k1_offset] != -1:
+          x1 = forward[k1_offset]
+          y1 = offset + x1 - k1_offset
+          if x1 >= n - x2:
+            return a0 + x1, b0 + y1
+  return None
+
+def match_lines(keys1, keys2, max_cost=MAX_EDIT_COST):
+  """Find the lines that are the same in both sets of lines
+
+  The lines that only one side has can never match so they are left out
+  before the longest common subsequence of the rest is found with Myers'
+  algorithm, the one diff uses. A part of the lines that takes more than
+  max_cost edits is written as a single change instead.
+
+  :param keys1: The keys of the lines to compare from
+  :param keys2: The keys of the lines to compare against
+  :param max_cost: The number of edits to search in each part
+  :return: The matching blocks as (i, j, size) sorted by position and
+           ending with (len(keys1), len(keys2), 0) like
+           SequenceMatcher.get_matching_blocks()
+  """
+  ids = {}
+  common = set(keys1).intersection(keys2)
+  index1 = [i for i, key in enumerate(keys1) if key in common]
+  index2 = [j for j, key in enumerate(keys2) if key in common]
+  # Small integers compare faster than the lines or their digests
+  seq1 = [ids.setdefault(keys1[i], len(ids)) for i in index1]
+  seq2 = [ids.setdefault(keys2[j], len(ids)) for j in index2]
+
+  pairs = []
+  ranges = [(0, len(seq1), 0, len(seq2))]
+  while ranges:
+    a0, a1, b0, b1 = ranges.pop()
+    while a0 < a1 and b0 < b1 and seq1[a0] == seq2[b0]:
+      pairs.append((a0, b0))
+      a0 += 1
+      b0 += 1
+    while a0 < a1 and b0 < b1 and seq1[a1 - 1] == seq2[b1 - 1]:
+      a1 -= 1
+      b1 -= 1
+      pairs.append((a1, b1))
+    if a0 == a1 or b0 == b1:
+      continue
+    split = bisect(seq1, seq2, a0, a1, b0, b1, max_cost)
+    if split is None:
+      continue
+    x, y = split
+    ranges.append((x, a1, y, b1))
+    ranges.append((a0, x, b0, y))
+
+  blocks = []
+  for a, b in sorted(pairs):
+    i = index1[a]
+    j = index2[b]
+    if blocks and blocks[-1][0] + blocks[-1][2] == i and \
+       blocks[-1][1] + blocks[-1][2] == j:
+      blocks[-1][2] += 1
+    else:
+      blocks.append([i, j, 1])
+  blocks = [tuple(block) for block in blocks]
+  blocks.append((len(keys1), len(keys2), 0))
+  return blocks
+
+class LineMatcher(difflib.SequenceMatcher):
+  """A SequenceMatcher that matches lines with match_lines()
+
+  SequenceMatcher looks for the longest matching block at every step which
+  is quadratic on files with many lines that are the same, like empty
+  lines. Only the matching blocks are found another way, the opcodes and
+  their groups are built from them by SequenceMatcher.
+  """
+  def __init__(self, a, b, max_cost=MAX_EDIT_COST):
+    self.a = a
+    self.b = b
+    self.max_cost = max_cost
+    self.matching_blocks = None
+    self.opcodes = None
+    self.fullbcount = None
+
+  def get_matching_blocks(self):
+    if self.matching_blocks is None:
+      self.matching_blocks = match_lines(self.a, self.b, self.max_cost)
+    return self.matching_blocks
+
+def format_time(path):
+  """Format the modification time of a path the way diff does
+
+  :param path: The path to get the time for
+  :return: The time string. The epoch is used for paths that don't exist
+  """
+  mtime = 0
+  if path and os.path.exists(path):
+    mtime = os.stat(path).st_mtime
+  local = time.localtime(mtime)
+  offset = -(time.altzone if local.tm_isdst > 0 else time.timezone)
+  sign = '+' if offset >= 0 else '-'
+  offset = abs(offset) // 60
+  nsec = min(int((mtime - int(mtime)) * 1e9), 999999999)
+  return "{}.{:09d} {}{:02d}{:02d}".format(
+    time.strftime("%Y-%m-%d %H:%M:%S", local),
+    nsec,
+    sign,
+    offset // 60,
+    offset % 60)
+
+def format_range(start, stop):
+  """Format a hunk range the way diff does
+
+  :param start: The index of the first line
+  :param stop: The index after the last line
+  :return: The range string
+  """
+  beginning = start + 1
+  length = stop - start
+  if length == 1:
+    return "{}".format(beginning)
+  if not length:
+    beginning -= 1
+  return "{},{}".format(beginning, length)
+
+def open_lines(path, low_memory=None):
+  """Get the lines of the path
+
+  :param path: The path to read
+  :param low_memory: Whether to keep only line digests in memory. When None
+                     it is decided by the size of the file
+  :return: A MemoryLines or IndexedLines object
+  """
+  if not path or not os.path.exists(path):
+    return MemoryLines(None)
+  if low_memory is None:
+    low_memory = os.stat(path).st_size > LOW_MEMORY_SIZE
+  if low_memory:
+    return IndexedLines(path)
+  return MemoryLines(path)
+
+def write_lines(out, prefix, lines):
+  for line in lines:
+    out.write(prefix + line)
+    if not line.endswith(b"\n"):
+      out.write(b"\n" + NO_NEWLINE)
+
+def unified_diff(path1, path2, out, context=3, low_memory=None):
+  """Write the unified diff between 2 files
+
+  The output is the same as 'diff -Naur path1 path2'. Paths that don't exist
+  are treated as empty files and every file is treated as text. Hunks are
+  written to the output as they are generated.
+
+  :param path1: The path to compare from
+  :param path2: The path to compare against
+  :param out: The file object to write to
+  :param context: The number of context lines around each change
+  :param low_memory: Whether to keep only line digests in memory. When None
+                     it is decided by the size of the files
+  :return: True if the files differ, False otherwise
+  """
+  lines1 = open_lines(path1, low_memory)
+  lines2 = open_lines(path2, low_memory)
+  try:
+    return write_hunks(lines1, lines2, out, context,
+                       "{}\t{}".format(path1, format_time(path1)),
+                       "{}\t{}".format(path2, format_time(path2)))
+  finally:
+    lines1.close()
+    lines2.close()
+
+def unified_diff_data(data1, data2, label1, label2, out, context=3):
+  """Write the unified diff between 2 contents held in memory
+
+  :param data1: The content to compare from
+  :param data2: The content to compare against
+  :param label1: The name written in the header for the first content
+  :param label2: The name written in the header for the second content
+  :param out: The file object to write to
+  :param context: The number of context lines around each change
+  :return: True if the contents differ, False otherwise
+  """
+  return write_hunks(DataLines(data1), DataLines(data2), out, context,
+                     "{}\t{}".format(label1, format_time(None)),
+                     "{}\t{}".format(label2, format_time(None)))
+
+def write_hunks(lines1, lines2, out, context, header1, header2):
+  """Write the hunks of the unified diff between 2 sets of lines
+
+  :param lines1: The lines to compare from
+  :param lines2: The lines to compare against
+  :param out: The file object to write to
+  :param context: The number of context lines around each change
+  :param header1: The header line of the first lines
+  :param header2: The header line of the second lines
+  :return: True if the lines differ, False otherwise
+  """
+  matcher = LineMatcher(lines1.keys, lines2.keys)
+  header = False
+  for group in matcher.get_grouped_opcodes(context):
+    if not header:
+      out.write("--- {}\n".format(header1))
+      out.write("+++ {}\n".format(header2))
+      header = True
+    first, last = group[0], group[-1]
+    out.write("@@ -{} +{} @@\n".format(
+      format_range(first[1], last[2]),
+      format_range(first[3], last[4])))
+    for tag, i1, i2, j1, j2 in group:
+      if tag == 'equal':
+        write_lines(out, b" ", lines1.get(i1, i2))
+        continue
+      if tag in ('replace', 'delete'):
+        write_lines(out, b"-", lines1.get(i1, i2))
+      if tag in ('replace', 'insert'):
+        write_lines(out, b"+", lines2.get(j1, j2))
+  return header
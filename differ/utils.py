@@ -1,32 +1,118 @@
 from __future__ import print_function
 import os, sys
-import uuid
-import re
 import datetime
 import textwrap
 import stat
+import functools
+import itertools
+import shutil
+import time
+import threading
 
 from plugins import PLUGINS
 from changes import Changes
-from paths import Paths
+from paths import Paths, get_mode_type
 from path import Path
+from archive import Archive, archive_type, dir_links, with_link_targets
+from bindiff import compare_binary, compare_data, is_binary, is_binary_data
+from digest import contents_equal
+from log import setup_logging
+from manifest import Manifest, ManifestCache
+from metrics import Metrics
+from nested import NestedDiffer
+from normalize import Normalizer
+from output import OutputWriter
+from pipeline import Pipeline
+from progress import Progress
+from renames import find_renames
+from report import TextReport
+from udiff import unified_diff, unified_diff_data
 
 import logging
-import logging.config
 logger = logging.getLogger('differ.utils')
 
 class Differ(object):
-  def __init__(self, path1, path2, base="diff_output"):
+  def __init__(self, path1, path2, base="diff_output", stream=False, jobs=1,
+               follow_symlinks=True, cache_dir=None, cache_size=32,
+               in_place=False, report=None, renames=False, similarity=None,
+               digests=False, prepared=None, profile=False,
+               binary_ranges=False, pipeline=False, nested_depth=0,
+               path_filter=None):
     """Initilize the Differ class
 
     :param path1: The path to compare from
     :param path2: The path to compare against
     :param base: Where to store the output
+    :param stream: When both paths are archives read them member by member
+                   and only extract the members that differ
+    :param jobs: The number of paths to compare at the same time
+    :param follow_symlinks: Compare the targets of symlinks. When False the
+                            symlinks themselves are compared
+    :param cache_dir: Where to cache the manifests of the archives. Setting
+                      this also enables stream
+    :param cache_size: The number of manifests to keep in the cache
+    :param in_place: Compare directories where they are instead of copying
+                     them. Nothing is ever written to them
+    :param report: The report the changes are written to as each path is
+                   compared. Defaults to a TextReport on stdout
+    :param renames: Match the removed files with the added files that have
+                    the same content and report them as renamed instead of
+                    removed and added
+    :param similarity: The minimum similarity from 0 to 1 of the lines of a
+                       renamed file whose content also changed. None to only
+                       match identical content. Setting it also enables
+                       renames
+    :param digests: Compare the content of files by their digest. The
+                    digests are kept on the Paths objects so they can be
+                    reused by other comparisons
+    :param prepared: Tuple of the 2 Paths objects to compare when the paths
+                     were already extracted. Nothing is extracted then
+    :param profile: Add the time spent in each phase and the counters to
+                    the summary
+    :param binary_ranges: List every range of bytes that differs in the
+                          .bindiff of binary files instead of only the first
+                          difference
+    :param pipeline: When both paths are archives compare each path as soon
+                     as it is extracted from both of them instead of
+                     extracting everything first
+    :param nested_depth: How many archives deep to compare the members of
+                         archives found inside the paths. Their changes are
+                         reported under virtual paths like
+                         outer.tgz!/etc/foo. 0 to compare them as files
+    :param path_filter: The PathFilter of the paths to compare. Excluded
+                        directories are not walked and excluded members of
+                        archives are never extracted
     """
     self._valid = False
+    self.metrics = Metrics()
+    self.stream = stream or bool(cache_dir)
+    self.path_filter = path_filter
+    self.cache = None
+    if cache_dir:
+      self.cache = ManifestCache(cache_dir, max_entries=cache_size)
+    self.jobs = max(1, jobs or 1)
+    self.follow_symlinks = follow_symlinks
+    self.in_place = in_place
+    self.report = report or TextReport()
+    self.write_output = True
+    self.detect_renames = renames or similarity is not None
+    self.similarity = similarity
+    self.renames = {}
+    self.digests = digests
+    self.prepared = prepared
+    self.profile = profile
+    self.binary_ranges = binary_ranges
+    self.pipeline = pipeline
+    self.nested = NestedDiffer(self, nested_depth)
+    self.nested_paths = {}
+    self.unchanged = set()
+    self.path1_names = None
+    self.path2_names = None
+    self.path1_digests = {}
+    self.path2_digests = {}
     self.changes = Changes()
-    self.path1 = Path(path1)
-    self.path2 = Path(path2)
+    self.path1 = Path(path1, self.metrics)
+    self.path2 = Path(path2, self.metrics)
     if self.path1.valid and self.path2.valid:
       self._valid = True
 
@@ -42,6 +128,8 @@ class Differ(object):
     self.diff_dir = os.path.join(base_dir, self.diff_dir)
     self.path1_dir = os.path.join(self.diff_dir, "path1")
     self.path2_dir = os.path.join(self.diff_dir, "path2")
+    self.path1_base = self.path1_dir
+    self.path2_base = self.path2_dir
 
   def __repr__(self):
     if self._valid:
@@ -49,29 +137,125 @@ class Differ(object):
     else:
       return "NOT VALID: Path1 {} Path2: {}".format(self.path1.path, self.path2.path)
 
-  def extract_path(self, path, path_dir, exclude_dir=None):
-    """Extract a given path into the path directory
+  def prepare(self, path, path_dir):
+    """Extract or copy a path into the path directory
+
+    :param path: The Path to prepare
+    :param path_dir: Where to extract or copy it
+    :return: The directory that holds the content of the path
+    :raises IOError: When the path can't be extracted or copied
+    """
+    return prepare_path(path, path_dir, self.in_place, self.path_filter,
+                        self.metrics)
+
+  def can_stream(self):
+    """Check whether both paths can be compared without extracting them
+
+    :return: True if streaming is enabled and both paths are archives
+    """
+    if not self.stream:
+      return False
+    return (archive_type(self.path1.path) is not None and
+            archive_type(self.path2.path) is not None)
+
+  def can_pipeline(self):
+    """Check whether the paths can be compared while they are extracted
+
+    :return: True if the pipeline is enabled and both paths are archives
+    """
+    if not self.pipeline or self.prepared is not None:
+      return False
+    return (archive_type(self.path1.path) is not None and
+            archive_type(self.path2.path) is not None)
+
+  def scan(self, archive):
+    """Get the members of an archive
+
+    A cached manifest of the archive is used when there is one so the
+    archive is not read again.
+
+    :param archive: The Archive to scan
+    :return: Dictionary of member name to Member. None on error
+    """
+    if self.cache:
+      manifest = self.cache.get(archive.path)
+      if manifest is not None:
+        archive.prefix = manifest.prefix
+        archive.links = manifest.links
+        return dict((name, member)
+                    for name, member in manifest.members.items()
+                    if archive.keep(name))
+    members = archive.scan()
+    # The manifest of a filtered scan is missing the skipped members
+    if members is not None and self.cache and not self.path_filter:
+      self.cache.put(archive.path,
+                     Manifest(members, archive.prefix, archive.links))
+    return members
+
+  def setup_stream(self):
+    """Compare the archives member by member
+
+    Both archives are read once to get the digest of every member. Only
+    the members that were added, removed, or that may have changed are
+    extracted afterwards, along with the targets of their symlinks.
 
-    :parma path: What to extract
-    :param path_dir: Where to extract it
-    :param exclude_dir: When moving items into the path_dir what directories
-                        to exclude
     :return: True on success, False otherwise
     """
-    if not path:
-      logger.error("No path provided")
+    archive1 = Archive(self.path1.path, self.metrics,
+                       path_filter=self.path_filter)
+    archive2 = Archive(self.path2.path, self.metrics,
+                       path_filter=self.path_filter)
+    with self.metrics.timer("scan"):
+      members1, members2 = run_concurrently(
+        (self.scan, archive1),
+        (self.scan, archive2))
+    if members1 is None or members2 is None:
       return False
-    if not path_dir:
-      logger.error("No path directory provided")
+    if self.follow_symlinks:
+      for members in [members1, members2]:
+        for name in dir_links(members):
+          logger.debug("Skipping {} since it points to a directory".format(
+            name))
+          del members[name]
+
+    unchanged = set()
+    wanted1 = set()
+    wanted2 = set()
+    for name, member in members1.items():
+      other = members2.get(name)
+      if other is None:
+        wanted1.add(name)
+      elif member.same(other) and not PLUGINS.match(name):
+        unchanged.add(name)
+      else:
+        wanted1.add(name)
+        wanted2.add(name)
+    for name in members2:
+      if name not in members1:
+        wanted2.add(name)
+    if self.follow_symlinks:
+      # The targets of the symlinks are compared through them
+      wanted1 = with_link_targets(wanted1, members1)
+      wanted2 = with_link_targets(wanted2, members2)
+    logger.debug("{} unchanged members, extracting {} and {}".format(
+      len(unchanged),
+      len(wanted1),
+      len(wanted2)))
+
+    extracted = run_concurrently(
+      (archive1.extract, wanted1, self.path1_dir),
+      (archive2.extract, wanted2, self.path2_dir))
+    if not all(extracted):
       return False
-    path.extract_by_name(self.diff_dir)
-
-    for item in os.listdir(self.diff_dir):
-      full_path = "{}/{}".format(self.diff_dir, item)
-      if os.path.isdir(full_path):
-        if exclude_dir and full_path == exclude_dir:
-          continue
-        os.system("mv {} {}".format(full_path, path_dir))
+    self.unchanged = unchanged
+    self.path1_names = sorted(members1)
+    self.path2_names = sorted(members2)
+    self.path1_digests = dict((name, member.digest)
+                              for name, member in members1.items()
+                              if member.digest)
+    self.path2_digests = dict((name, member.digest)
+                              for name, member in members2.items()
+                              if member.digest)
     return True
 
   def setup(self):
@@ -79,48 +263,279 @@ class Differ(object):
     # Create the directory that will be used
     os.mkdir(self.diff_dir)
 
-    self.path1.copy(self.diff_dir)
-    self.extract_path(self.path1, self.path1_dir)
-
-    self.path2.copy(self.diff_dir)
-    self.extract_path(self.path2,
-      self.path2_dir,
-      exclude_dir=self.path1_dir)
+    if self.prepared is not None:
+      self.path1_base = self.prepared[0].base
+      self.path2_base = self.prepared[1].base
+    elif self.can_pipeline():
+      # The pipeline extracts the archives as it compares them
+      pass
+    elif not self.can_stream() or not self.setup_stream():
+      for path_dir in [self.path1_dir, self.path2_dir]:
+        shutil.rmtree(path_dir, ignore_errors=True)
+      # Both paths are extracted at the same time
+      self.path1_base, self.path2_base = run_concurrently(
+        (self.prepare, self.path1, self.path1_dir),
+        (self.prepare, self.path2, self.path2_dir))
 
     self.changed_dir = os.path.join(self.diff_dir, "changed")
     self.added_dir = os.path.join(self.diff_dir, "added")
     self.removed_dir = os.path.join(self.diff_dir, "removed_dir")
     self.stat_dir = os.path.join(self.diff_dir, "stat_changed")
+    self.normalized_dir = os.path.join(self.diff_dir, "normalized")
+    self.normalized1_dir = os.path.join(self.normalized_dir, "path1")
+    self.normalized2_dir = os.path.join(self.normalized_dir, "path2")
     self.summary_path = os.path.join(self.diff_dir, "summary")
+    self.output = OutputWriter(self.stat_dir, self.metrics)
 
-  def start(self):
-    """Start the differ"""
-    self.setup()
+  def start(self, progress=None):
+    """Start the differ
+
+    :param progress: Function called with a Progress object as the paths
+                     are compared
+    """
+    for change in self.iter_changes(progress=progress):
+      self.report.change(change)
+    with self.metrics.phase("summary"):
+      self.summary()
+
+  def iter_changes(self, write_output=True, progress=None):
+    """Compare the paths and yield each change as soon as it is known
+
+    The changes are yielded in the same order as start() reports them.
+    Closing the generator early stops the remaining comparisons.
+
+    :param write_output: Whether to write the added, removed and diff files
+                         into the output directory. The changes are found
+                         either way
+    :param progress: Function called with a Progress object as the paths
+                     are compared
+    :return: Generator of the Change objects
+    """
+    self.write_output = write_output
+    with self.metrics.phase("setup"):
+      self.setup()
+
+    if self.can_pipeline():
+      self.path1_obj = Paths(self.path1_base, paths=[],
+        follow_symlinks=self.follow_symlinks)
+      self.path2_obj = Paths(self.path2_base, paths=[],
+        follow_symlinks=self.follow_symlinks)
+      self.normalizer = Normalizer(self.normalized_dir, metrics=self.metrics)
+      tracker = Progress(None, progress)
+      results = Pipeline(self, tracker).run()
+    else:
+      tasks = self.plan()
+      tracker = Progress(len(tasks), progress)
+      results = (path for func, path in self.run_tasks(tasks))
+
+    # The time the caller spends on each change is not part of the phase
+    start = time.time()
+    try:
+      for path in results:
+        tracker.update()
+        for change in self.path_changes(path):
+          self.metrics.add("compare", time.time() - start)
+          yield change
+          start = time.time()
+    finally:
+      results.close()
+      self.output.close()
+      self.metrics.add("compare", time.time() - start)
+      self.metrics.count("paths", tracker.done)
+      self.metrics.count("files_walked",
+                         len(self.path1_obj.paths) + len(self.path2_obj.paths))
+      logger.debug("Compared {} paths {}".format(tracker.done, tracker))
+      logger.debug("Metrics {}".format(self.metrics))
+
+  def path_changes(self, path):
+    """Get the changes found when a path was compared
+
+    :param path: The path that was compared
+    :return: List of the Change of the path, if any, followed by the
+             changes of the members when it is a nested archive
+    """
+    paths = [path] + self.nested_paths.pop(path, [])
+    changes = [self.changes.get(item) for item in paths]
+    return [change for change in changes if change is not None]
 
-    self.path1_obj = Paths(self.path1_dir)
-    self.path2_obj = Paths(self.path2_dir)
+  def plan(self):
+    """Walk and normalize the paths and get the tasks to compare them
 
-    for path in self.path1_obj.paths:
-      if not self.path2_obj.has(path):
-        self.deleted(path)
+    :return: List of (function, path) to run
+    """
+    with self.metrics.phase("walk"):
+      if self.prepared is not None:
+        self.path1_obj, self.path2_obj = self.prepared
       else:
-        self.compare(path)
+        self.path1_obj = Paths(self.path1_base,
+          paths=self.path1_names,
+          follow_symlinks=self.follow_symlinks,
+          path_filter=self.path_filter)
+        self.path2_obj = Paths(self.path2_base,
+          paths=self.path2_names,
+          follow_symlinks=self.follow_symlinks,
+          path_filter=self.path_filter)
+      self.path1_obj.digests.update(self.path1_digests)
+      self.path2_obj.digests.update(self.path2_digests)
+
+    with self.metrics.phase("normalize"):
+      self.normalize()
+
+    removed, common, added = self.path1_obj.reconcile(self.path2_obj)
+    removed = self.match_renames(removed, added)
+    tasks = [(self.deleted, path) for path in removed]
+    tasks.extend((self.compare, path) for path in common
+                 if path not in self.unchanged)
+    tasks.extend((self.renamed if path in self.renames else self.added, path)
+                 for path in added)
+    return tasks
+
+  def match_renames(self, removed, added):
+    """Find the added paths that were renamed from a removed path
+
+    :param removed: The removed paths
+    :param added: The added paths
+    :return: The removed paths that were not renamed
+    """
+    if not self.detect_renames:
+      return removed
+    with self.metrics.phase("renames"):
+      for rename in find_renames(self.path1_obj, removed,
+                                 self.path2_obj, added,
+                                 self.similarity):
+        self.renames[rename.path] = rename
+    sources = set(rename.source for rename in self.renames.values())
+    return [path for path in removed if path not in sources]
+
+  def normalize(self):
+    """Run the plugins over every file that matches them
+
+    Each file is normalized once before anything is compared. The files
+    that are known to be unchanged or that were already normalized are
+    skipped.
+    """
+    self.normalizer = Normalizer(self.normalized_dir, metrics=self.metrics)
+    tasks = []
+    for obj, dest_dir in [(self.path1_obj, self.normalized1_dir),
+                          (self.path2_obj, self.normalized2_dir)]:
+      func = functools.partial(self.normalizer.normalize,
+                               obj,
+                               dest_dir=dest_dir)
+      tasks.extend((func, path) for path in obj.paths
+                   if path not in self.unchanged and
+                   path not in obj.normalized and
+                   self.normalizer.matches(path))
+    for _ in self.run_tasks(tasks):
+      pass
+    logger.debug("Normalized {} files, reused {}".format(
+      self.normalizer.normalized,
+      self.normalizer.reused))
+
+  def normalize_path(self, path):
+    """Normalize a single path on the sides that have it
+
+    :param path: The relative path to normalize
+    """
+    if not self.normalizer.matches(path):
+      return
+    for obj, dest_dir in [(self.path1_obj, self.normalized1_dir),
+                          (self.path2_obj, self.normalized2_dir)]:
+      if obj.has(path) and path not in obj.normalized:
+        self.normalizer.normalize(obj, path, dest_dir)
+
+  def run_tasks(self, tasks):
+    """Run the tasks across the workers
+
+    Every path is handled by a single task so the changes recorded for a
+    path don't depend on how the tasks are scheduled. The tasks are yielded
+    back in the order they were passed in.
+
+    The workers are processes forked with the differ and the tasks so
+    diffs, normalization and plugins run on every core. Each worker hands
+    back what its tasks found and it is merged in the order of the tasks
+    before they are yielded.
+
+    :param tasks: List of (function, path) to run
+    :return: Generator of the tasks as they are completed
+    """
+    if self.jobs == 1 or len(tasks) < 2:
+      for task in tasks:
+        yield run_task(task)
+      return
+    chunksize = max(1, min(64, len(tasks) // (self.jobs * 4)))
+    logger.debug("Running {} tasks with {} jobs chunksize {}".format(
+      len(tasks),
+      self.jobs,
+      chunksize))
+    import multiprocessing
+    # The workers flush the buffers they inherit when they exit
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pool = multiprocessing.Pool(self.jobs, init_worker, (self, tasks))
+    done = False
+    try:
+      results = pool.imap(run_worker_task, xrange(len(tasks)), chunksize)
+      for task, result in itertools.izip(tasks, results):
+        self.merge_result(task, result)
+        yield task
+      done = True
+    finally:
+      if done:
+        pool.close()
+      else:
+        # Don't run the tasks that are left when the caller stopped early
+        pool.terminate()
+      pool.join()
+
+  def run_in_worker(self, task):
+    """Run a task in a worker process and collect what it found
 
-    for path in self.path2_obj.paths:
-      if not self.path1_obj.has(path):
-        self.added(path)
+    The worker has its own copy of the differ so everything the task
+    changed in it has to be handed back to merge_result().
 
-    self.summary()
+    :param task: Tuple of (function, path)
+    :return: Tuple of the Change objects, the nested paths of the path, the
+             stat records, the normalized copy and the digest of the path
+             on each side and the timers and counters
+    """
+    func, path = task
+    self.changes = Changes()
+    self.nested_paths = {}
+    func(path)
+    objs = [self.path1_obj, self.path2_obj]
+    return (list(self.changes),
+            self.nested_paths.get(path),
+            self.output.take_records(),
+            [obj.normalized.get(path) for obj in objs],
+            [obj.digests.get(path) for obj in objs],
+            self.metrics.drain())
+
+  def merge_result(self, task, result):
+    """Merge what a task found in a worker process
+
+    :param task: Tuple of (function, path) that was run
+    :param result: What run_in_worker() returned for it
+    """
+    func, path = task
+    changes, nested, records, normalized, digests, metrics = result
+    for change in changes:
+      self.changes.merge(change)
+    if nested is not None:
+      self.nested_paths[path] = nested
+    for category, item, text in records:
+      self.output.record(category, item, text)
+    for obj, full_path, digest in zip([self.path1_obj, self.path2_obj],
+                                      normalized, digests):
+      if full_path is not None and path not in obj.normalized:
+        obj.set_normalized(path, full_path)
+      if digest is not None:
+        obj.digests.setdefault(path, digest)
+    self.metrics.merge(*metrics)
 
   def summary(self):
     """Print the summary"""
-    results = {
-      'dir': self.diff_dir,
-      'added': len(self.changes.get_added()),
-      'removed': len(self.changes.get_removed()),
-      'changed': len(self.changes.get_changed()),
-      'changed_stat': len(self.changes.get_changed_stat()),
-    }
+    results = self.changes.counts()
+    results['dir'] = self.diff_dir
     with open(self.summary_path, "w") as fp:
       fp.write("=" * 40)
       fp.write(textwrap.dedent("""
@@ -130,66 +545,217 @@ class Differ(object):
         # of files removed {removed}
         # of files changed {changed}
         # of files changed stat {changed_stat}
+        # of files renamed {renamed}
         """.format(**results)))
+      if self.profile:
+        fp.write("\n" + self.metrics.format())
+    if self.profile:
+      results['profile'] = self.metrics.as_dict()
 
     with open(self.summary_path, 'r') as fp:
-      print(fp.read())
+      self.report.summary(results, fp.read())
 
   def create_path(self, path):
     """Create the path specified
 
     :param path: The path to create
     """
-    os.system("mkdir -p {}".format(os.path.dirname(path)))
+    self.output.makedirs(path)
 
   def deleted(self, path):
     """Mark the path that it was deleted in path2
 
     :param path: The path that was deleted
     """
-    print("{} was removed".format(path))
     self.changes.mark_deleted(path)
+    if not self.write_output:
+      return
     item = self.path1_obj.get(path)
     result = os.path.join(self.removed_dir, path)
-    self.create_path(result)
-    os.system("cp {} {}".format(item, result))
+    self.output.copy(item, result)
 
   def added(self, path):
     """Mark the path that it was added in path2
 
     :param path: The path that was added
     """
-    print("{} was added".format(path))
     self.changes.mark_added(path)
+    if not self.write_output:
+      return
     item = self.path2_obj.get(path)
     result = os.path.join(self.added_dir, path)
-    self.create_path(result)
-    os.system("cp {} {}".format(item, result))
+    self.output.copy(item, result)
 
   def compare(self, path):
     """Compare the path and see if it changed
 
     :param path: The path to check
     """
-    self.compare_stat(path)
+    with self.metrics.timer("compare_stat"):
+      self.compare_stat(path)
     logger.debug("{} is being compared".format(path))
     p1 = self.path1_obj.get(path)
     p2 = self.path2_obj.get(path)
+    stat1 = self.path1_obj.stat(path)
+    stat2 = self.path2_obj.stat(path)
+    if stat1 is None or stat2 is None:
+      # The path is on both sides so it can't be shown to be the same
+      logger.error("Unable to stat {}".format(path))
+      self.changes.mark_changed(path)
+      return
+
+    # Symlinks are only seen when they are not followed. Their content is
+    # the path they point to
+    if stat1.type == 'symlink' and stat2.type == 'symlink':
+      self.compare_links(path, p1, p2)
+      return
+
+    # If either is a FIFO then don't try to do a diff. A symlink on one side
+    # only is already a change of the file type. A followed symlink to a
+    # directory is skipped like walk() skips it.
+    for item, record in [(p1, stat1), (p2, stat2)]:
+      if record.type in ('fifo', 'symlink', 'directory'):
+        logger.debug("Skipping diff of {} because its a {}".format(
+          item,
+          record.type))
+        return
 
-    # If either is a FIFO then don't try to do a diff
-    for item in [p1, p2]:
-      if get_file_type(item) == 'fifo':
-        logger.debug("Skipping diff of {} because its a FIFO".format(item))
+    bindiff = None
+    if stat1.size == stat2.size:
+      if not self.digests and (is_binary(p1) or is_binary(p2)):
+        # The bytes are only read once to find both whether they differ
+        # and where
+        bindiff = self.compare_binary(path, p1, p2)
+        if bindiff.first is None:
+          return
+      elif self.same_content(path, p1, p2):
         return
+    if self.nested.matches(path):
+      found = self.nested.compare(path, p1, p2)
+      if found is not None:
+        self.nested_paths[path] = found
+        return
+    self.write_diff(path, p1, p2, bindiff=bindiff)
+
+  def compare_links(self, path, p1, p2):
+    """Compare where 2 symlinks point to
+
+    A symlink that points somewhere else is changed even when the new
+    target has the same length. The diff has the 2 targets.
 
-    ret = os.system("diff -Naur {} {} > /dev/null 2>&1".format(p1, p2))
-    if not ret:
+    :param path: The relative path
+    :param p1: The full path of the symlink to compare from
+    :param p2: The full path of the symlink to compare against
+    """
+    try:
+      with self.metrics.timer("compare"):
+        target1 = os.readlink(p1)
+        target2 = os.readlink(p2)
+    except OSError as exc:
+      logger.error("Unable to read the symlink {}: {}".format(path, exc))
+      return
+    if target1 == target2:
+      return
+    logger.debug("{} points to {} instead of {}".format(path, target2,
+                                                        target1))
+    self.write_diff(path, p1, p2, (target1, target2))
+
+  def same_content(self, path, p1, p2):
+    """Check whether a path has the same content on both sides
+
+    :param path: The relative path
+    :param p1: The full path to compare from
+    :param p2: The full path to compare against
+    :return: True if the content is the same, False otherwise
+    """
+    with self.metrics.timer("compare"):
+      if self.digests:
+        digest1 = self.path1_obj.digest(path)
+        digest2 = self.path2_obj.digest(path)
+        if digest1 is not None and digest2 is not None:
+          return digest1 == digest2
+      self.metrics.count("bytes_compared", self.path1_obj.stat(path).size * 2)
+      return contents_equal(p1, p2)
+
+  def compare_binary(self, path, p1, p2):
+    """Compare 2 binary files with the same size byte by byte
+
+    :param path: The relative path
+    :param p1: The full path to compare from
+    :param p2: The full path to compare against
+    :return: The BinaryDiff. Its first difference is None when the files
+             are the same
+    """
+    with self.metrics.timer("compare"):
+      self.metrics.count("bytes_compared", self.path1_obj.stat(path).size * 2)
+      return compare_binary(p1, p2, self.binary_ranges)
+
+  def write_diff(self, path, p1, p2, data=None, bindiff=None):
+    """Mark the path as changed and write the diff of its content
+
+    Text files get a unified diff. Binary files get a .bindiff with where
+    their bytes differ.
+
+    :param path: The path that changed
+    :param p1: The full path to compare from
+    :param p2: The full path to compare against
+    :param data: Tuple of the 2 contents to diff when they are held in
+                 memory. p1 and p2 are then only the names in the diff
+    :param bindiff: The BinaryDiff of the files when they were already
+                    compared as binary files
+    """
+    self.changes.mark_changed(path)
+    if not self.write_output:
       return
     result = os.path.join(self.changed_dir, path)
     self.create_path(result)
-    os.system("diff -Naur {} {} > {}.diff".format(p1, p2, result))
-    self.changes.mark_changed(path)
-    self.changes.add_related(path, "{}.diff".format(result))
+    with self.metrics.timer("diff"):
+      if bindiff is not None:
+        binary = True
+      elif data is None:
+        binary = is_binary(p1) or is_binary(p2)
+      else:
+        binary = is_binary_data(data[0]) or is_binary_data(data[1])
+      if binary:
+        result = "{}.bindiff".format(result)
+        with open(result, 'w') as fp:
+          if bindiff is None and data is None:
+            bindiff = compare_binary(p1, p2, self.binary_ranges)
+          elif bindiff is None:
+            bindiff = compare_data(data[0], data[1], self.binary_ranges)
+          bindiff.write(fp, p1, p2)
+        self.metrics.count("bindiffs_written")
+      else:
+        result = "{}.diff".format(result)
+        with open(result, 'wb') as fp:
+          if data is None:
+            unified_diff(p1, p2, fp)
+          else:
+            unified_diff_data(data[0], data[1], p1, p2, fp)
+        self.metrics.count("diffs_written")
+    self.changes.add_related(path, result)
+
+  def renamed(self, path):
+    """Mark the path that it was moved from a removed path
+
+    Nothing is copied for a rename. Only the diff is written when the
+    content changed. The mode and size are compared with the ones of the
+    removed path.
+
+    :param path: The path in path2
+    """
+    rename = self.renames[path]
+    self.changes.mark_renamed(path, rename.source)
+    stat1 = self.path1_obj.stat(rename.source)
+    stat2 = self.path2_obj.stat(path)
+    if stat1 is not None and stat2 is not None:
+      with self.metrics.timer("compare_stat"):
+        self.record_mode(path, stat1.mode, stat2.mode)
+        self.record_size(path, stat1.size, stat2.size)
+    if rename.score < 1:
+      self.write_diff(path,
+                      self.path1_obj.get(rename.source),
+                      self.path2_obj.get(path))
 
   def _compare_mode(self, path):
     """Compare the os.stat st_mode
@@ -197,59 +763,73 @@ class Differ(object):
     :param path: The path to check
     """
     logger.debug("{} is being compared for stat mode".format(path))
-    p1 = self.path1_obj.get(path)
-    p2 = self.path2_obj.get(path)
+    stat1 = self.path1_obj.stat(path)
+    stat2 = self.path2_obj.stat(path)
+    if stat1 is None or stat2 is None:
+      return
+    self.record_mode(path, stat1.mode, stat2.mode)
+
+  def record_mode(self, path, p1_mode, p2_mode):
+    """Mark the path as changed stat when its st_mode differs
 
-    p1_mode = os.stat(p1).st_mode
-    p2_mode = os.stat(p2).st_mode
+    :param path: The path to check
+    :param p1_mode: The st_mode in path1
+    :param p2_mode: The st_mode in path2
+    """
     logger.debug("{} p1 {} p2 {}".format(path, p1_mode, p2_mode))
     if p1_mode == p2_mode:
       return
-    result = os.path.join(self.stat_dir, path)
-    self.create_path(result)
-    output = "{}.mode".format(result)
-
-    self.changes.mark_changed_stat(path)
+    records = []
+    p1_perms = oct(p1_mode & 0777)
+    p2_perms = oct(p2_mode & 0777)
+    if p1_perms != p2_perms:
+      records.append("Permissions {} => {}".format(
+        p1_perms,
+        p2_perms))
+
+    p1_type = get_mode_type(p1_mode)
+    p2_type = get_mode_type(p2_mode)
+    if p1_type != p2_type:
+      records.append("File Type {} => {}".format(
+        p1_type,
+        p2_type))
+
+    if not records:
+      records.append("Mode {} => {}".format(oct(p1_mode), oct(p2_mode)))
+    self.changes.mark_changed_stat(path, mode=(p1_mode, p2_mode))
+    if not self.write_output:
+      return
+    for record in records:
+      output = self.output.record("mode", path, record)
     self.changes.add_related(path, output)
 
-    with open(output, 'w') as fp:
-      p1_perms = oct(p1_mode & 0777)
-      p2_perms = oct(p2_mode & 0777)
-      if p1_perms != p2_perms:
-        fp.write("Permissions {} => {}\n".format(
-          p1_perms,
-          p2_perms))
-
-      p1_type = get_file_type(p1)
-      p2_type = get_file_type(p2)
-      if p1_type != p2_type:
-        fp.write("File Type {} => {}\n".format(
-          p1_type,
-          p2_type))
-
   def _compare_size(self, path):
     """Compare the os.stat st_size
 
     :param path: The path to check
     """
     logger.debug("{} is being compared for stat size".format(path))
-    p1 = self.path1_obj.get(path)
-    p2 = self.path2_obj.get(path)
-
-    p1_size = os.stat(p1).st_size
-    p2_size = os.stat(p2).st_size
-    if p1_size == p2_size:
+    stat1 = self.path1_obj.stat(path)
+    stat2 = self.path2_obj.stat(path)
+    if stat1 is None or stat2 is None:
       return
-    result = os.path.join(self.stat_dir, path)
-    self.create_path(result)
-    output = "{}.size".format(result)
+    self.record_size(path, stat1.size, stat2.size)
 
-    with open(output, 'w') as fp:
-      fp.write("Size {} => {}\n".format(
-        p1_size,
-        p2_size))
+  def record_size(self, path, p1_size, p2_size):
+    """Mark the path as changed stat when its st_size differs
 
-    self.changes.mark_changed_stat(path)
+    :param path: The path to check
+    :param p1_size: The st_size in path1
+    :param p2_size: The st_size in path2
+    """
+    if p1_size == p2_size:
+      return
+    self.changes.mark_changed_stat(path, size=(p1_size, p2_size))
+    if not self.write_output:
+      return
+    output = self.output.record("size", path, "Size {} => {}".format(
+      p1_size,
+      p2_size))
     self.changes.add_related(path, output)
 
   def compare_stat(self, path):
@@ -260,60 +840,115 @@ class Differ(object):
     self._compare_mode(path)
     self._compare_size(path)
 
+def prepare_path(path, path_dir, in_place=False, path_filter=None,
+                 metrics=None):
+  """Extract or copy a path into a directory
+
+  :param path: The Path to prepare
+  :param path_dir: Where to extract or copy it
+  :param in_place: Use directories where they are instead of copying them
+  :param path_filter: The PathFilter of the paths to compare. The members
+                      of an archive that it excludes are not extracted and
+                      the directories it excludes are not copied
+  :param metrics: The Metrics the extraction is counted in
+  :return: The directory that holds the content of the path. When an
+           archive has a single top level directory that directory is
+           returned
+  :raises IOError: When the path can't be extracted or copied
+  """
+  if in_place and os.path.isdir(path.path):
+    logger.debug("Comparing {} in place".format(path.path))
+    return os.path.abspath(path.path)
+  if path_filter and archive_type(path.path) is not None:
+    archive = Archive(path.path, metrics, path_filter=path_filter)
+    if not archive.extract_kept(path_dir):
+      raise IOError("Unable to extract {} into {}".format(path.path,
+                                                          path_dir))
+    # What is on disk is missing the excluded members
+    return os.path.join(path_dir, archive.prefix).rstrip('/')
+  if not path.extract(path_dir, path_filter):
+    raise IOError("Unable to extract {} into {}".format(path.path, path_dir))
+  if os.path.isdir(path.path):
+    return path_dir
+  items = os.listdir(path_dir)
+  if len(items) == 1:
+    root = os.path.join(path_dir, items[0])
+    if os.path.isdir(root) and not os.path.islink(root):
+      return root
+  return path_dir
+
+def run_concurrently(*calls):
+  """Run calls at the same time, each in its own thread
+
+  :param calls: Tuples of (function, arguments...)
+  :return: List of the results in the order of the calls. The first
+           exception raised by a call is raised again
+  """
+  results = [None] * len(calls)
+  errors = []
+  def run(index, func, args):
+    try:
+      results[index] = func(*args)
+    except Exception:
+      errors.append(sys.exc_info())
+  threads = [threading.Thread(target=run, args=(index, call[0], call[1:]))
+             for index, call in enumerate(calls)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  if errors:
+    exc_type, exc_value, exc_tb = errors[0]
+    raise exc_type, exc_value, exc_tb
+  return results
+
+def run_task(task):
+  """Run a task of the differ
+
+  :param task: Tuple of (function, path)
+  :return: The task that was run
+  """
+  func, path = task
+  func(path)
+  return task
+
+# The differ and the tasks of a worker process
+_worker = None
+
+def init_worker(differ, tasks):
+  """Set up a worker process once it is forked
+
+  The records are handed back to the differ of the parent so only it
+  writes the files of the records.
+
+  :param differ: The Differ whose tasks are run
+  :param tasks: List of (function, path) to run
+  """
+  global _worker
+  _worker = (differ, tasks)
+  differ.output = OutputWriter(differ.stat_dir, differ.metrics,
+                               write_records=False)
+  # Only what the tasks measure is handed back
+  differ.metrics.drain()
+
+def run_worker_task(index):
+  """Run a task in a worker process
+
+  :param index: The index of the task
+  :return: What the task found, see Differ.run_in_worker()
+  """
+  differ, tasks = _worker
+  return differ.run_in_worker(tasks[index])
+
 def get_file_type(path):
   """Retrieve the file type of the path
 
   :param path: The path to get the file type for
   :return: The file type as a string or None on error
   """
-  f_types = {
-    'socket':           stat.S_IFSOCK,
-    'regular':          stat.S_IFREG,
-    'block':            stat.S_IFBLK,
-    'directory':        stat.S_IFDIR,
-    'character_device': stat.S_IFCHR,
-    'fifo':             stat.S_IFIFO,
-  }
-  if not path or not os.path.exists(path):
+  if not path:
+    return None
+  try:
+    return get_mode_type(os.stat(path).st_mode)
+  except OSError:
     return None
-
-  obj = os.stat(path).st_mode
-  for key,val in f_types.items():
-    if obj & val == val:
-      return key
-
-def setup_logging(level='INFO'):
-  """Setup logging
-
-  :param level: The level to set in the logging configuration
-  """
-  LOGGER_DEFAULT = {
-    'level': level
-  }
-  LOG_CONFIG = {
-    "version": 1,
-   "formatters": {
-     "default": {
-       "format": "%(levelname)-8s %(module)s %(funcName)s - %(message)s",
-       "datefmt": "%Y-%m-%d %H:%M:%S"
-     },
-    },
-    "handlers": {
-      "console": {
-        "class": "logging.StreamHandler",
-        "formatter": "default"
-      },
-    },
-    "loggers": {
-      "differ.changes": LOGGER_DEFAULT,
-      "differ.main": LOGGER_DEFAULT,
-      "differ.path": LOGGER_DEFAULT,
-      "differ.paths": LOGGER_DEFAULT,
-      "differ.plugins": LOGGER_DEFAULT,
-      "differ.utils": LOGGER_DEFAULT,
-    },
-    "root": {
-      "handlers": ["console"],
-    },
-  }
-  logging.config.dictConfig(LOG_CONFIG)
@@ -1,5 +1,65 @@
+import io
 import os
 import sys
+import tarfile
+import zipfile
 sys.path.append("../")
 
 import differ
+
+def write(base, name, data):
+  """Write a file below a directory, creating the directories it is in
+
+  :param base: The directory to write below
+  :param name: The relative name of the file
+  :param data: The content of the file
+  :return: The path of the file
+  """
+  path = os.path.join(base, name)
+  if not os.path.exists(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path))
+  with open(path, "wb") as fp:
+    fp.write(data)
+  return path
+
+def make_tar(members, path=None, mode='w'):
+  """Create a tar file
+
+  :param members: Dictionary of member name to content, or list of (member
+                  name, content) to keep their order. A content that is a
+                  tuple of a tar type and a target adds a link
+  :param path: The path of the tar file, None to create it in memory
+  :param mode: The mode to open the tar file with
+  :return: The path of the tar file, or its content when created in memory
+  """
+  out = io.BytesIO()
+  if path:
+    tf = tarfile.open(path, mode)
+  else:
+    tf = tarfile.open(fileobj=out, mode=mode)
+  if isinstance(members, dict):
+    members = sorted(members.items())
+  for name, data in members:
+    info = tarfile.TarInfo(name)
+    info.mode = 0644
+    if isinstance(data, tuple):
+      info.type, info.linkname = data
+      tf.addfile(info)
+    else:
+      info.size = len(data)
+      tf.addfile(info, io.BytesIO(data))
+  tf.close()
+  return path or out.getvalue()
+
+def make_zip(members):
+  """Create a zip file in memory
+
+  :param members: Dictionary of member name to content
+  :return: The content of the zip file
+  """
+  out = io.BytesIO()
+  zf = zipfile.ZipFile(out, 'w')
+  for name, data in sorted(members.items()):
+    zf.writestr(name, data)
+  zf.close()
+  return out.getvalue()
@@ -1,5 +1,51 @@
+import os
+
 from context import differ
 
 def test_plugins():
   plugins = differ.plugins.Plugins()
   assert not plugins.get(None)
+
+def test_plugins_match():
+  class First(object):
+    pass
+  class Second(object):
+    pass
+  first = First()
+  second = Second()
+  plugins = differ.plugins.Plugins()
+  assert plugins.match("anything") == []
+
+  plugins.add_parsers({'.*iptables.*': first})
+  assert plugins.match("etc/iptables") == [first]
+  assert plugins.match("etc/hosts") == []
+  assert "etc/iptables" in plugins._matches
+
+  # Adding parsers forgets the remembered matches
+  plugins.add_parsers({'etc/.*': second})
+  assert not plugins._matches
+  assert plugins.match("etc/iptables") == [first, second]
+  assert plugins.match("etc/hosts") == [second]
+  assert plugins.match("var/iptables") == [first]
+
+def test_plugins_register():
+  plugins = differ.plugins.Plugins()
+  plugins.register('.*iptables.*', 'strip_iptables_counters:IptablesStrip')
+  plugins.register('.*broken.*', 'does_not_exist:Nothing')
+  assert not plugins.plugins
+  result = plugins.match("iptables")
+  assert len(result) == 1
+  assert result[0].__class__.__name__ == "IptablesStrip"
+  assert plugins.get("IptablesStrip") is result[0]
+  assert plugins.match("broken") == []
+
+def test_declares_entry_points(tmpdir):
+  site = tmpdir.mkdir("site")
+  site.mkdir("other-1.0.dist-info").join("entry_points.txt").write(
+    "[console_scripts]\nother = other:main\n")
+  assert not differ.plugins.declares_entry_points("differ.plugins",
+                                                  [str(site), "/missing"])
+  site.mkdir("mine-1.0.egg-info").join("entry_points.txt").write(
+    "[differ.plugins]\n.*sshd.* = mine.sshd:SshdStrip\n")
+  assert differ.plugins.declares_entry_points("differ.plugins",
+                                              [str(site)])
@@ -0,0 +1,92 @@
+import os
+import sys
+import pytest
+
+from context import differ, make_tar
+
+class TestArchive():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def test_archive_type(self):
+    assert differ.archive.archive_type(None) == None
+    assert differ.archive.archive_type("fail") == None
+    assert differ.archive.archive_type("test.tar") == 'tar'
+    assert differ.archive.archive_type("test.tgz") == 'tar'
+    assert differ.archive.archive_type("test.tar.xz") == 'tar'
+    assert differ.archive.archive_type("test.zip") == 'zip'
+
+  def test_scan(self):
+    # A path that isn't an archive can't be scanned
+    assert differ.archive.Archive("tests/files/before").scan() == None
+
+    digests = None
+    for f_name in ['before.tar', 'before.tgz', 'before.tar.bz2',
+                   'before.tar.xz', 'before.zip']:
+      obj = differ.archive.Archive("tests/files/{}".format(f_name))
+      members = obj.scan()
+      assert sorted(members) == ['a', 'b', 'i_am_special']
+      assert obj.prefix == 'before/'
+      assert members['a'].size == 3
+      assert members['a'].is_regular()
+      result = dict((k, v.digest) for k, v in members.items())
+      if digests is not None:
+        assert result == digests
+      digests = result
+
+  def test_decompressor_status(self, monkeypatch):
+    """A decompressor that fails fails the read"""
+    path = os.path.join(self.base, "piped.tar")
+    os.system("cp tests/files/before.tar {}".format(path))
+    monkeypatch.setattr(differ.archive, 'PIPE_DECOMPRESSORS',
+                        {'.tar': ['sh', '-c', 'cat "$0"; exit 1']})
+    obj = differ.archive.Archive(path)
+    # The whole tar file was written before the failure
+    assert obj.scan() is None
+    with pytest.raises(IOError):
+      list(obj.iter_extract(os.path.join(self.base, "dest")))
+
+    # A decompressor whose output is not read to the end is not a failure
+    monkeypatch.setattr(differ.archive, 'PIPE_DECOMPRESSORS',
+                        {'.tar': ['sh', '-c', 'exec cat "$0" /dev/zero']})
+    obj = differ.archive.Archive(path)
+    assert sorted(obj.scan()) == ['a', 'b', 'i_am_special']
+
+  def test_extract(self):
+    obj = differ.archive.Archive("tests/files/before.tgz")
+    obj.scan()
+    dest = os.path.join(self.base, "dest")
+    assert obj.extract(['a'], dest)
+    assert os.listdir(dest) == ['a']
+    with open(os.path.join(dest, 'a')) as fp:
+      assert fp.read() == "hi\n"
+
+    obj = differ.archive.Archive("tests/files/before.zip")
+    obj.scan()
+    dest = os.path.join(self.base, "dest_zip")
+    assert obj.extract(['b'], dest)
+    assert os.listdir(dest) == ['b']
+
+  def test_extract_outside(self):
+    """Members that would be written outside of the destination fail"""
+    import tarfile
+    outside = os.path.join(self.base, "outside")
+    os.mkdir(outside)
+    path = make_tar([("root/d", (tarfile.SYMTYPE, outside)),
+                     ("root/d/evil", "hi\n")],
+                    os.path.join(self.base, "evil.tar"))
+
+    obj = differ.archive.Archive(path)
+    assert sorted(obj.scan()) == ['d', 'd/evil']
+    assert not obj.extract(['d', 'd/evil'], os.path.join(self.base, "dest"))
+    obj = differ.archive.Archive(path)
+    with pytest.raises(IOError):
+      list(obj.iter_extract(os.path.join(self.base, "iter")))
+    assert os.listdir(outside) == []
@@ -0,0 +1,59 @@
+import os
+import sys
+import pytest
+
+from context import differ
+sys.path.append("benchmarks")
+import generate
+import run
+
+class TestBenchmarks():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def test_generate(self):
+    snapshots = generate.generate(os.path.join(self.base, "snapshots"),
+                                  formats=['tar', 'zip'],
+                                  files=50,
+                                  change_ratio=0.2,
+                                  add_ratio=0.1,
+                                  remove_ratio=0.1)
+    assert sorted(snapshots) == ['dir', 'tar', 'zip']
+    before, after = snapshots['dir']
+    paths = generate.generate_tree(os.path.join(self.base, "again"), files=50)
+    assert len(paths) == 50
+    # The same seed generates the same tree
+    assert differ.paths.Paths(before).paths == sorted(paths)
+
+    for fmt in ['dir', 'zip']:
+      os.makedirs(os.path.join(self.base, fmt))
+      obj = differ.utils.Differ(snapshots[fmt][0], snapshots[fmt][1],
+                                base=os.path.join(self.base, fmt))
+      list(obj.iter_changes(write_output=False))
+      counts = obj.changes.counts()
+      assert counts['added'] == 5
+      assert counts['removed'] == 5
+      assert counts['changed'] == 10
+      assert set(obj.metrics.phases) >= set(['setup', 'walk', 'compare'])
+
+  def test_run_jobs(self):
+    snapshots = generate.generate(os.path.join(self.base, "snapshots"),
+                                  formats=['tar'],
+                                  files=20)
+    before, after = snapshots['dir']
+    results = {}
+    for jobs in [1, 2]:
+      name = run.result_name('dir', jobs, [1, 2])
+      results[name] = run.run_format(before, after,
+                                     os.path.join(self.base, "output"),
+                                     repeat=1, jobs=jobs)
+    assert sorted(results) == ['dir -j1', 'dir -j2']
+    assert results['dir -j1']['counters'] == results['dir -j2']['counters']
+    assert run.result_name('dir', 4, [4]) == 'dir'
@@ -0,0 +1,110 @@
+import os
+import sys
+import pytest
+
+from context import differ, write
+
+class TestBindiff():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def test_is_binary(self):
+    assert differ.bindiff.is_binary(write(self.base, "bin", b"ab\0cd"))
+    assert not differ.bindiff.is_binary(write(self.base, "text", b"abcd\n"))
+    assert not differ.bindiff.is_binary("/does/not/exist")
+
+  def test_compare_binary(self):
+    data = bytearray(b"\0" * 10000)
+    path1 = write(self.base, "one", bytes(data))
+    data[10] = 1
+    data[4095] = 1
+    data[4096] = 1
+    data[4100] = 1
+    data[9000] = 1
+    path2 = write(self.base, "two", bytes(data))
+
+    result = differ.bindiff.compare_binary(path1, path2)
+    assert result.first == 10
+    assert result.blocks == 1
+    assert not result.ranges
+
+    result = differ.bindiff.compare_binary(path1, path2, ranges=True)
+    assert result.first == 10
+    assert result.blocks == 3
+    assert result.total_blocks == 3
+    # The run across the block boundary is merged
+    assert result.ranges == [(10, 4101), (9000, 9001)]
+
+    # Same content
+    result = differ.bindiff.compare_binary(path1, path1, ranges=True)
+    assert result.first is None
+    assert result.blocks == 0
+
+    # Different sizes
+    path3 = write(self.base, "three", bytes(b"\0" * 5000))
+    result = differ.bindiff.compare_binary(path1, path3, ranges=True)
+    assert result.first == 5000
+    assert result.ranges == [(5000, 10000)]
+    assert result.blocks == 2
+
+    # Empty files can't be mapped
+    empty = write(self.base, "empty", b"")
+    result = differ.bindiff.compare_binary(empty, path1, ranges=True)
+    assert result.first == 0
+    assert result.ranges == [(0, 10000)]
+
+    out = os.path.join(self.base, "out.bindiff")
+    with open(out, "w") as fp:
+      differ.bindiff.compare_binary(path1, path2, ranges=True).write(
+        fp, path1, path2)
+    with open(out) as fp:
+      lines = fp.read().splitlines()
+    assert lines[2] == "first difference at 0x0000000a"
+    assert lines[3] == "changed blocks 3 of 3 (4096 bytes each)"
+    assert lines[4:] == ["@@ 0x0000000a 4091", "@@ 0x00002328 1"]
+
+  def test_differ_bindiff(self):
+    write(self.base, "before/fw.bin", b"\0\1\2\3" * 100)
+    write(self.base, "after/fw.bin", b"\0\1\2\4" * 100)
+    obj = differ.utils.Differ(os.path.join(self.base, "before"),
+                              os.path.join(self.base, "after"),
+                              base=os.path.join(self.base, "out"),
+                              binary_ranges=True)
+    obj.start()
+    change = obj.changes.get("fw.bin")
+    assert change.related[0].endswith("fw.bin.bindiff")
+    with open(change.related[0]) as fp:
+      assert "changed blocks 1 of 1" in fp.read()
+    assert not os.path.exists(os.path.join(obj.changed_dir, "fw.bin.diff"))
+
+  def test_differ_bindiff_read_once(self, monkeypatch):
+    """Binary files with the same size are only compared through mmap"""
+    write(self.base, "before/fw.bin", b"\0\1\2\3" * 4096)
+    write(self.base, "after/fw.bin", b"\0\1\2\3" * 2048 + b"\0\1\2\4" * 2048)
+    write(self.base, "before/same.bin", b"\0same")
+    write(self.base, "after/same.bin", b"\0same")
+    def contents_equal(path1, path2):
+      raise AssertionError("{} was read twice".format(path1))
+    monkeypatch.setattr(differ.utils, 'contents_equal', contents_equal)
+    calls = []
+    compare_binary = differ.utils.compare_binary
+    def counting_compare_binary(path1, path2, ranges=False):
+      calls.append(os.path.basename(path1))
+      return compare_binary(path1, path2, ranges)
+    monkeypatch.setattr(differ.utils, 'compare_binary',
+                        counting_compare_binary)
+    obj = differ.utils.Differ(os.path.join(self.base, "before"),
+                              os.path.join(self.base, "after"),
+                              base=os.path.join(self.base, "out"))
+    obj.start()
+    assert obj.changes.get_changed() == ["fw.bin"]
+    assert sorted(calls) == ["fw.bin", "same.bin"]
+    with open(obj.changes.get("fw.bin").related[0]) as fp:
+      assert "first difference at 0x00002003" in fp.read()
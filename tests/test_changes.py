@@ -8,3 +8,36 @@ def test_change():
   change = differ.changes.Change('path')
   print(change)
   assert change.state == differ.changes.CHANGE_STATE.NONE
+
+def test_change_slots():
+  change = differ.changes.Change('path')
+  assert not hasattr(change, '__dict__')
+  assert change.related == ()
+
+def test_changes_index():
+  CHANGE_STATE = differ.changes.CHANGE_STATE
+  changes = differ.changes.Changes()
+  changes.mark_added('a')
+  changes.mark_changed('b')
+  changes.mark_changed_stat('b', size=(1, 2))
+  changes.mark_changed('c')
+  changes.add_related('c', 'c.diff')
+
+  assert len(changes) == 3
+  assert changes.get('b').size == (1, 2)
+  assert changes.get('c').related == ['c.diff']
+  assert changes.get('d') is None
+  assert changes.get_added() == ['a']
+  assert sorted(changes.iter_by_state(CHANGE_STATE.CHANGED)) == ['b', 'c']
+  assert list(changes.iter_by_state(
+    CHANGE_STATE.CHANGED | CHANGE_STATE.CHANGED_STAT)) == ['b']
+  assert sorted(changes.iter_by_state(CHANGE_STATE.NONE)) == ['a', 'b', 'c']
+  assert changes.count(CHANGE_STATE.CHANGED) == 2
+  assert changes.count(CHANGE_STATE.CHANGED | CHANGE_STATE.CHANGED_STAT) == 1
+  assert changes.counts() == {
+    'added': 1,
+    'removed': 0,
+    'changed': 2,
+    'changed_stat': 1,
+    'renamed': 0,
+  }
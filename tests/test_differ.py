@@ -1,8 +1,9 @@
 import os
 import sys
+import shutil
 import pytest
 
-from context import differ
+from context import differ, make_tar
 
 class TestDiffer():
   base = "/tmp/differ/"
@@ -21,8 +22,6 @@ class TestDiffer():
     obj = differ.utils.Differ(".", "FAIL")
     assert not obj._valid
     assert "NOT VALID" in repr(obj)
-    assert not obj.extract_path(None, None)
-    assert not obj.extract_path("Something", None)
 
     # Test with the same tar files
     obj = differ.utils.Differ(
@@ -70,6 +69,107 @@ class TestDiffer():
         assert "removed 1" in summary
         assert "changed 2" in summary
 
+  def test_differ_jobs(self):
+    """Test differ when comparing the paths with multiple jobs"""
+    for path1, path2 in [
+        ("tests/files/before.tgz", "tests/files/after.tgz"),
+        ("tests/files/stat_changes/before", "tests/files/stat_changes/after")]:
+      results = []
+      for jobs in [1, 4]:
+        base = os.path.join(self.base, str(jobs))
+        if not os.path.exists(base):
+          os.makedirs(base)
+        obj = differ.utils.Differ(path1, path2, base=base, jobs=jobs)
+        assert obj.jobs == jobs
+        obj.start()
+        results.append(dict(
+          (path, (change.state, [os.path.basename(item)
+                                 for item in change.related]))
+          for path, change in obj.changes.changes.items()))
+      assert results[0] == results[1]
+    assert differ.utils.Differ(None, None, jobs=0).jobs == 1
+
+  @pytest.mark.parametrize("path1,path2", [
+    ("tests/files/stat_changes/before", "tests/files/stat_changes/after"),
+    ("tests/files/plugins/iptables/before.tgz",
+     "tests/files/plugins/iptables/after.tgz"),
+  ])
+  def test_differ_jobs_output(self, path1, path2):
+    """The worker processes write the same output as a single job"""
+    results = []
+    for jobs in [1, 3]:
+      base = os.path.join(self.base, str(jobs))
+      os.makedirs(base)
+      obj = differ.utils.Differ(path1, path2, base=base, jobs=jobs)
+      obj.start()
+      output = {}
+      for root, dirs, files in os.walk(obj.diff_dir):
+        for name in files:
+          full_path = os.path.join(root, name)
+          if full_path == obj.summary_path:
+            continue
+          with open(full_path) as fp:
+            # The headers of the diffs have the paths and times of the run
+            output[os.path.relpath(full_path, obj.diff_dir)] = [
+              line for line in fp
+              if not line.startswith(('--- ', '+++ '))]
+      results.append((sorted(
+        (path, change.state, change.size, change.mode,
+         sorted(os.path.relpath(item, obj.diff_dir)
+                for item in change.related))
+        for path, change in obj.changes.changes.items()), output,
+        obj.metrics.counters.get('records_written')))
+    assert results[0] == results[1]
+
+  def test_differ_stream(self):
+    """Test differ when reading the archives without extracting them"""
+    obj = differ.utils.Differ(
+      "tests/files/before.tgz",
+      "tests/files/before.tar.xz",
+      base=self.base,
+      stream=True)
+    assert obj.can_stream()
+    obj.start()
+    assert not obj.changes.changes
+    assert not os.listdir(obj.path1_dir)
+    assert not os.listdir(obj.path2_dir)
+
+    for f_name in ['before.tar', 'before.tar.bz2', 'before.zip']:
+      obj = differ.utils.Differ(
+        "tests/files/{}".format(f_name),
+        "tests/files/after.tgz",
+        base=self.base,
+        stream=True)
+      obj.start()
+      assert len(obj.changes.get_added()) == 1
+      assert len(obj.changes.get_removed()) == 1
+      assert len(obj.changes.get_changed()) == 2
+      assert sorted(os.listdir(obj.path2_dir)) == ['a', 'b', 'c']
+
+    # The manifests are cached between runs
+    cache_dir = os.path.join(self.base, "cache")
+    for count in range(2):
+      base = os.path.join(self.base, str(count))
+      os.makedirs(base)
+      obj = differ.utils.Differ(
+        "tests/files/before.tgz",
+        "tests/files/after.tgz",
+        base=base,
+        cache_dir=cache_dir)
+      assert obj.can_stream()
+      obj.setup()
+      assert len(obj.unchanged) == 0
+      assert len(obj.path1_names) == 3
+    assert len(os.listdir(cache_dir)) == 3
+
+    # Directories can not be streamed
+    obj = differ.utils.Differ(
+      "tests/files/before",
+      "tests/files/after.tgz",
+      base=self.base,
+      stream=True)
+    assert not obj.can_stream()
+
   def test_differ_stat_changes(self):
     """Test differ where there are mode changes"""
     obj = differ.utils.Differ(
@@ -90,6 +190,61 @@ class TestDiffer():
       assert "changed 1" in summary
       assert "changed stat 2" in summary
 
+  def test_differ_stat_order(self):
+    """The stat records are sorted by path whatever the number of jobs"""
+    before = os.path.join(self.base, "before_tmp")
+    after = os.path.join(self.base, "after_tmp")
+    names = ["file{:02d}".format(i) for i in range(40)]
+    for base, data in [(before, "a"), (after, "bb")]:
+      os.makedirs(base)
+      for name in names:
+        with open(os.path.join(base, name), 'w') as fp:
+          fp.write(data)
+    obj = differ.utils.Differ(before, after,
+                              base=os.path.join(self.base, "out"),
+                              in_place=True,
+                              jobs=8)
+    obj.start()
+    with open(os.path.join(obj.stat_dir, "size")) as fp:
+      lines = fp.read().splitlines()
+    assert lines == ["{}: Size 1 => 2".format(name) for name in names]
+
+  def test_differ_related_written(self):
+    """The related files of a change exist once the change is yielded"""
+    obj = differ.utils.Differ(
+      "tests/files/stat_changes/before",
+      "tests/files/stat_changes/after",
+      base=self.base,
+      jobs=2)
+    related = []
+    for change in obj.iter_changes():
+      for item in change.related:
+        assert os.path.exists(item)
+        related.append(item)
+    assert os.path.join(obj.stat_dir, "mode") in related
+
+  def test_differ_in_place(self):
+    """Test differ when comparing directories where they are"""
+    before = "tests/files/plugins/iptables/before"
+    after = "tests/files/plugins/iptables/after"
+    mtimes = [os.stat(os.path.join(path, "my_iptables_mangle")).st_mtime
+              for path in [before, after]]
+    obj = differ.utils.Differ(before, after, base=self.base, in_place=True)
+    obj.start()
+    assert len(obj.changes.get_changed()) == 1
+    assert obj.path1_obj.base == os.path.abspath(before)
+    assert obj.path2_obj.base == os.path.abspath(after)
+    assert not os.path.exists(obj.path1_dir)
+    assert not os.path.exists(obj.path2_dir)
+
+    # The plugin normalized a copy and the original files were not touched
+    assert obj.path1_obj.get("my_iptables_mangle").startswith(
+      obj.normalized_dir)
+    assert mtimes == [
+      os.stat(os.path.join(path, "my_iptables_mangle")).st_mtime
+      for path in [before, after]]
+    assert not os.path.exists(os.path.join(before, "my_iptables_mangle.orig"))
+
   def test_differ_fifo(self):
     """Test differ where there are fifo files"""
 
@@ -127,12 +282,119 @@ class TestDiffer():
       mode = fp.read()
       assert 'fifo => regular' in mode
 
-  def test_plugin_iptables_strip(self):
+  def test_differ_symlinks(self):
+    """Symlinks that point somewhere else are changed"""
+    before = os.path.join(self.base, "before_tmp")
+    after = os.path.join(self.base, "after_tmp")
+    os.makedirs(before)
+    os.makedirs(after)
+    for base, target in [(before, "aaa"), (after, "bbb")]:
+      os.symlink(target, os.path.join(base, "moved"))
+      os.symlink("same", os.path.join(base, "same"))
+
+    obj = differ.utils.Differ(before, after, base=self.base,
+                              follow_symlinks=False, in_place=True)
+    obj.start()
+    # The targets have the same length so the stat is the same
+    assert obj.changes.get_changed() == ["moved"]
+    assert not obj.changes.get_changed_stat()
+    with open(obj.changes.get("moved").related[0]) as fp:
+      diff = fp.read()
+    assert diff.endswith("-aaa\n\\ No newline at end of file\n"
+                         "+bbb\n\\ No newline at end of file\n")
+
+  @pytest.mark.parametrize("stream", [False, True])
+  @pytest.mark.parametrize("exten", ["tar", "zip"])
+  def test_differ_symlink_targets(self, stream, exten):
+    """A symlink to another unchanged file is changed"""
+    import stat
+    import tarfile
+    import zipfile
+    os.makedirs(self.base)
+    paths = []
+    for name, target in [("before", "x"), ("after", "y")]:
+      path = os.path.join(self.base, "{}.{}".format(name, exten))
+      members = [("x", "xx\n"), ("y", "yyyy\n")]
+      if exten == "zip":
+        zf = zipfile.ZipFile(path, "w")
+        for member, data in members:
+          zf.writestr("root/" + member, data)
+        info = zipfile.ZipInfo("root/link")
+        info.external_attr = (stat.S_IFLNK | 0777) << 16
+        zf.writestr(info, target)
+        zf.close()
+      else:
+        make_tar([("root/" + member, data) for member, data in members] +
+                 [("root/link", (tarfile.SYMTYPE, target))], path)
+      paths.append(path)
+
+    obj = differ.utils.Differ(paths[0], paths[1],
+                              base=os.path.join(self.base, "out"),
+                              stream=stream)
+    obj.start()
+    assert obj.changes.get_changed() == ["link"]
+    assert obj.changes.get_changed_stat() == ["link"]
+
+  @pytest.mark.parametrize("kwargs", [{}, {'stream': True},
+                                      {'pipeline': True}])
+  def test_differ_dir_symlinks(self, kwargs):
+    """A followed symlink to a directory is not compared as a path"""
+    import tarfile
+    os.makedirs(self.base)
+    paths = []
+    for name, data in [("before", "b\n"), ("before2", "b\n"),
+                       ("after", "bb\n")]:
+      path = os.path.join(self.base, "{}.tar".format(name))
+      # The last member is written through the symlink when extracted
+      paths.append(make_tar([("root/usr/lib/a", "a\n"),
+                             ("root/lib", (tarfile.SYMTYPE, "usr/lib")),
+                             ("root/lib/b", data)], path))
+
+    for other, expected in [(paths[1], []), (paths[2], [12])]:
+      obj = differ.utils.Differ(paths[0], other,
+                                base=os.path.join(self.base, "out"),
+                                **kwargs)
+      changes = list(obj.iter_changes())
+      assert [change.state for change in changes] == expected
+      # Named by the member or by where it was extracted to
+      assert all(change.path.endswith('lib/b') for change in changes)
+      shutil.rmtree(os.path.join(self.base, "out"))
+
+  @pytest.mark.parametrize("kwargs", [{}, {'in_place': True},
+                                      {'stream': True}])
+  def test_differ_dir_symlinks_not_followed(self, kwargs):
+    """A symlink to a directory that points elsewhere is changed"""
+    import tarfile
+    paths = []
+    for name, target in [("before", "usr/lib"), ("after", "usr/lib64")]:
+      root = os.path.join(self.base, name)
+      for lib in ["lib", "lib64"]:
+        os.makedirs(os.path.join(root, "usr", lib))
+        with open(os.path.join(root, "usr", lib, "a"), 'w') as fp:
+          fp.write("a\n")
+      os.symlink(target, os.path.join(root, "lib"))
+      if kwargs.get('stream'):
+        path = root + ".tar"
+        with tarfile.open(path, "w") as tf:
+          tf.add(root, name)
+        root = path
+      paths.append(root)
+
+    obj = differ.utils.Differ(paths[0], paths[1],
+                              base=os.path.join(self.base, "out"),
+                              follow_symlinks=False, **kwargs)
+    changes = dict((change.path, change.state)
+                   for change in obj.iter_changes())
+    assert changes == {'lib': 12}
+
+  @pytest.mark.parametrize("stream", [False, True])
+  def test_plugin_iptables_strip(self, stream):
     """Test the plugin iptables stripper"""
     obj = differ.utils.Differ(
       "tests/files/plugins/iptables/before.tgz",
       "tests/files/plugins/iptables/after.tgz",
-      base=self.base)
+      base=self.base,
+      stream=stream)
     assert obj._valid
     obj.start()
     assert len(obj.changes.get_added()) == 0
@@ -147,3 +409,32 @@ class TestDiffer():
       changed_content = fp.read()
     assert "-DIFFER-TEST-3" in changed_content
     assert "+DIFFER-TEST-4" in changed_content
+
+  def test_differ_iter_changes(self):
+    """Test getting the changes from a generator"""
+    calls = []
+    obj = differ.utils.Differ(
+      "tests/files/before.tgz",
+      "tests/files/after.tgz",
+      base=self.base)
+    changes = obj.iter_changes(write_output=False, progress=calls.append)
+    paths = [change.path for change in changes]
+    assert paths
+    assert sorted(paths) == sorted(change.path for change in obj.changes)
+    assert calls[-1].done == calls[-1].total
+    assert not os.path.exists(obj.changed_dir)
+    assert not os.path.exists(obj.stat_dir)
+    for change in obj.changes:
+      assert not change.related
+
+    # Stopping early doesn't compare the rest
+    os.makedirs(os.path.join(self.base, "early"))
+    obj = differ.utils.Differ(
+      "tests/files/before.tgz",
+      "tests/files/after.tgz",
+      base=os.path.join(self.base, "early"),
+      jobs=2)
+    changes = obj.iter_changes()
+    first = next(changes)
+    changes.close()
+    assert first.path in [change.path for change in obj.changes]
@@ -0,0 +1,35 @@
+import os
+import sys
+import pytest
+
+from context import differ, write
+
+class TestDigest():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def test_digest_file(self):
+    assert differ.digest.digest_file("/does/not/exist") == None
+    path1 = write(self.base, "one", "same")
+    path2 = write(self.base, "two", "same")
+    assert differ.digest.digest_file(path1)
+    assert (differ.digest.digest_file(path1) ==
+            differ.digest.digest_file(path2, chunk_size=1))
+
+  def test_files_equal(self):
+    path1 = write(self.base, "one", "same content")
+    path2 = write(self.base, "two", "same content")
+    path3 = write(self.base, "three", "diff content")
+    path4 = write(self.base, "four", "longer content")
+    assert differ.digest.files_equal(path1, path2)
+    assert differ.digest.files_equal(path1, path2, chunk_size=3)
+    assert not differ.digest.files_equal(path1, path3)
+    assert not differ.digest.files_equal(path1, path4)
+    assert not differ.digest.files_equal(path1, "/does/not/exist")
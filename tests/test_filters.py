@@ -0,0 +1,216 @@
+import os
+import sys
+import tarfile
+import pytest
+
+from context import differ, write
+import differ.filters
+
+class TestFilters():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def make_trees(self):
+    for name in ["before", "after"]:
+      write(self.base, "{}/top/etc/hosts".format(name), name)
+      write(self.base, "{}/top/etc/app.pyc".format(name), name)
+      write(self.base, "{}/top/proc/1/status".format(name), name)
+      write(self.base, "{}/top/var/log/app/current.log".format(name), name)
+      write(self.base, "{}/top/var/lib/app.db".format(name), name)
+    trees = []
+    for name in ["before", "after"]:
+      path = os.path.join(self.base, "{}.tgz".format(name))
+      with tarfile.open(path, "w:gz") as tf:
+        tf.add(os.path.join(self.base, name, "top"), "top")
+      trees.append(path)
+    return trees
+
+  def test_globs(self):
+    obj = differ.filters.PathFilter(exclude=["*.pyc", "proc/", "/var/log"])
+    assert obj
+    assert not differ.filters.PathFilter()
+    assert not obj.keep("etc/app.pyc")
+    assert not obj.keep("app.pyc")
+    assert obj.keep("etc/app.pyc.txt")
+    assert obj.prune("proc")
+    assert obj.prune("sys/proc")
+    assert not obj.keep("proc/1/status")
+    # A directory rule doesn't match a file
+    assert obj.keep("etc/proc")
+    # A rule with a '/' is matched from the top only
+    assert obj.prune("var/log")
+    assert not obj.prune("opt/var/log")
+    assert obj.keep("etc/hosts")
+
+    obj = differ.filters.PathFilter(exclude=["var/**/*.log", "a?c"])
+    assert not obj.keep("var/log/app/current.log")
+    assert not obj.keep("var/current.log")
+    assert obj.keep("opt/var/current.log")
+    assert not obj.keep("abc")
+    assert obj.keep("a/c")
+
+  def test_regex_and_include(self):
+    obj = differ.filters.PathFilter(include=["etc/", "re:\\.db$"],
+                                    exclude=["re:(^|/)app\\.pyc$"])
+    assert obj.keep("etc/hosts")
+    assert not obj.keep("etc/app.pyc")
+    assert obj.keep("var/lib/app.db")
+    assert not obj.keep("var/log/current.log")
+    # Include rules never prune a directory
+    assert not obj.prune("var")
+
+    with pytest.raises(ValueError):
+      differ.filters.PathFilter(exclude=["re:("])
+
+  def test_load(self):
+    write(self.base, "rules", "# Never compare these\n"
+                        "exclude proc/\n"
+                        "\n"
+                        "include etc/**\n")
+    obj = differ.filters.PathFilter.load(os.path.join(self.base, "rules"),
+                                         exclude=["*.pyc"])
+    assert obj.include_rules == ["etc/**"]
+    assert obj.exclude_rules == ["*.pyc", "proc/"]
+    assert obj.keep("etc/hosts")
+    assert not obj.keep("etc/app.pyc")
+
+    write(self.base, "bad", "skip *.pyc\n")
+    with pytest.raises(ValueError) as exc:
+      differ.filters.PathFilter.load(os.path.join(self.base, "bad"))
+    assert "bad:1" in str(exc.value)
+    with pytest.raises(ValueError):
+      differ.filters.PathFilter.load(os.path.join(self.base, "missing"))
+
+  def test_walk(self):
+    self.make_trees()
+    obj = differ.filters.PathFilter(exclude=["*.pyc", "proc/", "var/log/"])
+    paths = differ.paths.Paths(os.path.join(self.base, "before/top"),
+                               path_filter=obj)
+    assert paths.paths == ["etc/hosts", "var/lib/app.db"]
+    paths = differ.paths.Paths("", paths=["etc/hosts", "proc/1/status"],
+                               path_filter=obj)
+    assert paths.paths == ["etc/hosts"]
+
+  def test_archive(self):
+    before, after = self.make_trees()
+    obj = differ.filters.PathFilter(exclude=["*.pyc", "proc/"])
+    archive = differ.archive.Archive(before, path_filter=obj)
+    members = archive.scan()
+    assert sorted(members) == ["etc/hosts", "var/lib/app.db",
+                               "var/log/app/current.log"]
+    assert archive.metrics.counters['members_skipped'] == 2
+
+  def test_archive_multiple_tops(self):
+    """Nothing is stripped from the names when there are many top dirs"""
+    paths = []
+    for name in ["before", "after"]:
+      write(self.base, "{}/etc/hosts".format(name), name)
+      write(self.base, "{}/proc/1/status".format(name), name)
+      write(self.base, "{}/proc/2/status".format(name), name)
+      path = os.path.join(self.base, "{}_tops.tgz".format(name))
+      with tarfile.open(path, "w:gz") as tf:
+        # The first member is not under the top dir of every member
+        for top in ["proc", "etc"]:
+          tf.add(os.path.join(self.base, name, top), top)
+      paths.append(path)
+
+    obj = differ.filters.PathFilter(exclude=["proc"])
+    archive = differ.archive.Archive(paths[0], path_filter=obj)
+    assert sorted(archive.scan()) == ["etc/hosts"]
+    assert archive.metrics.counters['members_skipped'] == 2
+
+    obj = differ.filters.PathFilter(include=["proc/1/status"])
+    archive = differ.archive.Archive(paths[0], path_filter=obj)
+    assert sorted(archive.scan()) == ["proc/1/status"]
+
+    obj_differ = differ.utils.Differ(paths[0], paths[1],
+      base=os.path.join(self.base, "out"),
+      path_filter=obj)
+    changes = list(obj_differ.iter_changes())
+    assert [change.path for change in changes] == ["proc/1/status"]
+
+  def test_archive_single_top(self):
+    """A rule can match the name with or without the top directory"""
+    before, after = self.make_trees()
+    # Only known to be under the stripped top once the archive is read
+    obj = differ.filters.PathFilter(include=["top/etc/hosts"])
+    archive = differ.archive.Archive(before, path_filter=obj)
+    assert archive.scan() == {}
+    obj = differ.filters.PathFilter(include=["etc/hosts"])
+    archive = differ.archive.Archive(before, path_filter=obj)
+    assert sorted(archive.scan()) == ["etc/hosts"]
+
+  def test_differ(self):
+    before, after = self.make_trees()
+    obj = differ.filters.PathFilter(include=["etc/"], exclude=["*.pyc"])
+    differs = []
+    for path1, path2, expected in [
+        (before, after, "etc/hosts"),
+        (os.path.join(self.base, "before"),
+         os.path.join(self.base, "after"),
+         "top/etc/hosts")]:
+      obj_differ = differ.utils.Differ(path1, path2,
+        base=os.path.join(self.base, "out_{}".format(len(differs))),
+        path_filter=obj)
+      changes = list(obj_differ.iter_changes())
+      assert [change.path for change in changes] == [expected]
+      differs.append(obj_differ)
+
+    # Nothing that is excluded was extracted from the archives
+    extracted = []
+    for root, dirs, files in os.walk(differs[0].diff_dir):
+      extracted.extend(files)
+    assert "hosts" in extracted
+    assert "app.pyc" not in extracted and "status" not in extracted
+
+  def test_differ_symlinks(self):
+    """A filter doesn't change how the paths it keeps are compared"""
+    paths = []
+    for name, target in [("before", "hosts"), ("after", "app.pyc")]:
+      write(self.base, "{}/top/etc/hosts".format(name), "hosts\n")
+      write(self.base, "{}/top/etc/app.pyc".format(name), "compiled")
+      os.symlink(target, os.path.join(self.base, name, "top/etc/link"))
+      path = os.path.join(self.base, "{}.tgz".format(name))
+      with tarfile.open(path, "w:gz") as tf:
+        tf.add(os.path.join(self.base, name, "top"), "top")
+      paths.append(path)
+    results = []
+    for path_filter in [None, differ.filters.PathFilter(exclude=["*.log"])]:
+      obj = differ.utils.Differ(paths[0], paths[1],
+        base=os.path.join(self.base, "out_{}".format(len(results))),
+        path_filter=path_filter)
+      assert not obj.stream
+      results.append(sorted((change.path, change.state)
+                            for change in obj.iter_changes()))
+    assert [path for path, state in results[0]] == ["etc/link"]
+    assert results[0] == results[1]
+
+  def test_differ_directories(self):
+    """The directories that are excluded are not copied"""
+    self.make_trees()
+    os.symlink("hosts", os.path.join(self.base, "after/top/etc/link"))
+    obj = differ.filters.PathFilter(exclude=["proc/", "*.pyc"])
+    obj_differ = differ.utils.Differ(os.path.join(self.base, "before"),
+                                     os.path.join(self.base, "after"),
+                                     base=os.path.join(self.base, "out"),
+                                     path_filter=obj)
+    changes = list(obj_differ.iter_changes())
+    assert sorted(change.path for change in changes) == [
+      "top/etc/hosts", "top/etc/link", "top/var/lib/app.db",
+      "top/var/log/app/current.log"]
+    copied = []
+    for root, dirs, files in os.walk(obj_differ.path2_dir):
+      copied.extend(os.path.relpath(os.path.join(root, name),
+                                    obj_differ.path2_dir)
+                    for name in files)
+    assert sorted(copied) == ["top/etc/hosts", "top/etc/link",
+                              "top/var/lib/app.db",
+                              "top/var/log/app/current.log"]
+    assert os.path.islink(os.path.join(obj_differ.path2_dir, "top/etc/link"))
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import pytest
+import subprocess
+
+from context import differ
+
+# Modules that 'differ.py diff -h' must not import. Parsing the arguments
+# only needs argparse, the differ is imported once there is a diff to run.
+STARTUP_UNUSED = ['utils', 'plugins', 'archive', 'tarfile', 'zipfile',
+                  'difflib', 'subprocess', 'multiprocessing',
+                  'pkg_resources', 'logging.config']
+
+# Modules that a diff of 2 directories with a single file must not import
+DIFF_UNUSED = ['multiprocessing', 'pkg_resources']
+
+def run(args, cwd=None):
+  """Run python with the arguments and return the output"""
+  proc = subprocess.Popen([sys.executable] + args, stdout=subprocess.PIPE,
+                          cwd=cwd)
+  output = proc.communicate()[0]
+  assert proc.returncode == 0
+  return output
+
+def run_imports(args, cwd=None):
+  """Run differ.py with the arguments and get the modules it imported
+
+  :param args: The arguments of differ.py
+  :param cwd: The directory to run it in
+  :return: Tuple of the output of differ.py and the names of the modules
+           that were imported
+  """
+  script = os.path.abspath("differ.py")
+  output = run(["-c", "\n".join([
+    "import sys, json, runpy",
+    "sys.path.insert(0, {!r})".format(os.path.dirname(os.path.realpath(
+      script))),
+    "sys.argv = {!r}".format([script] + args),
+    "try:",
+    "  runpy.run_path({!r}, run_name='__main__')".format(script),
+    "except SystemExit:",
+    "  pass",
+    "sys.stdout.write('\\n' + json.dumps(sorted(",
+    "  name for name, module in sys.modules.items() if module)))",
+  ])], cwd=cwd)
+  output, modules = output.rsplit("\n", 1)
+  return output, set(json.loads(modules))
+
+def test_startup_imports():
+  """Test that the command line only imports what parsing arguments needs"""
+  output, modules = run_imports(["diff", "-h"])
+  assert "path1" in output
+  assert 'argparse' in modules
+  assert not modules & set(STARTUP_UNUSED)
+
+def test_diff_imports(tmpdir):
+  """Test that a diff of tiny directories doesn't import what it won't use"""
+  for name, data in [("before", "a\n"), ("after", "b\n")]:
+    tmpdir.mkdir(name).join("file").write(data)
+  cwd = tmpdir.mkdir("run")
+  output, modules = run_imports(["diff", "--in-place", "../before",
+                                 "../after"], cwd=str(cwd))
+  assert "# of files changed 1" in output
+  assert 'utils' in modules
+  assert not modules & set(DIFF_UNUSED)
+  assert not [name for name in modules if name.endswith('iptables_counters')]
+
+def test_no_pkg_resources(tmpdir):
+  """Test that pkg_resources is not imported without entry points"""
+  for name in ["before", "after"]:
+    tmpdir.mkdir(name).join("file").write(name)
+  output = run(["-c", "; ".join([
+    "import sys",
+    "import differ",
+    "obj = differ.utils.Differ('{0}/before', '{0}/after', base='{0}/out', "
+    "in_place=True)".format(tmpdir),
+    "changes = list(obj.iter_changes())",
+    "print(len(changes))",
+    "print('pkg_resources' in sys.modules)",
+  ])])
+  assert output.splitlines() == ["1", "False"]
+
+def test_lazy_plugins():
+  """Test that plugins are only imported when a path matches them"""
+  output = run(["-c", "; ".join([
+    "import sys",
+    "import differ",
+    "loaded = lambda: [m for m in sys.modules if m.endswith('iptables_counters')]",
+    "print(loaded())",
+    "differ.plugins.PLUGINS.match('etc/hosts')",
+    "print(loaded())",
+    "differ.plugins.PLUGINS.match('etc/iptables')",
+    "print(loaded())",
+  ])])
+  lines = output.splitlines()
+  assert lines[0] == "[]"
+  assert lines[1] == "[]"
+  assert lines[2] != "[]"
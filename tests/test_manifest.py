@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+import pytest
+
+from context import differ, make_tar
+
+class TestManifest():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def test_save_load(self):
+    archive = differ.archive.Archive("tests/files/before.tgz")
+    members = archive.scan()
+    manifest = differ.manifest.Manifest(members, archive.prefix)
+    path = os.path.join(self.base, "manifest")
+    manifest.save(path)
+    loaded = differ.manifest.Manifest.load(path)
+    assert len(loaded) == 3
+    assert loaded.prefix == 'before/'
+    for name, member in members.items():
+      assert loaded.members[name].same(member)
+    assert differ.manifest.Manifest.load("/does/not/exist") == None
+
+  def test_non_ascii(self):
+    """Names are loaded back as the bytes they were saved with"""
+    names = ['caf\xc3\xa9/menu', 'latin1/caf\xe9', 'plain']
+    members = dict((name, differ.archive.Member(name, 1, 0100644, 'ab'))
+                   for name in names)
+    manifest = differ.manifest.Manifest(members, 'top\xc3\xa9/',
+                                        {'caf\xc3\xa9/link': 'plain'})
+    path = os.path.join(self.base, "manifest")
+    manifest.save(path)
+    loaded = differ.manifest.Manifest.load(path)
+    assert sorted(loaded.members) == sorted(names)
+    for name in names:
+      assert type(name) is str
+      assert type(loaded.members[name].name) is str
+      assert type(loaded.members[name].digest) is str
+    assert loaded.prefix == 'top\xc3\xa9/'
+    assert type(loaded.prefix) is str
+    assert loaded.links == {'caf\xc3\xa9/link': 'plain'}
+
+  def test_cache_non_ascii(self):
+    """An archive with non-ASCII names is compared from its manifest"""
+    import tarfile
+    cache_dir = os.path.join(self.base, "cache")
+    paths = []
+    for name, data in [("before", "a"), ("after", "b")]:
+      src = os.path.join(self.base, name)
+      os.makedirs(os.path.join(src, "top"))
+      with open(os.path.join(src, "top", "caf\xc3\xa9"), 'w') as fp:
+        fp.write(data)
+      path = os.path.join(self.base, "{}.tgz".format(name))
+      with tarfile.open(path, "w:gz") as tf:
+        tf.add(os.path.join(src, "top"), "top")
+      paths.append(path)
+    for run in range(2):
+      obj = differ.utils.Differ(paths[0], paths[1],
+        base=os.path.join(self.base, "out{}".format(run)),
+        cache_dir=cache_dir)
+      changes = list(obj.iter_changes())
+      assert [change.path for change in changes] == ["caf\xc3\xa9"]
+
+  def test_cache_symlinks(self):
+    """The cache doesn't change the changes of symlinks"""
+    import tarfile
+    cache_dir = os.path.join(self.base, "cache")
+    paths = []
+    for name, target in [("before", "x"), ("after", "y")]:
+      path = os.path.join(self.base, "{}.tar".format(name))
+      paths.append(make_tar([("top/x", "xx\n"), ("top/y", "yyyy\n"),
+                             ("top/link", (tarfile.SYMTYPE, target))], path))
+    results = []
+    for run, kwargs in enumerate([{}, {'cache_dir': cache_dir},
+                                  {'cache_dir': cache_dir}]):
+      obj = differ.utils.Differ(paths[0], paths[1],
+        base=os.path.join(self.base, "out{}".format(run)), **kwargs)
+      results.append(sorted((change.path, change.state)
+                            for change in obj.iter_changes()))
+    assert results[0] == results[1] == results[2]
+    manifest = differ.manifest.ManifestCache(cache_dir).get(paths[1])
+    assert manifest.members['link'].linkname == 'y'
+
+  def test_cache(self):
+    cache_dir = os.path.join(self.base, "cache")
+    cache = differ.manifest.ManifestCache(cache_dir, max_entries=2)
+    path = "tests/files/before.tgz"
+    assert cache.get(path) == None
+    assert cache.key("/does/not/exist") == None
+    archive = differ.archive.Archive(path)
+    assert cache.put(path, differ.manifest.Manifest(archive.scan()))
+    assert len(cache.get(path)) == 3
+    assert cache.key(path) == differ.digest.digest_file(path)
+
+    # The least recently used manifests are evicted
+    for name in ['before.tar', 'before.zip']:
+      time.sleep(0.01)
+      path = "tests/files/{}".format(name)
+      archive = differ.archive.Archive(path)
+      cache.put(path, differ.manifest.Manifest(archive.scan()))
+    assert cache.get("tests/files/before.tgz") == None
+    assert cache.get("tests/files/before.zip") is not None
+
+  def test_cache_index(self):
+    """The index only keeps the digests that can still be used"""
+    import json
+    cache_dir = os.path.join(self.base, "cache")
+    cache = differ.manifest.ManifestCache(cache_dir, max_entries=2)
+    def load_index():
+      with open(cache.index_path) as fp:
+        return json.load(fp)
+
+    # An archive that changes replaces its digest
+    path = os.path.join(self.base, "changing.tar")
+    for count in range(4):
+      os.system("cp tests/files/{} {}".format(
+        ["before.tar", "after.tar"][count % 2], path))
+      os.utime(path, (count, count))
+      archive = differ.archive.Archive(path)
+      assert cache.put(path, differ.manifest.Manifest(archive.scan()))
+      assert load_index().values() == [cache.key(path)]
+
+    # The digests of the evicted manifests are forgotten
+    paths = []
+    for name in ['before.tgz', 'before.tar.bz2', 'before.zip']:
+      time.sleep(0.01)
+      paths.append(os.path.join(self.base, name))
+      os.system("cp tests/files/{} {}".format(name, paths[-1]))
+      archive = differ.archive.Archive(paths[-1])
+      cache.put(paths[-1], differ.manifest.Manifest(archive.scan()))
+    index = load_index()
+    assert len(index) == 2
+    assert sorted(index.values()) == sorted(cache.key(path)
+                                            for path in paths[1:])
@@ -0,0 +1,61 @@
+import os
+import sys
+import pytest
+
+from context import differ
+
+def test_metrics():
+  metrics = differ.metrics.Metrics()
+  with metrics.phase("setup"):
+    pass
+  metrics.add("compare", 1.0)
+  metrics.add("compare", 0.5)
+  assert metrics.phases == ["setup", "compare"]
+  assert metrics.timings["compare"] == 1.5
+  assert "compare=1.500s" in repr(metrics)
+  data = metrics.as_dict()
+  assert data["phases"] == ["setup", "compare"]
+  assert data["total"] >= 1.5
+
+def test_metrics_counters():
+  metrics = differ.metrics.Metrics()
+  assert metrics.files_per_sec() is None
+  with metrics.timer("strip"):
+    pass
+  metrics.count("paths", 10)
+  metrics.count("subprocesses")
+  metrics.add("compare", 2.0)
+  assert metrics.files_per_sec() == 5.0
+  data = metrics.as_dict()
+  assert data["counters"] == {"paths": 10, "subprocesses": 1}
+  assert "strip" in data["timers"]
+  text = metrics.format()
+  assert "count subprocesses" in text
+  assert "files/sec" in text
+
+class TestProfile():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+
+  def test_profile(self):
+    obj = differ.utils.Differ(
+      "tests/files/plugins/iptables/before",
+      "tests/files/plugins/iptables/after",
+      base=self.base,
+      profile=True)
+    obj.start()
+    data = obj.metrics.as_dict()
+    assert data["phases"][:3] == ["setup", "walk", "normalize"]
+    counters = data["counters"]
+    assert counters["subprocesses"] == 2
+    assert counters["files_stripped"] == 2
+    assert counters["paths"] == len(obj.path1_obj.paths)
+    assert "strip" in data["timers"]
+    with open(obj.summary_path) as fp:
+      assert "count files_stripped" in fp.read()
@@ -0,0 +1,154 @@
+import io
+import os
+import sys
+import tarfile
+import pytest
+
+from context import differ, write, make_tar, make_zip
+
+class TestNested():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def make_bundles(self):
+    """Create 2 directories with a bundle of per node archives"""
+    logs1 = make_tar({"etc/hosts": b"127.0.0.1 localhost\n",
+                      "var/log/old.log": b"old\n"})
+    logs2 = make_tar({"etc/hosts": b"127.0.0.1 localhost\n10.0.0.1 node\n",
+                      "var/log/new.log": b"new\n"})
+    write(self.base, "before/bundle.tgz", make_tar({
+      "node1/logs.tar": logs1,
+      "node1/core.bin": b"\0\1\2\3",
+      "node1/same": b"same\n"}, mode='w:gz'))
+    write(self.base, "after/bundle.tgz", make_tar({
+      "node1/logs.tar": logs2,
+      "node1/core.bin": b"\0\1\2\4",
+      "node1/same": b"same\n"}, mode='w:gz'))
+    write(self.base, "before/config.zip", make_zip({"a.conf": b"a = 1\n"}))
+    write(self.base, "after/config.zip", make_zip({"a.conf": b"a = 2\n"}))
+    return os.path.join(self.base, "before"), os.path.join(self.base, "after")
+
+  def run(self, depth, out=None, **kwargs):
+    before, after = self.make_bundles()
+    obj = differ.utils.Differ(before, after,
+      base=os.path.join(self.base, out or "out{}".format(depth)),
+      nested_depth=depth,
+      **kwargs)
+    changes = list(obj.iter_changes())
+    return obj, dict((change.path, change) for change in changes)
+
+  def test_virtual_path(self):
+    assert differ.nested.virtual_path("a.tgz", "etc/foo") == "a.tgz!/etc/foo"
+    assert differ.nested.virtual_path(
+      differ.nested.virtual_path("a.tgz", "b.tar"),
+      "etc/foo") == "a.tgz!/b.tar!/etc/foo"
+
+  def test_archive_fileobj(self):
+    data = make_tar({"top/etc/hosts": b"hosts\n", "top/etc/motd": b"hi\n"})
+    archive = differ.archive.Archive("inner.tar",
+                                     fileobj=io.BytesIO(data))
+    assert archive.valid
+    members = archive.scan()
+    assert sorted(members) == ["etc/hosts", "etc/motd"]
+    assert archive.read(["etc/motd"]) == {"etc/motd": b"hi\n"}
+
+  def test_nested_disabled(self):
+    obj, changes = self.run(0)
+    assert sorted(changes) == ["bundle.tgz", "config.zip"]
+    assert obj.changes.counts()['changed'] == 2
+
+  def test_nested_depth(self):
+    obj, changes = self.run(1)
+    assert sorted(changes) == [
+      "bundle.tgz",
+      "bundle.tgz!/core.bin",
+      "bundle.tgz!/logs.tar",
+      "config.zip!/a.conf",
+    ]
+    assert os.path.exists(os.path.join(
+      obj.changed_dir, "bundle.tgz!/core.bin.bindiff"))
+    assert os.path.exists(os.path.join(
+      obj.changed_dir, "config.zip!/a.conf.diff"))
+
+  def test_nested_recursive(self):
+    obj, changes = self.run(2)
+    assert sorted(changes) == [
+      "bundle.tgz",
+      "bundle.tgz!/core.bin",
+      "bundle.tgz!/logs.tar!/etc/hosts",
+      "bundle.tgz!/logs.tar!/var/log/new.log",
+      "bundle.tgz!/logs.tar!/var/log/old.log",
+      "config.zip!/a.conf",
+    ]
+    # The archives themselves are not changed, their members are
+    state = differ.changes.CHANGE_STATE
+    assert changes["bundle.tgz"].state == state.CHANGED_STAT
+    assert changes["bundle.tgz!/logs.tar!/var/log/new.log"].state == state.ADD
+    assert obj.changes.counts()['removed'] == 1
+
+    with open(os.path.join(obj.changed_dir,
+                           "bundle.tgz!/logs.tar!/etc/hosts.diff")) as fp:
+      diff = fp.read()
+    assert "!/logs.tar!/etc/hosts\t" in diff
+    assert "+10.0.0.1 node\n" in diff
+    with open(os.path.join(obj.added_dir,
+                           "bundle.tgz!/logs.tar!/var/log/new.log")) as fp:
+      assert fp.read() == "new\n"
+    with open(os.path.join(obj.removed_dir,
+                           "bundle.tgz!/logs.tar!/var/log/old.log")) as fp:
+      assert fp.read() == "old\n"
+
+  def test_nested_unreadable(self):
+    """An archive that can't be read is diffed as a file"""
+    write(self.base, "before/broken.tgz", b"not a tar file\n")
+    write(self.base, "after/broken.tgz", b"still not a tar file\n")
+    obj, changes = self.run(2, renames=False)
+    assert "broken.tgz" in changes
+    assert changes["broken.tgz"].state & differ.changes.CHANGE_STATE.CHANGED
+
+  def test_nested_links(self):
+    """A link that points to another member is changed"""
+    for name, target in [("before", "a"), ("after", "b")]:
+      write(self.base, "{}/links.tar".format(name), make_tar([
+        ("etc/a", b"same"), ("etc/b", b"same"),
+        ("etc/sym", (tarfile.SYMTYPE, target)),
+        ("etc/hard", (tarfile.LNKTYPE, "etc/" + target)),
+        ("etc/kept", (tarfile.SYMTYPE, "a"))]))
+    obj, changes = self.run(1)
+    # The single top directory is stripped from the hard link targets too
+    assert "links.tar!/kept" not in changes
+    state = differ.changes.CHANGE_STATE
+    for name in ["sym", "hard"]:
+      vpath = "links.tar!/{}".format(name)
+      assert changes[vpath].state & state.CHANGED
+      with open(os.path.join(obj.changed_dir, vpath + ".diff")) as fp:
+        diff = fp.read()
+      assert "-a\n" in diff and "+b\n" in diff
+
+  def test_nested_filter(self):
+    """The rules are matched against the virtual paths of the members"""
+    # A rule with a '/' only matches from the top of the compared paths
+    path_filter = differ.filters.PathFilter(exclude=["etc/hosts"])
+    obj, changes = self.run(2, "filter1", path_filter=path_filter)
+    assert "bundle.tgz!/logs.tar!/etc/hosts" in changes
+    # A rule without one matches at any depth
+    path_filter = differ.filters.PathFilter(exclude=["hosts", "*.log"])
+    obj, changes = self.run(2, "filter2", path_filter=path_filter)
+    assert sorted(changes) == ["bundle.tgz", "bundle.tgz!/core.bin",
+                               "config.zip!/a.conf"]
+    path_filter = differ.filters.PathFilter(
+      exclude=["bundle.tgz!/logs.tar!/var/"])
+    obj, changes = self.run(2, "filter3", path_filter=path_filter)
+    assert "bundle.tgz!/logs.tar!/etc/hosts" in changes
+    assert "bundle.tgz!/logs.tar!/var/log/new.log" not in changes
+    # The members of an archive that is included are all compared
+    path_filter = differ.filters.PathFilter(include=["config.zip"])
+    obj, changes = self.run(2, "filter4", path_filter=path_filter)
+    assert sorted(changes) == ["config.zip!/a.conf"]
@@ -0,0 +1,47 @@
+import os
+import sys
+import pytest
+
+from context import differ
+
+class TestNormalize():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def test_normalize(self):
+    src_dir = os.path.join(self.base, "src")
+    os.mkdir(src_dir)
+    with open("tests/files/plugins/iptables/before/my_iptables_mangle") as fp:
+      content = fp.read()
+    for name in ["iptables_one", "iptables_two", "other"]:
+      with open(os.path.join(src_dir, name), 'w') as fp:
+        fp.write(content)
+
+    obj = differ.normalize.Normalizer(os.path.join(self.base, "normalized"))
+    assert obj.matches("iptables_one")
+    assert not obj.matches("other")
+
+    paths = differ.utils.Paths(src_dir)
+    dest_dir = os.path.join(self.base, "normalized", "src")
+    assert obj.normalize(paths, "other", dest_dir) == None
+    for name in ["iptables_one", "iptables_two"]:
+      result = obj.normalize(paths, name, dest_dir)
+      assert result == os.path.join(dest_dir, name)
+      assert paths.get(name) == result
+      assert paths.stat(name).size < len(content)
+
+    # Identical files are only normalized once
+    assert obj.normalized == 1
+    assert obj.reused == 1
+
+    # The original files are left alone
+    assert paths.get("other") == os.path.join(src_dir, "other")
+    with open(os.path.join(src_dir, "iptables_one")) as fp:
+      assert fp.read() == content
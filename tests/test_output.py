@@ -0,0 +1,60 @@
+import os
+import sys
+import stat
+import pytest
+
+from context import differ
+
+class TestOutput():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def test_copy(self):
+    obj = differ.output.OutputWriter(os.path.join(self.base, "records"))
+    dest = os.path.join(self.base, "out", "sub", "b")
+    assert obj.copy("tests/files/before/b", dest)
+    assert os.path.dirname(dest) in obj.dirs
+    with open(dest) as fp:
+      assert fp.read() == "bye\n"
+    assert os.stat(dest).st_mode & stat.S_IXUSR
+
+    # Anything that isn't a regular file is not copied
+    fifo = os.path.join(self.base, "fifo")
+    os.mkfifo(fifo)
+    assert not obj.copy(fifo, os.path.join(self.base, "out", "fifo"))
+    assert not obj.copy("/does/not/exist", os.path.join(self.base, "out", "x"))
+
+  def test_copy_data(self):
+    src = "tests/files/plugins/iptables/before/my_iptables_mangle"
+    dest = os.path.join(self.base, "copy")
+    src_fd = os.open(src, os.O_RDONLY)
+    dest_fd = os.open(dest, os.O_WRONLY | os.O_CREAT)
+    differ.output.copy_data(src_fd, dest_fd, os.stat(src).st_size)
+    os.close(src_fd)
+    os.close(dest_fd)
+    assert differ.digest.files_equal(src, dest)
+
+  def test_record(self):
+    directory = os.path.join(self.base, "records")
+    obj = differ.output.OutputWriter(directory)
+    output = obj.record("size", "b", "Size 3 => 4")
+    assert obj.record("size", "a", "Size 1 => 2") == output
+    assert output == os.path.join(directory, "size")
+    obj.record("mode", "a", "Permissions 0644 => 0600")
+    obj.record("mode", "a", "File Type regular => symlink")
+    # The records are written right away and sorted once closed
+    with open(output) as fp:
+      assert fp.read() == "b: Size 3 => 4\na: Size 1 => 2\n"
+    obj.close()
+    with open(output) as fp:
+      assert fp.read() == "a: Size 1 => 2\nb: Size 3 => 4\n"
+    with open(os.path.join(directory, "mode")) as fp:
+      assert fp.read() == ("a: Permissions 0644 => 0600\n"
+                           "a: File Type regular => symlink\n")
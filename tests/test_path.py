@@ -41,6 +41,21 @@ class TestPath():
     # ZIP
     assert 'unzip' in obj.extract_cmd("test.zip")
 
+  def test_extract_cmd_parallel(self, monkeypatch):
+    obj = differ.path.Path(None)
+    monkeypatch.setattr(differ.archive, '_programs',
+                        {'pigz': '/usr/bin/pigz', 'pbzip2': None,
+                         'xz': '/usr/bin/xz'})
+    assert obj.extract_cmd("test.tgz", parallel=True) == \
+      "tar -I pigz -xf test.tgz"
+    assert obj.extract_cmd("test.tar.xz", parallel=True) == \
+      "tar -I 'xz -T0' -xf test.tar.xz"
+    # Without a parallel decompressor the usual command is used
+    assert 'tar xjf' in obj.extract_cmd("test.tar.bz2", parallel=True)
+    assert 'tar xf' in obj.extract_cmd("test.tar", parallel=True)
+    assert differ.archive.pipe_decompressor("test.tgz") == ['pigz', '-dc']
+    assert differ.archive.pipe_decompressor("test.tar") is None
+
   def test_copy(self):
     dest_dir = os.path.join(self.base, "dest_dir")
     os.mkdir(dest_dir)
@@ -91,3 +106,68 @@ class TestPath():
       pass
     obj = differ.utils.Path(path)
     assert not obj.extract_by_name(self.base)
+
+  def test_extract(self):
+    # An invalid path can't be extracted
+    assert not differ.utils.Path(None).extract(self.base)
+    obj = differ.utils.Path("tests/files/before.tgz")
+    assert not obj.extract(None)
+
+    # Archives are extracted straight into the destination
+    for f_name in ['before.tar', 'before.tgz', 'before.tar.bz2',
+                   'before.tar.xz', 'before.zip']:
+      dest_dir = os.path.join(self.base, f_name)
+      obj = differ.utils.Path("tests/files/{}".format(f_name))
+      assert obj.extract(dest_dir)
+      assert sorted(os.listdir(os.path.join(dest_dir, "before"))) == [
+        'a', 'b', 'i_am_special']
+    assert not os.path.exists(os.path.join(self.base, "before.tgz",
+                                           "before.tgz"))
+
+    path = os.path.join(self.base, "name.noexten")
+    with open(path, 'w') as fp:
+      pass
+    assert not differ.utils.Path(path).extract(self.base)
+
+  def test_extract_spaces(self):
+    """The extension is matched before the path is quoted"""
+    for f_name in ['before.tgz', 'before.zip']:
+      path = os.path.join(self.base, "with space's", f_name)
+      os.makedirs(os.path.dirname(path))
+      os.system("cp tests/files/{} \"{}\"".format(f_name, path))
+      dest_dir = os.path.join(self.base, "dest {}".format(f_name))
+      assert differ.utils.Path(path).extract(dest_dir)
+      assert sorted(os.listdir(os.path.join(dest_dir, "before"))) == [
+        'a', 'b', 'i_am_special']
+      os.system("rm -rf \"{}\"".format(os.path.dirname(path)))
+
+  def test_prepare_path_fails(self):
+    path = os.path.join(self.base, "broken.tgz")
+    with open(path, 'w') as fp:
+      fp.write("not a tar file")
+    with pytest.raises(IOError):
+      differ.utils.prepare_path(differ.utils.Path(path),
+                                os.path.join(self.base, "dest"))
+    obj = differ.utils.Differ(path, "tests/files/after.tgz",
+                              base=os.path.join(self.base, "out"))
+    with pytest.raises(IOError):
+      obj.start()
+
+  def test_link_tree(self):
+    src_dir = os.path.join(self.base, "src")
+    os.makedirs(os.path.join(src_dir, "sub"))
+    with open(os.path.join(src_dir, "sub", "file"), 'w') as fp:
+      fp.write("content")
+
+    obj = differ.utils.Path(src_dir)
+    dest_dir = os.path.join(self.base, "dest")
+    assert obj.extract(dest_dir)
+    src_stat = os.stat(os.path.join(src_dir, "sub", "file"))
+    dest_stat = os.stat(os.path.join(dest_dir, "sub", "file"))
+    # Both are on the same file system so the file is hard linked
+    assert src_stat.st_ino == dest_stat.st_ino
+
+    # The destination must not exist yet
+    assert not obj.link_tree(dest_dir)
+    assert not differ.utils.Path("tests/files/before.tgz").link_tree(
+      os.path.join(self.base, "other"))
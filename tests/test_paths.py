@@ -12,3 +12,80 @@ def test_utils_paths():
   # A non-existant path should cause paths to be empty
   paths = differ.utils.Paths("/does/not/exist")
   assert not paths.paths
+
+def test_paths_walk():
+  paths = differ.utils.Paths("tests/files/plugins")
+  assert paths.paths == [
+    'iptables/after.tgz',
+    'iptables/after/my_iptables_mangle',
+    'iptables/before.tgz',
+    'iptables/before/my_iptables_mangle',
+  ]
+  assert paths.has('iptables/after.tgz')
+  assert not paths.has('iptables')
+  assert (sorted(rel for rel, record in differ.paths.walk("tests/files/plugins"))
+          == paths.paths)
+
+def test_paths_reconcile():
+  paths1 = differ.utils.Paths("base1", paths=['a', 'b', 'c'])
+  paths2 = differ.utils.Paths("base2", paths=['d', 'c', 'a'])
+  assert paths1.reconcile(paths2) == (['b'], ['a', 'c'], ['d'])
+  assert paths2.reconcile(paths1) == (['d'], ['c', 'a'], ['b'])
+
+def test_paths_stat():
+  base = "/tmp/differ_paths"
+  os.system("rm -rf {}".format(base))
+  os.makedirs(base)
+  with open(os.path.join(base, "file"), 'w') as fp:
+    fp.write("content")
+  os.symlink("file", os.path.join(base, "link"))
+
+  paths = differ.utils.Paths(base)
+  assert paths.paths == ['file', 'link']
+  assert paths.stat('file').size == 7
+  assert paths.stat('link').type == 'regular'
+  assert paths.stat('missing') == None
+
+  paths = differ.utils.Paths(base, follow_symlinks=False)
+  assert paths.stat('file').type == 'regular'
+  assert paths.stat('link').type == 'symlink'
+  assert paths.stat('link').size == 4
+
+  # Paths passed in are looked up when needed
+  paths = differ.utils.Paths(base, paths=['file'])
+  assert not paths.stats
+  assert paths.stat('file').size == 7
+  assert 'file' in paths.stats
+
+@pytest.mark.parametrize("follow_symlinks", [True, False])
+def test_paths_walk_without_scandir(monkeypatch, follow_symlinks):
+  """Without scandir the walk finds the same paths and stat records"""
+  base = "/tmp/differ_paths"
+  os.system("rm -rf {}".format(base))
+  os.makedirs(os.path.join(base, "dir", "sub"))
+  for name in ["file", "dir/inner", "dir/sub/deep"]:
+    with open(os.path.join(base, name), 'w') as fp:
+      fp.write(name)
+  os.symlink("file", os.path.join(base, "link"))
+  os.symlink("dir", os.path.join(base, "dirlink"))
+  os.symlink("missing", os.path.join(base, "broken"))
+
+  def records(walked):
+    return sorted((rel, record.mode, record.size) for rel, record in walked)
+
+  expected = records(differ.paths.walk(base, follow_symlinks))
+  monkeypatch.setattr(differ.paths, 'scandir', None)
+  calls = []
+  lstat = os.lstat
+  def counting_lstat(path):
+    calls.append(path)
+    return lstat(path)
+  monkeypatch.setattr(os, 'lstat', counting_lstat)
+  assert records(differ.paths.walk(base, follow_symlinks)) == expected
+  # A symlink to a directory is only listed when it is not followed
+  names = ['broken', 'dir/inner', 'dir/sub/deep', 'file', 'link']
+  if not follow_symlinks:
+    names.insert(3, 'dirlink')
+  assert [rel for rel, mode, size in expected] == names
+  # A single lstat per entry
+  assert len(calls) == len(set(calls)) == 8
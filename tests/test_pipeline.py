@@ -0,0 +1,169 @@
+import os
+import sys
+import tarfile
+import pytest
+
+from context import differ, make_tar
+
+class TestPipeline():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def run(self, path1, path2, name, **kwargs):
+    base = os.path.join(self.base, name)
+    os.makedirs(base)
+    obj = differ.utils.Differ(path1, path2, base=base, **kwargs)
+    changes = list(obj.iter_changes())
+    return obj, dict((change.path, (change.state, sorted(
+      os.path.basename(item) for item in change.related)))
+      for change in changes)
+
+  @pytest.mark.parametrize("path1,path2", [
+    ("tests/files/before.tgz", "tests/files/after.tgz"),
+    ("tests/files/before.zip", "tests/files/after.tgz"),
+    ("tests/files/before.tar.xz", "tests/files/before.tar"),
+    ("tests/files/plugins/iptables/before.tgz",
+     "tests/files/plugins/iptables/after.tgz"),
+  ])
+  def test_pipeline(self, path1, path2):
+    classic, expected = self.run(path1, path2, "classic")
+    for jobs in [1, 3]:
+      obj, changes = self.run(path1, path2, "pipeline{}".format(jobs),
+                              pipeline=True, jobs=jobs)
+      assert obj.can_pipeline()
+      assert changes == expected
+      assert obj.changes.counts() == classic.changes.counts()
+      assert sorted(obj.path1_obj.paths) == classic.path1_obj.paths
+      # Nothing extracted is left behind
+      for path_dir in [obj.path1_dir, obj.path2_dir]:
+        for root, dirs, files in os.walk(path_dir):
+          assert not files
+
+  def test_pipeline_close(self):
+    obj = differ.utils.Differ("tests/files/before.tgz",
+                              "tests/files/after.tgz",
+                              base=self.base,
+                              pipeline=True)
+    changes = obj.iter_changes()
+    next(changes)
+    changes.close()
+    assert not differ.utils.Differ("tests/files/before",
+                                   "tests/files/after.tgz",
+                                   pipeline=True).can_pipeline()
+
+  def test_iter_extract(self):
+    archive = differ.archive.Archive("tests/files/before.tgz")
+    dest = os.path.join(self.base, "dest")
+    names = list(archive.iter_extract(dest))
+    assert archive.prefix == "before/"
+    for name in names:
+      assert os.path.exists(os.path.join(dest, name))
+    assert (sorted(archive.final_name(name) for name in names) ==
+            sorted(archive.scan()))
+
+  def test_pipeline_hardlinks(self):
+    """Link targets are kept on disk until their links are extracted"""
+    members = dict(("top/file{}".format(i), "data {}\n".format(i))
+                   for i in range(20))
+    links = [("top/link0", (tarfile.LNKTYPE, "top/file0")),
+             ("top/link1", (tarfile.LNKTYPE, "top/file19")),
+             ("top/link2", (tarfile.LNKTYPE, "top/file0"))]
+    before = make_tar(sorted(members.items()) + links,
+                      os.path.join(self.base, "before.tgz"), 'w:gz')
+    members["top/file0"] = "changed\n"
+    after = make_tar(sorted(members.items()) + links,
+                     os.path.join(self.base, "after.tgz"), 'w:gz')
+    classic, expected = self.run(before, after, "classic")
+    assert sorted(expected) == ["file0", "link0", "link2"]
+    for jobs in [1, 3]:
+      obj, changes = self.run(before, after, "pipeline{}".format(jobs),
+                              pipeline=True, jobs=jobs)
+      assert changes == expected
+      assert len(obj.path2_obj.paths) == 23
+      for path_dir in [obj.path1_dir, obj.path2_dir]:
+        for root, dirs, files in os.walk(path_dir):
+          assert not files
+
+  def test_pipeline_symlinks(self):
+    """Symlink targets are kept on disk until the symlinks are compared"""
+    paths = []
+    for name, target in [("before.tar", "x"), ("after.tar", "y")]:
+      entries = [("top/alink", (tarfile.SYMTYPE, "zz")), ("top/x", "xx\n"),
+                 ("top/y", "yyyy\n")]
+      entries.extend(("top/f{:02d}".format(i), "data {}\n".format(i))
+                     for i in range(50))
+      entries.extend([("top/zlink", (tarfile.SYMTYPE, target)),
+                      ("top/zz", "last\n")])
+      paths.append(make_tar(entries, os.path.join(self.base, name)))
+
+    classic, expected = self.run(paths[0], paths[1], "classic")
+    assert sorted(expected) == ["zlink"]
+    for jobs in [1, 4]:
+      obj, changes = self.run(paths[0], paths[1], "pipeline{}".format(jobs),
+                              pipeline=True, jobs=jobs)
+      assert changes == expected
+      for path_dir in [obj.path1_dir, obj.path2_dir]:
+        for root, dirs, files in os.walk(path_dir):
+          assert not files
+
+  def test_pipeline_roots(self):
+    """Nothing is stripped from archives with several top level directories"""
+    entries = [("etc/f", "f\n"), ("etc/x", "etc\n"), ("var/g", "g\n"),
+               ("var/x", "var\n")]
+    paths = []
+    for name, order in [("before.tar", entries), ("after.tar", entries[::-1])]:
+      paths.append(make_tar(order, os.path.join(self.base, name)))
+
+    classic, expected = self.run(paths[0], paths[1], "classic")
+    assert expected == {}
+    for jobs in [1, 3]:
+      obj, changes = self.run(paths[0], paths[1], "pipeline{}".format(jobs),
+                              pipeline=True, jobs=jobs)
+      assert changes == expected
+      assert sorted(obj.path2_obj.paths) == [name for name, data in entries]
+
+  def test_pipeline_error(self):
+    """An archive that can't be read fails the run"""
+    with open("tests/files/after.tgz", "rb") as fp:
+      data = fp.read()
+    path = os.path.join(self.base, "truncated.tgz")
+    with open(path, "wb") as fp:
+      fp.write(data[:len(data) // 2])
+    obj = differ.utils.Differ("tests/files/before.tgz", path,
+                              base=os.path.join(self.base, "out"),
+                              pipeline=True)
+    assert obj.can_pipeline()
+    with pytest.raises((tarfile.TarError, IOError, EOFError)):
+      list(obj.iter_changes())
+
+  def test_pipeline_compare_error(self):
+    """A path that can't be compared fails the run"""
+    obj = differ.utils.Differ("tests/files/before.tgz",
+                              "tests/files/after.tgz",
+                              base=os.path.join(self.base, "out"),
+                              pipeline=True)
+    compare = obj.compare
+    def failing_compare(path):
+      if path == 'b':
+        raise IOError("Is a directory")
+      compare(path)
+    obj.compare = failing_compare
+    with pytest.raises(IOError):
+      list(obj.iter_changes())
+
+  def test_pipeline_progress(self):
+    calls = []
+    obj = differ.utils.Differ("tests/files/before.tgz",
+                              "tests/files/after.tgz",
+                              base=self.base,
+                              pipeline=True)
+    changes = list(obj.iter_changes(progress=calls.append))
+    assert calls[-1].finished
+    assert calls[-1].eta == 0
@@ -0,0 +1,47 @@
+import os
+import sys
+import pytest
+
+from context import differ
+
+def test_progress():
+  calls = []
+  obj = differ.progress.Progress(3, calls.append, interval=60)
+  assert obj.eta is None
+  assert "unknown" in repr(obj)
+  obj.update()
+  obj.update()
+  # Only the first update and the last one call back within the interval
+  assert len(calls) == 1
+  assert obj.eta is not None
+  obj.update()
+  assert len(calls) == 2
+  assert obj.done == obj.total
+  assert obj.eta == 0
+
+def test_print_progress(tmpdir):
+  path = str(tmpdir.join("progress"))
+  obj = differ.progress.Progress(1)
+  with open(path, "w") as fp:
+    differ.progress.print_progress(obj, fp)
+    obj.update()
+    differ.progress.print_progress(obj, fp)
+  with open(path) as fp:
+    data = fp.read()
+  assert data.startswith("\r0/1 paths")
+  assert data.endswith("ETA 0.0s\n")
+
+def test_progress_unknown_total():
+  calls = []
+  obj = differ.progress.Progress(None, calls.append, interval=60)
+  obj.update()
+  obj.update()
+  # Nothing is finished while the total is not known
+  assert len(calls) == 1
+  assert obj.eta is None
+  assert not obj.finished
+  assert "2/? paths" in repr(obj)
+  obj.total = 3
+  obj.update()
+  assert len(calls) == 2
+  assert obj.finished
@@ -0,0 +1,149 @@
+import os
+import sys
+import pytest
+
+from context import differ, write
+
+class TestRenames():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def make_trees(self):
+    lines = "".join("line {}\n".format(i) for i in range(20))
+    write(self.base, "before/etc/moved", "moved\n")
+    write(self.base, "before/etc/same_size", "aaaaa\n")
+    write(self.base, "before/etc/edited", lines)
+    write(self.base, "before/etc/empty", "")
+    write(self.base, "after/opt/moved", "moved\n")
+    write(self.base, "after/opt/same_size", "bbbbb\n")
+    write(self.base, "after/opt/edited",
+          lines.replace("line 5\n", "line five\n"))
+    write(self.base, "after/opt/empty", "")
+    return os.path.join(self.base, "before"), os.path.join(self.base, "after")
+
+  def test_find_renames(self):
+    before, after = self.make_trees()
+    path1_obj = differ.paths.Paths(before)
+    path2_obj = differ.paths.Paths(after)
+    removed, common, added = path1_obj.reconcile(path2_obj)
+    assert not common
+
+    renames = differ.renames.find_renames(path1_obj, removed,
+                                          path2_obj, added)
+    assert [(r.source, r.path, r.score) for r in renames] == [
+      ("etc/moved", "opt/moved", 1.0)]
+    # Only the files that have the same size were hashed
+    assert sorted(path2_obj.digests) == ["opt/moved", "opt/same_size"]
+
+    renames = differ.renames.find_renames(path1_obj, removed,
+                                          path2_obj, added,
+                                          threshold=0.8)
+    assert [(r.source, r.path) for r in renames] == [
+      ("etc/edited", "opt/edited"),
+      ("etc/moved", "opt/moved")]
+    assert 0.8 <= renames[0].score < 1
+
+  def test_find_renames_size_changed(self):
+    """A file whose size changed a lot is matched by its lines"""
+    lines = "".join("line {}\n".format(i) for i in range(10))
+    write(self.base, "before/etc/grown", lines)
+    write(self.base, "after/opt/grown",
+               lines.replace("line 5\n", "line 5 {}\n".format("x" * 5000)))
+    # Most of the lines are missing even though the size is close
+    write(self.base, "before/etc/short", "a\nb\nc\nd\n" + "x" * 100 + "\n")
+    write(self.base, "after/opt/short", "a\n" + "y" * 108 + "\n")
+    path1_obj = differ.paths.Paths(os.path.join(self.base, "before"))
+    path2_obj = differ.paths.Paths(os.path.join(self.base, "after"))
+    removed, common, added = path1_obj.reconcile(path2_obj)
+    renames = differ.renames.find_renames(path1_obj, removed,
+                                          path2_obj, added,
+                                          threshold=0.8)
+    assert [(r.source, r.path, r.score) for r in renames] == [
+      ("etc/grown", "opt/grown", 0.9)]
+
+  def test_count_lines(self):
+    for name, data, count in [("empty", "", 0), ("one", "a", 1),
+                              ("two", "a\nb\n", 2), ("three", "a\n\nb", 3)]:
+      write(self.base, name, data)
+      assert differ.renames.count_lines(os.path.join(self.base, name)) == count
+    assert differ.renames.count_lines(os.path.join(self.base, "none")) is None
+
+  def test_differ_renames(self):
+    before, after = self.make_trees()
+    obj = differ.utils.Differ(before, after, base=self.base, in_place=True,
+                              similarity=0.8)
+    obj.start()
+    CHANGE_STATE = differ.changes.CHANGE_STATE
+    assert sorted(obj.changes.get_list_by_state(CHANGE_STATE.RENAMED)) == [
+      "opt/edited", "opt/moved"]
+    assert obj.changes.get("opt/moved").source == "etc/moved"
+    assert not obj.changes.get("opt/moved").related
+    edited = obj.changes.get("opt/edited")
+    assert edited.state & CHANGE_STATE.CHANGED
+    # The stat is compared with the one of the removed path
+    assert edited.state & CHANGE_STATE.CHANGED_STAT
+    assert edited.size == (150, 153)
+    assert [os.path.basename(item) for item in edited.related] == [
+      "size", "edited.diff"]
+    assert sorted(obj.changes.get_removed()) == ["etc/empty", "etc/same_size"]
+    assert not os.path.exists(os.path.join(obj.removed_dir, "etc", "moved"))
+    assert not os.path.exists(os.path.join(obj.added_dir, "opt", "moved"))
+    with open(obj.summary_path) as fp:
+      assert "# of files renamed 2" in fp.read()
+
+    os.makedirs(os.path.join(self.base, "off"))
+    obj = differ.utils.Differ(before, after,
+                              base=os.path.join(self.base, "off"),
+                              in_place=True,
+                              renames=False)
+    obj.start()
+    assert not obj.changes.get_list_by_state(CHANGE_STATE.RENAMED)
+    assert len(obj.changes.get_removed()) == 4
+
+    # Renames are only looked for when asked
+    os.makedirs(os.path.join(self.base, "default"))
+    obj = differ.utils.Differ(before, after,
+                              base=os.path.join(self.base, "default"),
+                              in_place=True)
+    assert not obj.detect_renames
+    obj.start()
+    assert not obj.changes.get_list_by_state(CHANGE_STATE.RENAMED)
+
+    os.makedirs(os.path.join(self.base, "exact"))
+    os.chmod(os.path.join(after, "opt/moved"), 0600)
+    obj = differ.utils.Differ(before, after,
+                              base=os.path.join(self.base, "exact"),
+                              in_place=True,
+                              renames=True)
+    obj.start()
+    moved = obj.changes.get("opt/moved")
+    assert moved.state & CHANGE_STATE.RENAMED
+    assert moved.state & CHANGE_STATE.CHANGED_STAT
+    assert moved.mode[1] & 0777 == 0600
+
+  def test_similarity(self):
+    lines = "".join("line {}\n".format(i) for i in range(20))
+    write(self.base, "one", lines)
+    write(self.base, "two", lines.replace("line 5\n", "line five\n"))
+    write(self.base, "three", "".join(reversed(lines.splitlines(True))))
+    one = os.path.join(self.base, "one")
+    two = os.path.join(self.base, "two")
+    three = os.path.join(self.base, "three")
+    assert differ.renames.similarity(one, two) == 0.95
+    # Every line is there but only one of them is in order
+    assert differ.renames.similarity(one, three) == 0.05
+    assert differ.renames.similarity(one, three, threshold=0.5) == 0.05
+    assert differ.renames.similarity(one, two, threshold=0.5) == 0.95
+    # Under the threshold only the lines in any order are counted
+    write(self.base, "four", "".join(reversed(lines.splitlines(True)[:10])) +
+                       "other\n" * 10)
+    four = os.path.join(self.base, "four")
+    assert differ.renames.similarity(one, four) == 0.05
+    assert differ.renames.similarity(one, four, threshold=0.8) == 0.5
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import pytest
+
+from context import differ
+
+class TestReport():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def test_state_names(self):
+    CHANGE_STATE = differ.changes.CHANGE_STATE
+    assert differ.changes.state_names(CHANGE_STATE.NONE) == []
+    assert differ.changes.state_names(
+      CHANGE_STATE.CHANGED | CHANGE_STATE.CHANGED_STAT) == [
+      'changed', 'changed_stat']
+
+  def test_text(self):
+    path = os.path.join(self.base, "report")
+    with open(path, "w") as fp:
+      report = differ.report.TextReport(fp)
+      change = differ.changes.Change("a")
+      change.state = differ.changes.CHANGE_STATE.ADD
+      report.change(change)
+      change.state = differ.changes.CHANGE_STATE.CHANGED
+      report.change(change)
+      report.summary({}, "done")
+    with open(path) as fp:
+      assert fp.read() == "a was added\ndone\n"
+
+  def test_jsonl(self):
+    path = os.path.join(self.base, "report")
+    with open(path, "w") as fp:
+      obj = differ.utils.Differ(
+        "tests/files/stat_changes/before",
+        "tests/files/stat_changes/after",
+        base=self.base,
+        report=differ.report.JsonLinesReport(fp))
+      assert obj._valid
+      obj.start()
+    with open(path) as fp:
+      records = [json.loads(line) for line in fp]
+
+    summary = records.pop()
+    paths = [record['path'] for record in records]
+    assert len(paths) == len(set(paths))
+    changed = [r for r in records if 'changed_stat' in r['states']]
+    assert changed
+    assert len(changed) == summary['summary']['changed_stat']
+    for record in changed:
+      assert record['size'] or record['mode']
+      if record['size']:
+        assert record['size'][0] != record['size'][1]
+      if record['mode']:
+        assert record['mode'][0] != record['mode'][1]
+      assert record['related']
+      assert set(record) == set(
+        ['path', 'state', 'states', 'size', 'mode', 'related', 'source'])
+
+  def test_jsonl_non_utf8(self):
+    """A path that is not UTF-8 doesn't fail the report"""
+    path = os.path.join(self.base, "report")
+    with open(path, "w") as fp:
+      report = differ.report.JsonLinesReport(fp)
+      for name in [b"caf\xc3\xa9", b"caf\xe9"]:
+        change = differ.changes.Change(name)
+        change.state = differ.changes.CHANGE_STATE.ADD
+        change.related = [b"added/" + name]
+        report.change(change)
+      report.section(b"before\xff")
+    with open(path) as fp:
+      records = [json.loads(line) for line in fp]
+    assert records[0]['path'] == u"caf\xe9"
+    assert records[1]['path'] == u"caf\ufffd"
+    assert records[1]['related'] == [u"added/caf\ufffd"]
+    assert records[2]['section'] == u"before\ufffd"
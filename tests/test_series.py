@@ -0,0 +1,52 @@
+import os
+import sys
+import pytest
+
+from context import differ
+import differ.series
+
+class TestSeries():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def test_series(self):
+    snapshots = [
+      "tests/files/before.tgz",
+      "tests/files/after.tgz",
+      "tests/files/before.zip",
+    ]
+    assert not differ.series.Series(snapshots[:1], base=self.base)._valid
+    obj = differ.series.Series(snapshots, base=self.base)
+    assert obj._valid
+    assert "NOT VALID" not in repr(obj)
+    obj.start()
+
+    # Every snapshot is walked once and shared by the pairs it is part of
+    assert len(obj.snapshots) == 3
+    assert len(obj.differs) == 2
+    assert obj.differs[0].path2_obj is obj.differs[1].path1_obj
+    assert obj.differs[1].path1_obj.digests
+
+    # What was removed comes back
+    states = [change.state for index, change in obj.timeline["i_am_special"]]
+    assert [index for index, change in obj.timeline["i_am_special"]] == [0, 1]
+    CHANGE_STATE = differ.changes.CHANGE_STATE
+    assert states == [CHANGE_STATE.REMOVED, CHANGE_STATE.ADD]
+    with open(obj.timeline_path) as fp:
+      data = fp.read()
+    assert "i_am_special\n  before.tgz -> after.tgz: removed\n" in data
+    assert "  after.tgz -> before.zip: added\n" in data
+
+    # The pairs match running the differ on each pair
+    os.makedirs(os.path.join(self.base, "single"))
+    single = differ.utils.Differ(snapshots[0], snapshots[1],
+                                 base=os.path.join(self.base, "single"))
+    single.start()
+    assert single.changes.counts() == obj.differs[0].changes.counts()
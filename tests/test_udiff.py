@@ -0,0 +1,104 @@
+import os
+import sys
+import pytest
+import subprocess
+
+from context import differ, write
+
+class TestUdiff():
+  base = "/tmp/differ/"
+
+  @pytest.fixture(scope='function', autouse=True)
+  def setup(self):
+    """This function will be run before every test function in this class"""
+    print("Running setup function")
+    if os.path.exists(self.base):
+      os.system("rm -rf {}".format(self.base))
+    os.mkdir(self.base)
+
+  def udiff(self, path1, path2, low_memory=None):
+    output = os.path.join(self.base, "output")
+    with open(output, 'wb') as fp:
+      differ.udiff.unified_diff(path1, path2, fp, low_memory=low_memory)
+    with open(output, 'rb') as fp:
+      return fp.read()
+
+  def test_format_range(self):
+    assert differ.udiff.format_range(0, 1) == "1"
+    assert differ.udiff.format_range(0, 3) == "1,3"
+    assert differ.udiff.format_range(3, 3) == "3,0"
+
+  def test_same_as_diff(self):
+    lines = ["line {}\n".format(i) for i in range(40)]
+    changed = list(lines)
+    changed[2] = "changed\n"
+    changed[30:32] = ["new\n"]
+    cases = [
+      ("a\nb\nc\n", "a\nB\nc"),
+      ("".join(lines), "".join(changed)),
+      ("", "a\n"),
+      ("a\n", ""),
+      ("\0abc", "\0abd"),
+    ]
+    for content1, content2 in cases:
+      path1 = write(self.base, "one", content1)
+      path2 = write(self.base, "two", content2)
+      proc = subprocess.Popen(["diff", "-Naur", path1, path2],
+                              stdout=subprocess.PIPE)
+      expected = proc.communicate()[0]
+      for low_memory in [False, True]:
+        result = self.udiff(path1, path2, low_memory)
+        # The timestamps of the header are not compared
+        assert result.split("\n")[2:] == expected.split("\n")[2:]
+        assert result.startswith("--- {}\t".format(path1))
+
+  def test_missing_and_same(self):
+    path1 = write(self.base, "one", "a\n")
+    assert self.udiff(path1, path1) == ""
+    result = self.udiff(path1, os.path.join(self.base, "missing"))
+    assert "1970-01-01" in result or "1969-12-31" in result
+    assert "@@ -1 +0,0 @@\n-a\n" in result
+
+  def test_match_lines(self):
+    """The matching blocks are a longest common subsequence"""
+    import random
+    rand = random.Random(1)
+    for _ in range(500):
+      keys1 = [rand.choice("abcd") for _ in range(rand.randint(0, 10))]
+      keys2 = [rand.choice("abcde") for _ in range(rand.randint(0, 10))]
+      blocks = differ.udiff.match_lines(keys1, keys2)
+      assert blocks[-1] == (len(keys1), len(keys2), 0)
+      for i, j, size in blocks:
+        assert keys1[i:i + size] == keys2[j:j + size]
+      lengths = [[0] * (len(keys2) + 1) for _ in range(len(keys1) + 1)]
+      for i in range(len(keys1) - 1, -1, -1):
+        for j in range(len(keys2) - 1, -1, -1):
+          if keys1[i] == keys2[j]:
+            lengths[i][j] = lengths[i + 1][j + 1] + 1
+          else:
+            lengths[i][j] = max(lengths[i + 1][j], lengths[i][j + 1])
+      assert sum(size for i, j, size in blocks) == lengths[0][0]
+
+    # Past the edit cost the rest is a single change
+    blocks = differ.udiff.match_lines(list("abcdef"), list("fedcba"), 1)
+    for i, j, size in blocks:
+      assert "abcdef"[i:i + size] == "fedcba"[j:j + size]
+
+  def test_repeated_lines(self):
+    """Files with many lines that are the same are diffed quickly"""
+    import time
+    lines = ["line {}\n".format(i) if i % 3 else "\n" for i in range(20000)]
+    changed = list(lines)
+    for i in range(0, 20000, 97):
+      changed[i] = "changed {}\n".format(i)
+    del changed[5000:5010]
+    path1 = write(self.base, "one", "".join(lines))
+    path2 = write(self.base, "two", "".join(changed))
+    start = time.time()
+    result = self.udiff(path1, path2)
+    assert time.time() - start < 5
+    # The diff turns the first file into the second one
+    patch_path = write(self.base, "patch", result)
+    assert os.system("patch -s {} {}".format(path1, patch_path)) == 0
+    with open(path1) as fp:
+      assert fp.read() == "".join(changed)
@@ -14,3 +14,18 @@ def test_get_file_type():
   """Test get_file_type"""
   assert differ.utils.get_file_type(None) == None
   assert differ.utils.get_file_type("Doesn't exist") == None
+
+def test_get_mode_type():
+  """Test get_mode_type"""
+  import stat
+  assert differ.paths.get_mode_type(stat.S_IFREG | 0644) == 'regular'
+  assert differ.paths.get_mode_type(stat.S_IFSOCK | 0644) == 'socket'
+  assert differ.paths.get_mode_type(stat.S_IFLNK | 0777) == 'symlink'
+  assert differ.paths.get_mode_type(0) == None
+
+def test_run_concurrently():
+  """Test running calls in their own threads"""
+  results = differ.utils.run_concurrently((max, 1, 2), (min, 1, 2))
+  assert results == [2, 1]
+  with pytest.raises(ZeroDivisionError):
+    differ.utils.run_concurrently((max, 1, 2), (lambda: 1 / 0,))